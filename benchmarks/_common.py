@@ -0,0 +1,45 @@
+"""
+Shared helpers for the Phin AI Assistant benchmarks
+"""
+import os
+import sys
+
+# Make the app modules importable and satisfy config's API key check offline
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('GROQ_API_KEY', 'gsk_benchmark_fake_key')
+# The fake Groq server has no limits to stay under; bench_rate_limiter sets up its own limiter
+os.environ.setdefault('PHIN_RATE_LIMIT', '0')
+
+def percentile(values, pct):
+    """Get the pct-th percentile of values (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(values):
+    """Get p50/p95/p99/max of a list of timings"""
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else 0.0
+    }
+
+def print_table(headers, rows):
+    """Print rows as a fixed-width table"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(c).ljust(w) for c, w in zip(row, widths)))
+
+def use_scratch_dir():
+    """Run from a temporary directory so benchmarks never touch real chat or memory files"""
+    import tempfile
+    scratch = tempfile.mkdtemp(prefix="phin-bench-")
+    os.chdir(scratch)
+    return scratch
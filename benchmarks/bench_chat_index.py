@@ -0,0 +1,70 @@
+"""
+Sidebar chat listing cost vs. number of saved chats
+
+Compares the old directory listing (os.listdir + sort on every rerun) with a
+page from the chat index, both freshly queried and served from its cache.
+
+Usage:
+    python benchmarks/bench_chat_index.py --chats 1000 10000 50000
+"""
+import argparse
+import os
+import time
+from _common import summarize, print_table, use_scratch_dir
+
+def time_calls(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)["p50"] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    from chat_index import ChatIndex
+    from config import CHAT_PAGE_SIZE
+
+    rows = []
+    for total in args.chats:
+        directory = f"chats-{total}"
+        os.makedirs(directory)
+        index = ChatIndex(os.path.join(directory, "index.db"))
+        messages = [{"role": "user", "content": "How do I profile a Streamlit app?"}]
+        with index.connection() as db:
+            for i in range(total):
+                chat_id = f"20250101_{i:06d}_abcdef"
+                open(os.path.join(directory, chat_id + ".jsonl"), "w").close()
+                db.execute(
+                    "INSERT INTO chats (chat_id, title, created_at, updated_at, message_count, size_bytes) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (chat_id, f"Chat {i}", f"2025-01-01T00:{i:09d}", f"2025-01-01T00:{i:09d}", 2, 512)
+                )
+        index.invalidate()
+
+        def listdir():
+            return sorted((f for f in os.listdir(directory) if f.endswith(".jsonl")), reverse=True)[:CHAT_PAGE_SIZE]
+
+        def fresh_page():
+            index.invalidate()
+            return index.list_chats(0, CHAT_PAGE_SIZE)
+
+        def cached_page():
+            return index.list_chats(0, CHAT_PAGE_SIZE)
+
+        rows.append([
+            f"{total:,}",
+            f"{time_calls(listdir, args.repeat):.3f} ms",
+            f"{time_calls(fresh_page, args.repeat):.3f} ms",
+            f"{time_calls(cached_page, args.repeat):.3f} ms",
+        ])
+
+    print_table(["chats", "listdir + sort", "index page", "cached page"], rows)
+
+if __name__ == "__main__":
+    main()
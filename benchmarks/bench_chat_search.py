@@ -0,0 +1,63 @@
+"""
+Full-text chat search latency
+
+Indexes a synthetic history (through ChatIndex.record_save, as saves do) and
+times ranked searches with snippets.
+
+Usage:
+    python benchmarks/bench_chat_search.py --chats 2000 --messages-per-chat 50
+"""
+import argparse
+import random
+import time
+from _common import summarize, print_table, use_scratch_dir
+
+VOCABULARY = (
+    "python stream token budget window memory cache latency profile sqlite index query "
+    "thread async groq model prompt summary chat search upload file chunk retrieval render "
+    "sidebar widget rerun session deploy docker heroku railway benchmark metric trace"
+).split()
+QUERIES = ["sqlite index", "groq latency", "deploy docker", "rerun widget sidebar", "summ", "nonexistentword"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--messages-per-chat", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    from chat_index import ChatIndex
+
+    rng = random.Random(5)
+    index = ChatIndex("index.db")
+    start = time.perf_counter()
+    for chat in range(args.chats):
+        messages = [
+            {"role": "user" if i % 2 == 0 else "assistant",
+             "content": " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(10, 80)))}
+            for i in range(args.messages_per_chat)
+        ]
+        index.record_save(f"20250101_{chat:06d}_abcdef", messages, 0)
+    build_time = time.perf_counter() - start
+    total = args.chats * args.messages_per_chat
+
+    rows = []
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            results = index.search(query, 20)
+            timings.append(time.perf_counter() - begin)
+        stats = summarize(timings)
+        rows.append([query, len(results), f"{stats['p50'] * 1000:.2f} ms", f"{stats['p95'] * 1000:.2f} ms"])
+
+    print(f"indexed {total:,} messages in {build_time:.1f} s ({'FTS5' if index.has_fts else 'LIKE fallback'})\n")
+    print_table(["query", "results", "p50", "p95"], rows)
+
+    start = time.perf_counter()
+    index.record_save("20250101_000000_abcdef", [{"role": "user", "content": "replaced"}], 0)
+    print(f"\nreplace one chat's text: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
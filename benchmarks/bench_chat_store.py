@@ -0,0 +1,78 @@
+"""
+Chat history save cost vs. conversation length
+
+Replays a conversation, saving after every assistant reply the way
+auto_save_chat does, and compares the old whole-file JSON snapshot per save
+with the append-only chat log.
+
+Usage:
+    python benchmarks/bench_chat_store.py --turns 200 --reply-words 150
+"""
+import argparse
+import json
+import os
+import random
+import time
+from _common import print_table, use_scratch_dir
+
+def legacy_save(directory, messages, ratings, save_index):
+    """The previous save_chat_history: a new full JSON file on every save"""
+    os.makedirs(directory, exist_ok=True)
+    payload = json.dumps({'messages': messages, 'ratings': ratings, 'timestamp': save_index}, indent=2)
+    with open(os.path.join(directory, f"chat_{save_index:06d}.json"), 'w') as f:
+        f.write(payload)
+    return len(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--reply-words", type=int, default=150)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    from chat_store import ChatStore
+
+    rng = random.Random(3)
+    words = "the model answer code python function data memory stream token budget window".split()
+    store = ChatStore(directory="store", legacy_dirs=[])
+    messages = []
+    checkpoints = sorted({max(1, args.turns * pct // 100) for pct in (5, 25, 50, 75, 100)})
+    totals = {"legacy": [0, 0.0], "store": [0, 0.0]}
+    rows = []
+    for turn in range(1, args.turns + 1):
+        messages.append({"role": "user", "content": " ".join(rng.choice(words) for _ in range(20))})
+        messages.append({"role": "assistant", "content": " ".join(rng.choice(words) for _ in range(args.reply_words))})
+
+        start = time.perf_counter()
+        legacy_bytes = legacy_save("legacy", messages, {}, turn)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        store_bytes = store.save("chat", messages, {})
+        store_time = time.perf_counter() - start
+
+        totals["legacy"][0] += legacy_bytes
+        totals["legacy"][1] += legacy_time
+        totals["store"][0] += store_bytes
+        totals["store"][1] += store_time
+        if turn in checkpoints:
+            rows.append([
+                turn, f"{legacy_time * 1000:.3f} ms", f"{legacy_bytes:,}",
+                f"{store_time * 1000:.3f} ms", f"{store_bytes:,}"
+            ])
+
+    print_table(["turns", "legacy save", "legacy bytes", "log save", "log bytes"], rows)
+    print()
+    start = time.perf_counter()
+    loaded, _ = store.load("chat")
+    load_time = time.perf_counter() - start
+    print_table(["total", "legacy", "append log"], [
+        ["bytes written", f"{totals['legacy'][0]:,}", f"{totals['store'][0]:,}"],
+        ["save time", f"{totals['legacy'][1] * 1000:.1f} ms", f"{totals['store'][1] * 1000:.1f} ms"],
+        ["files on disk", len(os.listdir("legacy")), len(os.listdir("store"))],
+        ["bytes on disk", f"{sum(os.path.getsize(os.path.join('legacy', f)) for f in os.listdir('legacy')):,}",
+         f"{os.path.getsize(store.path('chat')):,}"],
+    ])
+    print(f"\nlog load: {len(loaded)} messages in {load_time * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Reasoning-stripping benchmark on large reasoning-model outputs
+
+Compares the single-pass ThinkTagStripper-based clean_response with the
+previous find/slice loop, on whole responses and as a stream of deltas.
+
+Usage:
+    python benchmarks/bench_clean_response.py --size-mb 4 --blocks 5000
+"""
+import argparse
+import random
+import re
+import time
+from _common import summarize, print_table
+
+WORDS = "the model answer code python function data memory stream token budget window".split()
+
+def legacy_clean_response(response):
+    """clean_response as it was before the single-pass stripper"""
+    while "<think>" in response and "</think>" in response:
+        start = response.find("<think>")
+        end = response.find("</think>") + len("</think>")
+        response = response[:start] + response[end:]
+    response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+    response = re.sub(r'\*\*thinking\*\*.*?\*\*end thinking\*\*', '', response, flags=re.DOTALL | re.IGNORECASE)
+    response = re.sub(r'\n\s*\n\s*\n', '\n\n', response)
+    return response.strip()
+
+def make_response(size, blocks, rng):
+    """Build about size characters of answer text with blocks <think> sections spread through it"""
+    pieces = []
+    block_size = size // (2 * blocks)
+    for _ in range(blocks):
+        thought = " ".join(rng.choice(WORDS) for _ in range(block_size // 6))
+        answer = " ".join(rng.choice(WORDS) for _ in range(block_size // 6))
+        pieces.append(f"<think>{thought}</think>\n\n{answer}\n\n\n")
+    return "".join(pieces)
+
+def time_runs(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--blocks", type=int, default=5000)
+    parser.add_argument("--delta-chars", type=int, default=16, help="Characters per streamed delta")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    from utils import clean_response, collapse_blank_lines, ThinkTagStripper
+
+    rng = random.Random(7)
+    response = make_response(int(args.size_mb * 1024 * 1024), args.blocks, rng)
+    deltas = [response[i:i + args.delta_chars] for i in range(0, len(response), args.delta_chars)]
+
+    def stream():
+        stripper = ThinkTagStripper(keep_reasoning=True)
+        visible = [stripper.feed(delta) for delta in deltas]
+        visible.append(stripper.flush())
+        return collapse_blank_lines("".join(visible)), stripper.reasoning_text()
+
+    expected = legacy_clean_response(response)
+    if clean_response(response) != expected or stream()[0] != expected:
+        raise SystemExit("clean_response output differs from the previous implementation")
+
+    rows = []
+    for label, fn in [
+        ("legacy clean_response", lambda: legacy_clean_response(response)),
+        ("clean_response", lambda: clean_response(response)),
+        (f"stream ({len(deltas):,} deltas, keeping reasoning)", stream),
+    ]:
+        stats = time_runs(fn, args.runs)
+        rows.append([label, f"{stats['p50'] * 1000:.1f} ms", f"{stats['max'] * 1000:.1f} ms"])
+
+    print(f"{len(response) / 1024 / 1024:.1f} MB response, {args.blocks:,} think blocks")
+    print_table(["implementation", "p50", "max"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Load benchmark: concurrent chat sessions per process, before/after the async Groq layer
+
+"before" replays the old pipeline: a sync groq.Groq client called from each
+session's script thread, with web search run serially before the LLM call.
+"after" uses groq_client (shared AsyncGroq pool) and chat_handler.gather_context.
+
+Usage:
+    python benchmarks/bench_concurrency.py --sessions 1 16 64 128
+"""
+import argparse
+import os
+import threading
+import time
+from _common import summarize, print_table, use_scratch_dir
+from fake_groq import start_server_process, fetch_stats
+
+def run_sessions(turn, sessions):
+    """Run one turn per session concurrently and collect latencies"""
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        start = time.perf_counter()
+        turn()
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 16, 64, 128])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--search-delay", type=float, default=0.3)
+    args = parser.parse_args()
+
+    server, base_url = start_server_process(args.latency, args.tokens_per_second, args.response_tokens)
+    os.environ['GROQ_BASE_URL'] = base_url
+    use_scratch_dir()
+
+    import groq
+    import chat_handler
+    import groq_client
+    from config import GROQ_API_KEY, GROQ_BASE_URL
+    from fake_search import FakeSearchBackend
+    from config import DEFAULT_SYSTEM_PROMPT
+    from file_index import FileIndex
+    from memory import get_conversation_memory
+    from prompt_builder import plan_budget
+    from search import search_service
+
+    backend = FakeSearchBackend(delay=args.search_delay)
+    memory = get_conversation_memory("benchmark-user")
+    messages = [{"role": "user", "content": "Benchmark prompt"}]
+    file_index = FileIndex()
+    plan = plan_budget("deepseek-r1-distill-llama-70b", 256, DEFAULT_SYSTEM_PROMPT, "Benchmark prompt")
+    sync_client = groq.Groq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
+
+    def before_turn():
+        backend.search("Benchmark prompt", 3)
+        stream = sync_client.chat.completions.create(
+            messages=messages, model="fake", temperature=0.7, max_tokens=256, stream=True
+        )
+        for _ in stream:
+            pass
+
+    def after_turn():
+        groq_client.run(chat_handler.gather_context("Benchmark prompt", memory, file_index, True, plan))
+        for _ in groq_client.stream_chat(messages, "fake", 0.7, 256):
+            pass
+
+    rows = []
+    for sessions in args.sessions:
+        for name, turn in (("before", before_turn), ("after", after_turn)):
+            # Fresh backend per run so the search cache doesn't flatter the "after" numbers
+            search_service.set_backend(backend)
+            fetch_stats(base_url, reset=True)
+            latencies, elapsed = run_sessions(turn, sessions)
+            stats = summarize(latencies)
+            rows.append([
+                name, sessions, f"{stats['p50']:.2f}s", f"{stats['p95']:.2f}s",
+                f"{sessions / elapsed:.1f}", fetch_stats(base_url)["peak_active_requests"]
+            ])
+    print_table(["pipeline", "sessions", "p50 turn", "p95 turn", "turns/s", "peak in-flight"], rows)
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of per-turn memory context cost with large memory stores
+
+Compares re-rendering the context every turn (the old behaviour) with the
+version-cached context, with and without a token budget, and with the prompt
+as a relevance query (as chat turns ask for it).
+
+Usage:
+    python benchmarks/bench_memory_context.py --preferences 5000 --context-keys 1000
+"""
+import argparse
+import os
+import time
+from _common import print_table, use_scratch_dir
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--preferences", type=int, default=5000)
+    parser.add_argument("--context-keys", type=int, default=1000)
+    parser.add_argument("--budget", type=int, default=512, help="token budget for the fitted context")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['PHIN_MEMORY_DB'] = os.path.join(use_scratch_dir(), "memory.db")
+    from memory import ConversationMemory
+
+    memory = ConversationMemory("benchmark-user")
+    with memory.lock:
+        for i in range(args.preferences):
+            memory.memory_data["user_preferences"][f"preference {i}"] = f"value number {i}"
+        for i in range(args.context_keys):
+            memory.memory_data["user_context"][f"context {i}"] = {"value": f"detail {i}", "timestamp": ""}
+    for i in range(100):
+        memory.add_important_fact(f"the user mentioned fact number {i}", "personal")
+    for i in range(50):
+        memory.add_conversation_topic(f"topic about subject {i}")
+
+    def uncached():
+        with memory.lock:
+            memory.render_memory_context()
+
+    rows = [
+        ["render every turn (old)", f"{time_per_call(uncached, args.repeat) * 1000:.3f} ms"],
+        ["cached, unchanged", f"{time_per_call(memory.get_memory_context, args.repeat) * 1e6:.2f} us"],
+        [f"cached, {args.budget}-token budget",
+         f"{time_per_call(lambda: memory.get_memory_context(args.budget), args.repeat) * 1e6:.2f} us"],
+        [f"with a query, {args.budget}-token budget",
+         f"{time_per_call(lambda: memory.get_memory_context(args.budget, 'fact number 7 subject'), args.repeat) * 1e6:.2f} us"],
+    ]
+
+    def mutate_then_render():
+        memory.add_user_preference("latest", time.time())
+        memory.get_memory_context(args.budget)
+
+    rows.append(["mutation + budgeted render",
+                 f"{time_per_call(mutate_then_render, max(1, args.repeat // 10)) * 1000:.3f} ms"])
+    print_table(["per-turn memory cost", "time"], rows)
+    print(f"\nFull context: {len(memory.get_memory_context()):,} chars; "
+          f"budgeted: {len(memory.get_memory_context(args.budget)):,} chars")
+
+if __name__ == "__main__":
+    main()
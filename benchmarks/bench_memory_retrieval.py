@@ -0,0 +1,73 @@
+"""
+Retrieval latency benchmark for relevance-ranked memory at 10k+ entries
+
+Usage:
+    python benchmarks/bench_memory_retrieval.py --entries 10000 50000
+"""
+import argparse
+import os
+import random
+import time
+from _common import summarize, print_table, use_scratch_dir
+
+WORDS = """
+python travel guitar cooking hiking budget project deadline family garden
+coffee marathon piano physics startup novel painting kubernetes database
+vacation apartment salary sister birthday allergy vegetarian spanish chess
+""".split()
+
+def random_sentence(rng, length=8):
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 500)) if rng.random() < 0.3 else rng.choice(WORDS)
+                    for _ in range(length))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=1024)
+    args = parser.parse_args()
+
+    os.environ['PHIN_MEMORY_DB'] = os.path.join(use_scratch_dir(), "memory.db")
+    from memory import ConversationMemory
+
+    rng = random.Random(42)
+    rows = []
+    for entries in args.entries:
+        memory = ConversationMemory(f"user-{entries}", max_topics=entries, max_facts=entries)
+        with memory.lock:
+            memory.memory_data["important_facts"] = [
+                {"fact": random_sentence(rng), "category": "personal", "timestamp": ""} for _ in range(entries)
+            ]
+            memory.memory_data["conversation_topics"] = [
+                {"topic": random_sentence(rng, 5), "context": "", "timestamp": ""} for _ in range(entries // 5)
+            ]
+
+        start = time.perf_counter()
+        with memory.lock:
+            memory.build_index()
+        build_time = time.perf_counter() - start
+
+        adds = []
+        for _ in range(200):
+            start = time.perf_counter()
+            memory.add_important_fact(random_sentence(rng), "personal")
+            adds.append(time.perf_counter() - start)
+
+        queries = []
+        for _ in range(args.queries):
+            prompt = f"what do you remember about {rng.choice(WORDS)} and {rng.choice(WORDS)}?"
+            start = time.perf_counter()
+            memory.get_memory_context(args.budget, query=prompt)
+            queries.append(time.perf_counter() - start)
+
+        add_stats = summarize(adds)
+        query_stats = summarize(queries)
+        rows.append([
+            f"{entries:,}", f"{build_time * 1000:.0f} ms",
+            f"{add_stats['p50'] * 1e6:.0f} us",
+            f"{query_stats['p50'] * 1000:.2f} ms", f"{query_stats['p95'] * 1000:.2f} ms"
+        ])
+    print_table(["facts", "index build", "add p50", "query p50", "query p95"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Concurrent writer benchmark for the per-user memory store
+
+Runs many sessions (threads) across several processes, each mutating its own
+user's memory, and reports mutation latency and flushed writes per second.
+
+Usage:
+    python benchmarks/bench_memory_store.py --processes 4 --sessions 32 --mutations 200
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from _common import summarize, print_table, use_scratch_dir
+
+def run_process(process_index, sessions, mutations, db_path, write_through, results):
+    os.environ['PHIN_MEMORY_DB'] = db_path
+    from memory import ConversationMemory, get_conversation_memory, get_memory_store
+
+    latencies = []
+    lock = threading.Lock()
+
+    def session(session_index):
+        user_id = f"user-{process_index}-{session_index}"
+        if write_through:
+            memory = ConversationMemory(user_id, get_memory_store(), write_behind=False)
+        else:
+            memory = get_conversation_memory(user_id)
+        local = []
+        for i in range(mutations):
+            start = time.perf_counter()
+            memory.add_important_fact(f"fact {i}", "benchmark")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    mutate_time = time.perf_counter() - start
+    flush_start = time.perf_counter()
+    get_memory_store().flush_all()
+    results.put((latencies, mutate_time, time.perf_counter() - flush_start))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=32, help="sessions per process")
+    parser.add_argument("--mutations", type=int, default=200, help="mutations per session")
+    parser.add_argument("--write-through", action="store_true", help="write every mutation to SQLite immediately")
+    args = parser.parse_args()
+
+    db_path = os.path.join(use_scratch_dir(), "memory.db")
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_process, args=(i, args.sessions, args.mutations, db_path, args.write_through, results))
+        for i in range(args.processes)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    stats = summarize(latencies)
+    total = len(latencies)
+    print_table(["metric", "value"], [
+        ["mode", "write-through" if args.write_through else "write-behind"],
+        ["processes x sessions", f"{args.processes} x {args.sessions}"],
+        ["mutations", total],
+        ["mutation p50", f"{stats['p50'] * 1e6:.1f} us"],
+        ["mutation p99", f"{stats['p99'] * 1e6:.1f} us"],
+        ["final flush (max)", f"{max(o[2] for o in outcomes) * 1000:.1f} ms"],
+        ["mutations/s", f"{total / elapsed:,.0f}"],
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+End-to-end chat pipeline benchmark with stored baselines
+
+Drives the app headless with Streamlit's AppTest against the local fake Groq
+server and fake search backend: chat turns through handle_chat_input and
+stream_response, ConversationMemory analysis and context assembly, chat
+saves and loads, and reruns of a long history. Reports latency percentiles,
+throughput, bytes sent to the browser and peak memory, and compares them
+with a stored baseline (benchmarks/baseline.json by default). Timings depend
+on the machine, so record a baseline on the machine you compare on.
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --save-baseline   # after an intended change
+    python benchmarks/bench_pipeline.py --turns 40 --tokens-per-second 400 --threshold 0.3
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from _common import ROOT_DIR, summarize, print_table, use_scratch_dir
+from fake_groq import start_server_process
+
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+# Changes smaller than this (by metric unit suffix) are noise, whatever their relative size
+NOISE_FLOOR = {"_ms": 2.0, "_mb": 8.0}
+TOPICS = "python streaming memory search budget tokens caching rendering history voice".split()
+
+def count_forward_bytes():
+    """Count the serialized size of every message the app sends towards the browser
+
+    AppTest keeps messages in a queue instead of sending them, so this counts
+    them as they're queued, before the server would coalesce unsent deltas.
+    """
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    counter = {"bytes": 0}
+    enqueue = ForwardMsgQueue.enqueue
+
+    def counting_enqueue(queue, msg):
+        counter["bytes"] += msg.ByteSize()
+        return enqueue(queue, msg)
+
+    ForwardMsgQueue.enqueue = counting_enqueue
+    return counter
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def new_app():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT_DIR, "phin_main.py"), default_timeout=120)
+    at.run()
+    return at
+
+def button_by_label(at, label):
+    return next(button for button in at.button if button.label == label)
+
+def make_messages(count):
+    reply = "Here is a detailed answer with **markdown**, a list:\n\n- one\n- two\n\nand some `code`. " * 4
+    return [
+        {"role": "user", "content": f"Question {i} about {TOPICS[i % len(TOPICS)]}?"} if i % 2 == 0
+        else {"role": "assistant", "content": reply}
+        for i in range(count)
+    ]
+
+def bench_chat(args, sent):
+    """Full chat turns: context assembly, streamed generation, memory and auto-save"""
+    from tracing import tracer
+    at = new_app()
+    model = at.session_state["selected_model"]
+    timings = []
+    sent_before = sent["bytes"]
+    start = time.perf_counter()
+    for i in range(args.turns):
+        # Distinct prompts so neither the search nor the response cache answers
+        prompt = f"Turn {i}: how does {TOPICS[i % len(TOPICS)]} work here? I like {TOPICS[(i + 3) % len(TOPICS)]}."
+        turn_start = time.perf_counter()
+        at.chat_input[0].set_value(prompt).run()
+        timings.append(time.perf_counter() - turn_start)
+        if at.exception:
+            raise SystemExit(f"Chat turn failed: {at.exception[0].value}")
+    elapsed = time.perf_counter() - start
+
+    turn = summarize(timings)
+    stages = tracer.summary(model)
+    metrics = {
+        "chat.turn_p50_ms": turn["p50"] * 1000,
+        "chat.turn_p95_ms": turn["p95"] * 1000,
+        "chat.turns_per_s": args.turns / elapsed,
+        "chat.bytes_per_turn": (sent["bytes"] - sent_before) / args.turns,
+    }
+    for stage in ("context", "first_token", "generation", "auto_save"):
+        values = stages.get((model, stage))
+        if values:
+            metrics[f"chat.{stage}_p50_ms"] = values["p50"] * 1000
+            metrics[f"chat.{stage}_p95_ms"] = values["p95"] * 1000
+    return metrics
+
+def bench_memory(args):
+    """ConversationMemory: analyzing each new turn and building the prompt context"""
+    from memory import get_conversation_memory
+    memory = get_conversation_memory("benchmark-memory-user")
+    messages = []
+    cursor = 0
+    analyze, context = [], []
+    for i in range(args.memory_turns):
+        topic = TOPICS[i % len(TOPICS)]
+        messages.append({"role": "user", "content": f"I like {topic} number {i}. My name is User{i % 7}."})
+        messages.append({"role": "assistant", "content": f"Noted, {topic} number {i}."})
+        start = time.perf_counter()
+        cursor = memory.analyze_and_store_conversation(messages, cursor)
+        analyze.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        memory.get_memory_context(1024, f"What about {topic}?")
+        context.append(time.perf_counter() - start)
+    analyze, context = summarize(analyze), summarize(context)
+    return {
+        "memory.analyze_p50_ms": analyze["p50"] * 1000,
+        "memory.analyze_p95_ms": analyze["p95"] * 1000,
+        "memory.context_p50_ms": context["p50"] * 1000,
+        "memory.context_p95_ms": context["p95"] * 1000,
+    }
+
+def bench_history(args):
+    """save_chat_history / load_chat_history through the sidebar buttons, on a long chat"""
+    from executor import background
+    at = new_app()
+    messages = make_messages(args.history_messages)
+    at.session_state["messages"] = messages
+    chat_id = at.session_state["chat_id"]
+    saves, loads = [], []
+    for i in range(args.repeat):
+        # Each round adds a turn, so saves append like they do in use
+        messages = messages + make_messages(2)
+        at.session_state["messages"] = messages
+        start = time.perf_counter()
+        button_by_label(at, "💾 Save Chat").click().run()
+        background.wait(("chat", chat_id))
+        saves.append(time.perf_counter() - start)
+        at.run()  # Refresh the sidebar list with the saved chat
+        start = time.perf_counter()
+        at.button(key=f"load_{chat_id}").click().run()
+        loads.append(time.perf_counter() - start)
+        if at.exception:
+            raise SystemExit(f"Save/load failed: {at.exception[0].value}")
+    saves, loads = summarize(saves), summarize(loads)
+    return {
+        "history.save_p50_ms": saves["p50"] * 1000,
+        "history.load_p50_ms": loads["p50"] * 1000,
+        "history.load_p95_ms": loads["p95"] * 1000,
+    }
+
+def bench_render(args, sent):
+    """Plain reruns (what every widget interaction costs) with a long history"""
+    at = new_app()
+    at.session_state["messages"] = make_messages(args.history_messages)
+    at.session_state["last_saved_count"] = args.history_messages
+    at.run()
+    timings = []
+    sent_before = sent["bytes"]
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    rerun = summarize(timings)
+    return {
+        "render.rerun_p50_ms": rerun["p50"] * 1000,
+        "render.rerun_p95_ms": rerun["p95"] * 1000,
+        "render.bytes_per_rerun": (sent["bytes"] - sent_before) / args.repeat,
+    }
+
+def is_regression(name, value, old, threshold):
+    if not old:
+        return False
+    floor = next((floor for suffix, floor in NOISE_FLOOR.items() if name.endswith(suffix)), 0.0)
+    if abs(value - old) <= floor:
+        return False
+    if name.endswith("_per_s"):
+        return value < old * (1 - threshold)
+    return value > old * (1 + threshold)
+
+def compare(metrics, baseline, threshold):
+    """Print metrics next to the baseline; returns the names of regressed metrics"""
+    rows, regressions = [], []
+    for name, value in metrics.items():
+        old = baseline.get(name)
+        if old is None:
+            rows.append([name, f"{value:,.2f}", "-", "new"])
+            continue
+        change = (value - old) / old * 100 if old else 0.0
+        flag = ""
+        if is_regression(name, value, old, threshold):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        rows.append([name, f"{value:,.2f}", f"{old:,.2f}", f"{change:+.1f}%{flag}"])
+    print_table(["metric", "now", "baseline", "change"], rows)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20, help="chat turns to run")
+    parser.add_argument("--memory-turns", type=int, default=200)
+    parser.add_argument("--history-messages", type=int, default=400, help="length of the chat saved, loaded and rerun")
+    parser.add_argument("--repeat", type=int, default=10, help="saves/loads and reruns to time")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Groq seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--reasoning-tokens", type=int, default=40)
+    parser.add_argument("--search-delay", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.5, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    settings = {
+        name: getattr(args, name) for name in (
+            "turns", "memory_turns", "history_messages", "repeat", "latency",
+            "tokens_per_second", "response_tokens", "reasoning_tokens", "search_delay"
+        )
+    }
+    server, base_url = start_server_process(
+        args.latency, args.tokens_per_second, args.response_tokens, args.port, args.reasoning_tokens
+    )
+    os.environ['GROQ_BASE_URL'] = base_url
+    use_scratch_dir()
+    try:
+        from fake_search import FakeSearchBackend
+        from search import search_service
+        search_service.set_backend(FakeSearchBackend(delay=args.search_delay))
+        sent = count_forward_bytes()
+
+        metrics = {}
+        metrics.update(bench_chat(args, sent))
+        metrics.update(bench_memory(args))
+        metrics.update(bench_history(args))
+        metrics.update(bench_render(args, sent))
+        metrics["process.peak_rss_mb"] = peak_rss_mb()
+    finally:
+        server.terminate()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = []
+    if baseline and not args.save_baseline:
+        if baseline.get("settings") != settings:
+            print(f"Note: {args.baseline} was recorded with different settings: {baseline.get('settings')}")
+        regressions = compare(metrics, baseline["metrics"], args.threshold)
+    else:
+        print_table(["metric", "value"], [[name, f"{value:,.2f}"] for name, value in metrics.items()])
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "python": sys.version.split()[0], "metrics": metrics}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Prompt assembly benchmark on long chat histories
+
+Usage:
+    python benchmarks/bench_prompt_builder.py --messages 1000 --model llama3-groq-8b-8192-tool-use-preview
+"""
+import argparse
+import io
+import random
+import time
+from _common import summarize, print_table
+
+WORDS = "the model answer code python function data memory stream token budget window".split()
+
+def make_history(count, rng):
+    words = WORDS
+    history = []
+    for i in range(count):
+        length = rng.randint(20, 60) if i % 2 == 0 else rng.randint(100, 400)
+        history.append({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(rng.choice(words) for _ in range(length))
+        })
+    return history
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--model", default="deepseek-r1-distill-llama-70b")
+    parser.add_argument("--max-tokens", type=int, default=2048)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    from config import DEFAULT_SYSTEM_PROMPT
+    from prompt_builder import plan_budget, build_messages, count_tokens, message_tokens
+    from file_index import FileIndex
+
+    rng = random.Random(7)
+    history = make_history(args.messages, rng)
+    notes = "\n\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(60)) for _ in range(2000)
+    )
+    file_index = FileIndex()
+    file_index.add_file("notes.txt", io.BytesIO(notes.encode()))
+    prompt = "Summarize what we discussed about the token budget."
+
+    from prompt_builder import format_file_context
+
+    def turn():
+        plan = plan_budget(args.model, args.max_tokens, DEFAULT_SYSTEM_PROMPT, prompt)
+        context = format_file_context(file_index.retrieve(prompt, plan["files"] - 64), plan["files"])
+        return build_messages(DEFAULT_SYSTEM_PROMPT, history, prompt, plan, context)
+
+    count_tokens.cache_clear()
+    start = time.perf_counter()
+    messages, first_index = turn()
+    cold = time.perf_counter() - start
+
+    timings = []
+    for _ in range(args.turns):
+        start = time.perf_counter()
+        turn()
+        timings.append(time.perf_counter() - start)
+    warm = summarize(timings)
+
+    prompt_tokens = sum(message_tokens(m) for m in messages)
+    print_table(["metric", "value"], [
+        ["history messages", f"{args.messages:,}"],
+        ["model", args.model],
+        ["messages sent", f"{len(messages)} (history from #{first_index})"],
+        ["estimated prompt tokens", f"{prompt_tokens:,}"],
+        ["budget", f"{plan_budget(args.model, args.max_tokens, DEFAULT_SYSTEM_PROMPT, prompt)['total']:,}"],
+        ["cold build", f"{cold * 1000:.2f} ms"],
+        ["warm build p50", f"{warm['p50'] * 1000:.3f} ms"],
+        ["warm build p95", f"{warm['p95'] * 1000:.3f} ms"],
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Client-side rate limiting under a burst from many sessions
+
+A few heavy sessions each fire a burst of requests at once, and a light
+session sends a single request just after, against a fake Groq server that
+answers 429 past its request rate limit. Compares sending straight through,
+rate_limiter.RateLimiter with one first-come queue, and the limiter's
+round-robin queue across sessions, with and without a tight deadline.
+Reports requests served, 429s from the server, requests turned away by the
+limiter, and how long the light session waited for its answer.
+
+Usage:
+    python benchmarks/bench_rate_limiter.py --heavy-sessions 5 --burst 8 --limit 10
+"""
+import argparse
+import asyncio
+import os
+import time
+from _common import summarize, print_table, use_scratch_dir
+from fake_groq import start_server_process
+
+MODEL = "bench-model"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-sessions", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=8, help="requests each heavy session sends at once")
+    parser.add_argument("--limit", type=int, default=10, help="requests the server allows per second")
+    parser.add_argument("--deadline", type=float, default=10.0, help="seconds a request may wait in the limiter")
+    parser.add_argument("--tight-deadline", type=float, default=1.5)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    server, base_url = start_server_process(
+        latency=0.05, tokens_per_second=2000, response_tokens=20, port=args.port, rate_limit=(args.limit, 1.0)
+    )
+    os.environ['GROQ_BASE_URL'] = base_url
+    use_scratch_dir()
+    try:
+        import groq_client
+        from rate_limiter import RateLimiter, Overloaded
+
+        messages = [{"role": "user", "content": "Benchmark prompt"}]
+
+        async def request(limiter, session):
+            """Send one request through limiter; returns (outcome, seconds)"""
+            start = time.perf_counter()
+            try:
+                permit = await limiter.acquire(MODEL, 64, session)
+            except Overloaded:
+                return "shed", time.perf_counter() - start
+            try:
+                await groq_client.get_client().chat.completions.create(
+                    messages=messages, model=MODEL, max_tokens=64
+                )
+                permit.settle()
+                return "ok", time.perf_counter() - start
+            except Exception as e:
+                permit.settle(0)
+                return ("429" if getattr(e, "status_code", None) == 429 else "error"), time.perf_counter() - start
+
+        async def burst(limiter, fair):
+            heavy = [
+                request(limiter, f"heavy-{session}" if fair else None)
+                for session in range(args.heavy_sessions) for _ in range(args.burst)
+            ]
+            heavy = [asyncio.ensure_future(task) for task in heavy]
+            await asyncio.sleep(0.05)
+            light = await request(limiter, "light" if fair else None)
+            return await asyncio.gather(*heavy), light
+
+        rows = []
+        for label, limiter, fair in (
+            ("no limiter", RateLimiter(enabled=False), False),
+            ("limiter, one queue", RateLimiter(True, args.limit, 10 ** 9, {}, "", args.deadline, period=1.0), False),
+            ("limiter, per-session queues", RateLimiter(True, args.limit, 10 ** 9, {}, "", args.deadline, period=1.0), True),
+            (f"per-session queues, {args.tight_deadline:g}s deadline",
+             RateLimiter(True, args.limit, 10 ** 9, {}, "", args.tight_deadline, period=1.0), True),
+        ):
+            time.sleep(1.5)  # Let the server's allowance refill between runs
+            heavy, light = groq_client.run(burst(limiter, fair))
+            outcomes = [outcome for outcome, _ in heavy] + [light[0]]
+            served = summarize([seconds for outcome, seconds in heavy if outcome == "ok"])
+            rows.append([
+                label, outcomes.count("ok"), outcomes.count("429"), outcomes.count("shed"),
+                f"{light[0]} in {light[1] * 1000:.0f} ms", f"{served['p95'] * 1000:.0f} ms"
+            ])
+        print(f"{args.heavy_sessions} sessions x {args.burst} requests, then 1 light request; server allows {args.limit}/s")
+        print_table(["mode", "served", "429s", "turned away", "light session", "heavy p95 (served)"], rows)
+    finally:
+        server.terminate()
+
+if __name__ == "__main__":
+    main()
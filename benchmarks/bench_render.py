@@ -0,0 +1,56 @@
+"""
+Rerun time vs. chat history length
+
+Runs the app headless with Streamlit's AppTest, preloads a conversation and
+times plain reruns (what every widget interaction costs) with the default
+render window and with every message rendered.
+
+Usage:
+    python benchmarks/bench_render.py --lengths 20 200 1000 --reruns 10
+"""
+import argparse
+import os
+import time
+from _common import ROOT_DIR, summarize, print_table, use_scratch_dir
+
+def make_messages(count):
+    reply = "Here is a detailed answer with **markdown**, a list:\n\n- one\n- two\n\nand some `code`. " * 4
+    return [
+        {"role": "user", "content": f"Question {i}?"} if i % 2 == 0 else {"role": "assistant", "content": reply}
+        for i in range(count)
+    ]
+
+def time_reruns(messages, render_window, reruns):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT_DIR, "phin_main.py"), default_timeout=120)
+    at.run()
+    at.session_state["messages"] = messages
+    at.session_state["last_saved_count"] = len(messages)
+    if render_window is not None:
+        at.session_state["render_window"] = render_window
+    at.run()
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    assert not at.exception, at.exception
+    return summarize(timings)["p50"] * 1000, len(at.chat_message)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[20, 200, 1000])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    rows = []
+    for length in args.lengths:
+        messages = make_messages(length)
+        windowed, shown = time_reruns(messages, None, args.reruns)
+        full, _ = time_reruns(messages, length, args.reruns)
+        rows.append([f"{length:,}", shown, f"{windowed:.1f} ms", f"{full:.1f} ms"])
+    print_table(["messages", "rendered", "windowed rerun p50", "render all p50"], rows)
+
+if __name__ == "__main__":
+    main()
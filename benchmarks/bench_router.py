@@ -0,0 +1,96 @@
+"""
+Model routing under injected failures
+
+Runs streamed requests through router.Router against the fake Groq server,
+whose models fail in Groq's ways: retired (404), decommissioned (400), rate
+limited (429), flaky (503 on a fraction of requests) and slow to first token.
+Each scenario is run with fallback and hedging, and with a single attempt on
+the chosen model (how requests worked before the router), reporting success
+rate, latency and how many requests reached the server.
+
+Usage:
+    python benchmarks/bench_router.py --requests 40 --flaky-rate 0.3 --slow-delay 3
+"""
+import argparse
+import os
+import time
+from _common import summarize, print_table, use_scratch_dir
+from fake_groq import start_server_process, fetch_stats
+
+HEALTHY = "healthy-model"
+SCENARIOS = [
+    ("retired (404)", "retired-model"),
+    ("decommissioned (400)", "decommissioned-model"),
+    ("rate limited (429)", "limited-model"),
+    ("flaky (503)", "flaky-model"),
+    ("slow first token", "slow-model"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--flaky-rate", type=float, default=0.3)
+    parser.add_argument("--slow-delay", type=float, default=3.0, help="extra seconds before the slow model's first token")
+    parser.add_argument("--hedge-delay", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    server, base_url = start_server_process(
+        latency=0.05, tokens_per_second=2000, response_tokens=20, port=args.port,
+        fail_models={
+            "retired-model": 404, "decommissioned-model": 400, "limited-model": 429,
+            "flaky-model": (503, args.flaky_rate)
+        },
+        slow_models={"slow-model": args.slow_delay}
+    )
+    os.environ['GROQ_BASE_URL'] = base_url
+    use_scratch_dir()
+    try:
+        import groq_client
+        from router import Router
+
+        messages = [{"role": "user", "content": "Benchmark prompt"}]
+
+        def request(router, models):
+            """Stream one reply to the end; returns whether it succeeded"""
+            async def go():
+                _, opened = await router.run(
+                    models, lambda model, admitted: groq_client.open_stream(messages, model, 0.7, 64, admitted=admitted),
+                    streaming=True, discard=groq_client.close_stream
+                )
+                try:
+                    async for _ in opened[1]:
+                        pass
+                finally:
+                    await groq_client.close_stream(opened)
+            try:
+                groq_client.run(go())
+                return True
+            except Exception:
+                return False
+
+        rows = []
+        for label, model in SCENARIOS:
+            for mode, router in (
+                ("single attempt", Router(fallback_models=[], max_attempts=1, hedge_delay=0)),
+                ("router", Router(fallback_models=[HEALTHY], hedge_delay=args.hedge_delay)),
+            ):
+                before = fetch_stats(base_url)["requests"]
+                timings, successes = [], 0
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    successes += request(router, router.plan(model, "Benchmark prompt"))
+                    timings.append(time.perf_counter() - start)
+                sent = fetch_stats(base_url)["requests"] - before
+                latency = summarize(timings)
+                rows.append([
+                    label, mode, f"{successes / args.requests:.0%}",
+                    f"{latency['p50'] * 1000:.0f} ms", f"{latency['p95'] * 1000:.0f} ms",
+                    f"{sent / args.requests:.2f}"
+                ])
+        print_table(["scenario", "mode", "success", "p50", "p95", "server requests/turn"], rows)
+    finally:
+        server.terminate()
+
+if __name__ == "__main__":
+    main()
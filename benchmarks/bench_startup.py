@@ -0,0 +1,95 @@
+"""
+Cold-start import time and memory for the app
+
+Imports phin_main in fresh interpreters and reports the median import time
+and peak RSS, optionally failing when they exceed a limit (for CI). With
+--report, prints a python -X importtime breakdown of the slowest modules.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5 --max-import-ms 600 --max-rss-mb 150
+    python benchmarks/bench_startup.py --report --top 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from _common import ROOT_DIR, print_table
+
+MEASURE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import phin_main
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import_ms": elapsed * 1000, "rss_mb": rss_kb / 1024,
+                  "modules": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+# Optional or heavy packages that should not be imported at startup
+DEFERRED_MODULES = ["groq", "speech_recognition", "pyttsx3", "pyperclip", "deep_translator",
+                    "duckduckgo_search", "PyPDF2", "docx"]
+
+def run_python(args):
+    env = dict(os.environ)
+    env.setdefault("GROQ_API_KEY", "gsk_benchmark_fake_key")
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+
+def measure():
+    result = run_python(["-c", MEASURE])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def importtime_report(top):
+    """Parse -X importtime output into (cumulative ms, self ms, module) rows"""
+    result = run_python(["-X", "importtime", "-c", "import phin_main"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, module.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--report", action="store_true", help="print an import time breakdown")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-rss-mb", type=float)
+    args = parser.parse_args()
+
+    if args.report:
+        print_table(["cumulative", "self", "module"], [
+            [f"{cumulative:.1f} ms", f"{own:.1f} ms", module]
+            for cumulative, own, module in importtime_report(args.top)
+        ])
+        print()
+
+    samples = [measure() for _ in range(args.runs)]
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    rss_mb = statistics.median(sample["rss_mb"] for sample in samples)
+    eager = [module for module in DEFERRED_MODULES if module in samples[0]["modules"]]
+    print_table(["metric", "value"], [
+        ["import phin_main (median)", f"{import_ms:.1f} ms"],
+        ["peak RSS (median)", f"{rss_mb:.1f} MB"],
+        ["deferred modules imported eagerly", ", ".join(eager) or "none"],
+    ])
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.1f} ms exceeds {args.max_import_ms} ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb} MB")
+    if eager:
+        failures.append(f"imported at startup: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Local fake Groq endpoint for tests and benchmarks
+Serves the OpenAI-compatible chat completions route Groq's SDK calls, with
+configurable latency and token rate, over keep-alive HTTP/1.1, and can inject
+Groq-style failures per model or at random and enforce a request rate limit
+
+Usage:
+    python benchmarks/fake_groq.py --port 8765 --latency 0.2 --tokens-per-second 200
+    python benchmarks/fake_groq.py --fail-model gemma-7b-it=404 --fail-model llama-3.1-8b-instant=503@0.3 \
+        --slow-model llama-3.1-70b-versatile=5
+    python benchmarks/fake_groq.py --rate-limit 30/60
+    GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run phin_main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+CHAT_PATH = "/openai/v1/chat/completions"
+# Error code and message Groq sends for each injectable status
+ERRORS = {
+    400: ("model_decommissioned", "The model `{model}` has been decommissioned and is no longer supported."),
+    404: ("model_not_found", "The model `{model}` does not exist or you do not have access to it."),
+    429: ("rate_limit_exceeded", "Rate limit reached for model `{model}`. Please try again in 1s."),
+    500: ("internal_server_error", "Internal Server Error"),
+    503: ("service_unavailable", "Service Unavailable"),
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class FakeGroqServer:
+    """Asyncio HTTP server that imitates Groq chat completions"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens_per_second=500.0,
+                 response_tokens=60, reply=None, reasoning_tokens=0, fail_models=None,
+                 failure_rate=0.0, failure_status=503, slow_models=None, seed=None, rate_limit=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.reply = reply
+        self.reasoning_tokens = reasoning_tokens  # Length of a <think> block sent first, like reasoning models
+        self.fail_models = fail_models or {}  # model -> status, or (status, fraction of its requests to fail)
+        self.failure_rate = failure_rate  # Fraction of other requests failing with failure_status
+        self.failure_status = failure_status
+        self.slow_models = slow_models or {}  # model -> extra seconds before its first token
+        self.random = random.Random(seed)
+        self.rate_limit = rate_limit  # (requests, seconds) per model, refilling like Groq's limits
+        self.allowance = {}  # model -> (requests left, when)
+        self.model_requests = {}  # model -> {"requests", "failures"}
+        self.request_count = 0
+        self.active_requests = 0
+        self.peak_active_requests = 0
+        self._loop = None
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """Start serving on a background thread and return the base URL"""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=serve, name="fake-groq", daemon=True).start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        """Stop the background server"""
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _shutdown(self):
+        self._server.close()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self, reset=False):
+        """Get request counters, optionally resetting the peak"""
+        stats = {
+            "requests": self.request_count,
+            "active_requests": self.active_requests,
+            "peak_active_requests": self.peak_active_requests,
+            "models": self.model_requests
+        }
+        if reset:
+            self.peak_active_requests = self.active_requests
+        return stats
+
+    def reply_tokens(self, body):
+        """Get the tokens to send back for a request body"""
+        tokens = []
+        if self.reasoning_tokens:
+            tokens = ["<think>"] + [f"thought{i} " for i in range(self.reasoning_tokens)] + ["</think>\n\n"]
+        if self.reply is not None:
+            return tokens + [word + " " for word in self.reply.split(" ")]
+        return tokens + [f"token{i} " for i in range(self.response_tokens)]
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "GET" and path.startswith("/stats"):
+                    await self._send_json(writer, 200, self.stats(reset="reset=1" in path))
+                    continue
+                if method != "POST" or path.split("?")[0] != CHAT_PATH:
+                    await self._send_json(writer, 404, {"error": {"message": "not found", "type": "not_found"}})
+                    continue
+                self.request_count += 1
+                self.active_requests += 1
+                self.peak_active_requests = max(self.peak_active_requests, self.active_requests)
+                try:
+                    await self._handle_completion(writer, json.loads(body or b"{}"))
+                finally:
+                    self.active_requests -= 1
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def over_rate_limit(self, model):
+        """Count a request against model's rate limit; True if it has none left"""
+        if self.rate_limit is None:
+            return False
+        requests, seconds = self.rate_limit
+        now = time.monotonic()
+        left, when = self.allowance.get(model, (requests, now))
+        left = min(requests, left + (now - when) * requests / seconds)
+        if left < 1:
+            self.allowance[model] = (left, now)
+            return True
+        self.allowance[model] = (left - 1, now)
+        return False
+
+    def injected_failure(self, model):
+        """Get the status a request for model should fail with, if any"""
+        if self.over_rate_limit(model):
+            return 429
+        if model in self.fail_models:
+            status = self.fail_models[model]
+            if isinstance(status, tuple):
+                status, rate = status
+                return status if self.random.random() < rate else None
+            return status
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            return self.failure_status
+        return None
+
+    async def _handle_completion(self, writer, request):
+        model = request.get("model", "fake-model")
+        counts = self.model_requests.setdefault(model, {"requests": 0, "failures": 0})
+        counts["requests"] += 1
+        tokens = self.reply_tokens(request)
+        status = self.injected_failure(model)
+        await asyncio.sleep(self.latency + self.slow_models.get(model, 0.0))
+        if status is not None:
+            counts["failures"] += 1
+            code, message = ERRORS.get(status, ("error", "Error"))
+            error_type = "invalid_request_error" if status < 500 else "internal_server_error"
+            await self._send_json(writer, status, {
+                "error": {"message": message.format(model=model), "type": error_type, "code": code}
+            }, {"retry-after": "1"} if status == 429 else None)
+            return
+        if not request.get("stream"):
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            await self._send_json(writer, 200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            })
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+        )
+        delay = 1.0 / self.tokens_per_second
+        for token in tokens:
+            await self._send_event(writer, self._chunk(model, {"content": token}))
+            await asyncio.sleep(delay)
+        final = self._chunk(model, {}, finish_reason="stop")
+        final["x_groq"] = {"id": "req_fake", "usage": {"completion_tokens": len(tokens)}}
+        await self._send_event(writer, final)
+        await self._send_chunk(writer, b"data: [DONE]\n\n")
+        await self._send_chunk(writer, b"")
+
+    @staticmethod
+    def _chunk(model, delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    async def _send_event(self, writer, payload):
+        await self._send_chunk(writer, f"data: {json.dumps(payload)}\n\n".encode())
+
+    @staticmethod
+    async def _send_chunk(writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _send_json(writer, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        reason = REASONS.get(status, "Error")
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n{extra}"
+            f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+def start_server_process(latency=0.05, tokens_per_second=500.0, response_tokens=60, port=8765, reasoning_tokens=0,
+                         fail_models=None, failure_rate=0.0, failure_status=503, slow_models=None, rate_limit=None):
+    """Run the fake server in a child process so it doesn't share the benchmark's GIL"""
+    import subprocess
+    import sys
+    import urllib.request
+    command = [
+        sys.executable, __file__, "--port", str(port), "--latency", str(latency),
+        "--tokens-per-second", str(tokens_per_second), "--response-tokens", str(response_tokens),
+        "--reasoning-tokens", str(reasoning_tokens),
+        "--failure-rate", str(failure_rate), "--failure-status", str(failure_status)
+    ]
+    for model, status in (fail_models or {}).items():
+        status = f"{status[0]}@{status[1]}" if isinstance(status, tuple) else status
+        command += ["--fail-model", f"{model}={status}"]
+    for model, delay in (slow_models or {}).items():
+        command += ["--slow-model", f"{model}={delay}"]
+    if rate_limit is not None:
+        command += ["--rate-limit", f"{rate_limit[0]}/{rate_limit[1]}"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base_url}/stats", timeout=1).read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Fake Groq server did not start")
+
+def fetch_stats(base_url, reset=False):
+    """Read counters from a running fake server"""
+    import urllib.request
+    query = "?reset=1" if reset else ""
+    with urllib.request.urlopen(f"{base_url}/stats{query}", timeout=5) as response:
+        return json.loads(response.read())
+
+def parse_failure(value):
+    """Parse STATUS or STATUS@RATE from --fail-model"""
+    status, _, rate = value.partition("@")
+    return (int(status), float(rate)) if rate else int(status)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Groq endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--reasoning-tokens", type=int, default=0, help="tokens of <think> reasoning before the reply")
+    parser.add_argument("--fail-model", action="append", default=[], metavar="MODEL=STATUS[@RATE]",
+                        help="fail MODEL's requests (all, or a fraction) with STATUS: 400 decommissioned, 404 not found, 429, 5xx")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of other requests to fail")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--slow-model", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="delay MODEL's first token by SECONDS")
+    parser.add_argument("--rate-limit", default=None, metavar="REQUESTS/SECONDS",
+                        help="answer 429 once a model gets more than REQUESTS per SECONDS")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeGroqServer(
+        args.host, args.port, args.latency, args.tokens_per_second, args.response_tokens,
+        reasoning_tokens=args.reasoning_tokens,
+        fail_models={model: parse_failure(status) for model, status in (item.rsplit("=", 1) for item in args.fail_model)},
+        failure_rate=args.failure_rate, failure_status=args.failure_status,
+        slow_models={model: float(delay) for model, delay in (item.rsplit("=", 1) for item in args.slow_model)},
+        seed=args.seed,
+        rate_limit=tuple(map(float, args.rate_limit.split("/"))) if args.rate_limit else None
+    )
+    print(f"Fake Groq listening on {server.start()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Local fake search backend for tests and benchmarks
+"""
+import time
+from _common import ROOT_DIR  # noqa: F401 (puts the app modules on sys.path)
+from search import SearchBackend
+
+class FakeSearchBackend(SearchBackend):
+    """Returns canned results after a fixed delay"""
+
+    def __init__(self, delay=0.3, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def search(self, query, num_results):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake search failure")
+        return [
+            {"title": f"Result {i} for {query}", "body": f"Details about {query}", "href": f"https://example.com/{i}"}
+            for i in range(num_results)
+        ]
@@ -71,6 +71,21 @@ def build_executable():
             '--add-data=styles.py:.',
             '--add-data=utils.py:.',
             '--add-data=memory.py:.',
+            '--add-data=groq_client.py:.',
+            '--add-data=response_cache.py:.',
+            '--add-data=search.py:.',
+            '--add-data=tokens.py:.',
+            '--add-data=retrieval.py:.',
+            '--add-data=prompt_builder.py:.',
+            '--add-data=summarizer.py:.',
+            '--add-data=file_index.py:.',
+            '--add-data=chat_store.py:.',
+            '--add-data=chat_index.py:.',
+            '--add-data=tts.py:.',
+            '--add-data=executor.py:.',
+            '--add-data=tracing.py:.',
+            '--add-data=router.py:.',
+            '--add-data=rate_limiter.py:.',
             '--add-data=requirements.txt:.',
             '--hidden-import=streamlit',
             '--hidden-import=groq',
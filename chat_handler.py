@@ -2,15 +2,47 @@
 Chat handling logic for Phin AI Assistant
 """
 import streamlit as st
-import groq
-import time
-import threading
-from utils import web_search, clean_response, stream_response, text_to_speech
-from config import GROQ_API_KEY
-from memory import conversation_memory
+import asyncio
+import groq_client
+from utils import split_reasoning, stream_response, text_to_speech, animate_response
+from memory import get_conversation_memory
+from response_cache import response_cache
+from search import search_service
+from prompt_builder import plan_budget, format_file_context, format_search_context, build_messages, message_tokens
+from summarizer import get_summary, schedule_summary
+from tts import get_worker as get_tts_worker
+from tracing import tracer, NoopTurn
+from router import router
+from rate_limiter import Overloaded
+from executor import background, QueueFull
+from config import MEMORY_CONTEXT_MAX_TOKENS, SUMMARIZATION_ENABLED, HISTORY_TOKEN_BUDGET, AVAILABLE_MODELS
 
-# Configure Groq client
-client = groq.Groq(api_key=GROQ_API_KEY)
+# Tokens reserved for the file context header and per-file labels
+FILE_CONTEXT_OVERHEAD = 64
+
+def get_file_context(file_index, prompt, max_tokens):
+    """Retrieve the uploaded file chunks relevant to prompt and format them"""
+    if not len(file_index) or max_tokens <= 0:
+        return ""
+    return format_file_context(file_index.retrieve(prompt, max_tokens - FILE_CONTEXT_OVERHEAD), max_tokens)
+
+async def gather_context(prompt, memory, file_index, use_web_search, plan, turn=None):
+    """Run memory lookup, file retrieval and web search concurrently"""
+    turn = turn or NoopTurn()
+    # Start the search first so it overlaps with the rest of context assembly
+    search_future = search_service.submit(prompt) if use_web_search else None
+    memory_budget = min(plan["memory"], MEMORY_CONTEXT_MAX_TOKENS)
+    memory_task = asyncio.to_thread(turn.timed("memory", memory.get_memory_context), memory_budget, prompt)
+    files_task = asyncio.to_thread(turn.timed("files", get_file_context), file_index, prompt, plan["files"])
+    if search_future is not None:
+        search_task = wait_for_search(search_future, turn)
+    else:
+        search_task = asyncio.sleep(0, result=[])
+    return await asyncio.gather(memory_task, files_task, search_task)
+
+async def wait_for_search(search_future, turn):
+    with turn.span("search"):
+        return await search_service.wait_async(search_future)
 
 def handle_chat_input(prompt):
     """Handle new chat input and generate response"""
@@ -46,6 +78,9 @@ with a cheese on stage"""
         return
 
     # Get AI response
+    turn = tracer.start_turn(st.session_state.selected_model)
+    outcome = "error"
+    answered_model = None
     try:
         # Create placeholder for thinking animation
         thinking_placeholder = st.empty()
@@ -59,73 +94,126 @@ with a cheese on stage"""
         """
         thinking_placeholder.markdown(thinking_html, unsafe_allow_html=True)
         
-        # Prepare context with memory
-        context = ""
+        def show_queue_position(status):
+            """Say where the turn is in line while Groq's rate limits hold it, then go back to the animation"""
+            if status.position:
+                from ui_components import render_queue_position
+                render_queue_position(thinking_placeholder, status)
+            else:
+                thinking_placeholder.markdown(thinking_html, unsafe_allow_html=True)
         
-        # Add memory context
-        memory_context = conversation_memory.get_memory_context()
+        # Older turns are represented by the rolling summary instead of being dropped
+        system_prompt = st.session_state.custom_system_prompt
+        covered = 0
+        if SUMMARIZATION_ENABLED:
+            with turn.span("summary"):
+                summary = get_summary(st.session_state, len(st.session_state.messages) - 1)
+            if summary["text"]:
+                system_prompt += f"\n\nSummary of the earlier conversation:\n{summary['text']}"
+                covered = summary["covered"]
+        
+        # Split the model's context window across prompt sections
+        plan = plan_budget(
+            st.session_state.selected_model, st.session_state.max_tokens, system_prompt, prompt
+        )
+        
+        # Prepare context with memory, files and web search in parallel
+        memory = get_conversation_memory(st.session_state.user_id)
+        with turn.span("context"):
+            memory_context, file_context, search_results = groq_client.run(gather_context(
+                prompt, memory, st.session_state.file_index,
+                st.session_state.use_web_search, plan, turn
+            ))
+        
+        context = ""
         if memory_context:
             context += f"Previous conversation memory:\n{memory_context}\n\n"
         
-        if st.session_state.uploaded_files_content:
-            context += "Uploaded files content:\n"
-            for filename, content in st.session_state.uploaded_files_content.items():
-                context += f"\n--- {filename} ---\n{content[:2000]}...\n"
+        context += file_context
+        context += format_search_context(search_results, plan["search"])
+        search_sources = [
+            {"title": result['title'], "url": result.get('href', '#')} for result in search_results
+        ]
         
-        # Web search if enabled
-        search_sources = []
-        if st.session_state.use_web_search:
-            search_results = web_search(prompt)
-            if search_results:
-                context += "\nWeb search results:\n"
-                for idx, result in enumerate(search_results, 1):
-                    context += f"{idx}. {result['title']}: {result['body']}\n"
-                    search_sources.append({"title": result['title'], "url": result.get('href', '#')})
-                context += "\n"
+        # System prompt, as much recent history as fits, then the prompt with its context
+        # (the prompt is the last entry in messages, so it's not repeated as history)
+        history = st.session_state.messages[covered:-1]
+        with turn.span("prompt"):
+            messages, first_index = build_messages(
+                system_prompt, history, prompt, plan, context,
+                max_history_tokens=HISTORY_TOKEN_BUDGET if SUMMARIZATION_ENABLED else None
+            )
         
-        # Prepare messages with conversation history for memory
-        messages = [{"role": "system", "content": st.session_state.custom_system_prompt}]
+        # Models to try: the selected one (or the fast one for simple prompts), then fallbacks
+        models = router.plan(
+            st.session_state.selected_model, prompt, st.session_state.auto_route,
+            sum(message_tokens(message) for message in messages) + st.session_state.max_tokens
+        )
+        if SUMMARIZATION_ENABLED:
+            # Compact whatever just fell out of the window while this turn generates
+            schedule_summary(st.session_state, st.session_state.messages, covered + first_index)
         
-        # Add recent conversation history for context (last 10 messages)
-        recent_messages = st.session_state.messages[-10:] if len(st.session_state.messages) > 10 else st.session_state.messages
-        for msg in recent_messages:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add current user message with context
-        if context:
-            messages.append({"role": "user", "content": f"{context}\n\n{prompt}"})
-        else:
-            messages.append({"role": "user", "content": prompt})
+        # Serve repeated prompts from the response cache when settings are near-deterministic
+        cache_key = None
+        if st.session_state.use_response_cache and response_cache.is_cacheable(st.session_state.temperature):
+            cache_key = response_cache.make_key(
+                models[0], st.session_state.temperature, st.session_state.max_tokens, messages
+            )
+        with turn.span("cache"):
+            cached_response = response_cache.get(cache_key) if cache_key else None
         
         # Generate response (keep thinking animation until response starts)
+        speech = None
+        reasoning = ""
+        answered_model = models[0]
+        keep_reasoning = st.session_state.show_reasoning
         with st.chat_message("assistant"):
-            if st.session_state.streaming_enabled:
-                assistant_response = stream_response(
-                    client, messages, st.session_state.selected_model,
-                    st.session_state.temperature, st.session_state.max_tokens, thinking_placeholder
+            if cached_response is not None:
+                thinking_placeholder.empty()
+                assistant_response = cached_response
+                with turn.span("animation"):
+                    animate_response(st.empty(), assistant_response, st.session_state.animation_mode)
+            elif st.session_state.streaming_enabled:
+                chunks = groq_client.stream_chat(
+                    messages, models, st.session_state.temperature, st.session_state.max_tokens,
+                    st.session_state.user_id, show_queue_position
                 )
+                # Start speaking the first sentence while later ones are still generating
+                if st.session_state.voice_enabled:
+                    tts_worker = get_tts_worker()
+                    tts_worker.cancel()
+                    speech = tts_worker.stream()
+                with turn.span("response"):
+                    assistant_response, reasoning = stream_response(
+                        chunks, thinking_placeholder, speech, keep_reasoning, turn
+                    )
+                if assistant_response:
+                    answered_model = st.session_state.last_response_stats.get('model') or answered_model
             else:
-                chat_completion = client.chat.completions.create(
-                    messages=messages,
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                )
+                with turn.span("response"):
+                    response_text, answered_model = groq_client.complete_chat(
+                        messages, models, st.session_state.temperature, st.session_state.max_tokens,
+                        st.session_state.user_id, show_queue_position
+                    )
                 thinking_placeholder.empty()
                 
-                assistant_response = clean_response(chat_completion.choices[0].message.content)
+                assistant_response, reasoning = split_reasoning(response_text, keep_reasoning)
                 
-                # Animate letter by letter for non-streaming too
-                displayed_text = ""
+                # Animate with a bounded number of updates instead of per character
                 response_placeholder = st.empty()
-                
-                for i, char in enumerate(assistant_response):
-                    displayed_text += char
-                    response_placeholder.markdown(f'<div class="response-content">{displayed_text}</div>', unsafe_allow_html=True)
-                    time.sleep(0.01)
-                
-                # Final display
-                response_placeholder.markdown(f'<div class="response-content complete">{assistant_response}</div>', unsafe_allow_html=True)
+                with turn.span("animation"):
+                    animate_response(response_placeholder, assistant_response, st.session_state.animation_mode)
+            
+            if reasoning:
+                from ui_components import render_reasoning
+                render_reasoning(reasoning)
+            
+            if answered_model != st.session_state.selected_model:
+                st.caption(f"↪️ Answered by {AVAILABLE_MODELS.get(answered_model, answered_model)}")
+            
+            # A fallback's answer isn't cached under the planned model's key
+            if cache_key and assistant_response and cached_response is None and answered_model == models[0]:
+                response_cache.put(cache_key, assistant_response)
             
             # Show search sources if available
             if search_sources:
@@ -135,21 +223,44 @@ with a cheese on stage"""
         
         # Add to chat history
         if assistant_response:
-            st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+            message = {"role": "assistant", "content": assistant_response}
+            if reasoning:
+                message["reasoning"] = reasoning
+            st.session_state.messages.append(message)
             
-            # Analyze and store conversation in memory
-            conversation_memory.analyze_and_store_conversation(st.session_state.messages)
+            # Analyze only the messages added since the last turn, off the script thread
+            try:
+                with turn.span("memory_analysis"):
+                    background.submit(
+                        memory.analyze_and_store_conversation, list(st.session_state.messages),
+                        st.session_state.memory_cursor, key=("memory", st.session_state.user_id),
+                        name="analyze_memory"
+                    )
+                st.session_state.memory_cursor = len(st.session_state.messages)
+            except QueueFull as e:
+                print(f"Skipped memory analysis: {e}")
             
             # Auto-save chat history
             from ui_components import auto_save_chat
-            auto_save_chat()
+            with turn.span("auto_save"):
+                auto_save_chat()
             
-            # Auto-play TTS if voice enabled (use full response but limit for performance)
-            if st.session_state.voice_enabled:
-                threading.Thread(target=text_to_speech, args=(assistant_response,)).start()
+            # Auto-play TTS if voice enabled (streamed replies are already being spoken)
+            if st.session_state.voice_enabled and speech is None:
+                with turn.span("speech"):
+                    text_to_speech(assistant_response)
+        
+        outcome = "ok" if assistant_response else "empty"
 
+    except Overloaded as e:
+        outcome = "overloaded"
+        thinking_placeholder.empty()
+        st.warning(f"⏳ {e}")
     except Exception as e:
         st.error(f"Error: {str(e)}")
+    finally:
+        # Every turn is counted, under the model that actually answered
+        st.session_state.last_trace = turn.finish(outcome, answered_model)
 
 def handle_voice_input():
     """Handle voice input if available"""
@@ -0,0 +1,299 @@
+"""
+Chat history index for Phin AI Assistant
+Keeps per-chat metadata and a full-text index of messages in SQLite, updated
+on every save, so the sidebar can list and search chats without touching the
+chat logs
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from config import CHAT_INDEX_DB, CHAT_TITLE_LENGTH, CHAT_SNIPPET_WORDS, CHAT_SEARCH_CANDIDATES
+
+# Bump when the schema or indexed content changes so existing indexes are rebuilt
+INDEX_VERSION = "3"
+_QUERY_TERM = re.compile(r'\w+')
+# Message rows get rowid = chat rowid * MESSAGE_SLOTS + position, so one chat's
+# messages can be replaced with an indexed range delete; the most recently
+# written chat always has the highest chat rowid, so rowid order is recency
+MESSAGE_SLOTS = 1 << 20
+
+def make_title(messages):
+    """Title a chat by its first user message"""
+    for message in messages:
+        if message.get("role") == "user" and message.get("content", "").strip():
+            title = " ".join(message["content"].split())
+            return title if len(title) <= CHAT_TITLE_LENGTH else title[:CHAT_TITLE_LENGTH - 1] + "…"
+    return None
+
+def make_snippet(content, terms, words=CHAT_SNIPPET_WORDS):
+    """Cut a window of words around the first query term in content, with the terms in bold"""
+    tokens = content.split()
+    matches = [any(term in token.lower() for term in terms) for token in tokens]
+    hit = matches.index(True) if True in matches else 0
+    start = max(0, hit - words // 2)
+    window = [
+        f"**{token}**" if matched else token
+        for token, matched in zip(tokens[start:start + words], matches[start:start + words])
+    ]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + words < len(tokens) else ""
+    return prefix + " ".join(window) + suffix
+
+def modified_time(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+class ChatIndex:
+    """SQLite (WAL) table of chat metadata with a cache of listed pages"""
+
+    def __init__(self, db_path=CHAT_INDEX_DB, search_candidates=CHAT_SEARCH_CANDIDATES):
+        self.db_path = db_path
+        self.search_candidates = search_candidates
+        self.local = threading.local()
+        self.version = 0  # Bumped on every write from this process
+        self.page_cache = {}  # (offset, limit) -> (stamp, rows)
+        self.cache_lock = threading.Lock()
+        # The database is created on first use, so importing the app leaves no files behind
+        self.setup_lock = threading.Lock()
+        self.has_fts = None
+        self.text_table = None
+
+    def connection(self):
+        """Get this thread's connection (sqlite3 connections are not shared across threads)"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.setup(db)
+            self.local.db = db
+        return db
+
+    def setup(self, db):
+        """Create the tables, once per process"""
+        with self.setup_lock:
+            if self.text_table is not None:
+                return
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value TEXT)")
+                stored = db.execute("SELECT value FROM index_state WHERE key = 'version'").fetchone()
+                columns = [row[1] for row in db.execute("PRAGMA table_info(chats)")]
+                if (stored and stored[0] != INDEX_VERSION) or (columns and "chat_rowid" not in columns):
+                    # Left by an older version: start over, rebuild() refills it
+                    for table in ("chats", "messages_fts", "messages_text"):
+                        db.execute(f"DROP TABLE IF EXISTS {table}")
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS chats (
+                        chat_rowid INTEGER PRIMARY KEY,
+                        chat_id TEXT NOT NULL UNIQUE,
+                        title TEXT,
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL,
+                        message_count INTEGER NOT NULL,
+                        size_bytes INTEGER NOT NULL
+                    )
+                """)
+                db.execute("CREATE INDEX IF NOT EXISTS chats_by_update ON chats (updated_at DESC)")
+                try:
+                    db.execute(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                        "content, chat_id UNINDEXED, position UNINDEXED, role UNINDEXED, "
+                        "tokenize = 'porter unicode61', prefix = '2 3')"
+                    )
+                    self.has_fts = True
+                except sqlite3.OperationalError:
+                    # SQLite built without FTS5: keep plain rows and search them with LIKE
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS messages_text "
+                        "(rowid INTEGER PRIMARY KEY, content TEXT, chat_id TEXT, position INTEGER, role TEXT)"
+                    )
+                    self.has_fts = False
+            self.text_table = "messages_fts" if self.has_fts else "messages_text"
+
+    def stamp(self):
+        """Identify the index's current state, including writes from other processes"""
+        mtimes = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(0)
+        return (self.version, *mtimes)
+
+    def invalidate(self):
+        with self.cache_lock:
+            self.version += 1
+            self.page_cache.clear()
+
+    def record_save(self, chat_id, messages, size_bytes, start=0):
+        """Update a chat's metadata and index its messages from start on after it was saved
+
+        A start of 0 means the whole chat was (re)written, so its old text is dropped first.
+        """
+        now = datetime.now().isoformat()
+        with self.connection() as db:
+            db.execute(
+                "INSERT INTO chats (chat_id, title, created_at, updated_at, message_count, size_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET title = COALESCE(chats.title, excluded.title), "
+                "updated_at = excluded.updated_at, message_count = excluded.message_count, "
+                "size_bytes = excluded.size_bytes",
+                (chat_id, make_title(messages[:4]), now, now, len(messages), size_bytes)
+            )
+            chat_rowid = db.execute("SELECT chat_rowid FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+            newest = db.execute("SELECT MAX(chat_rowid) FROM chats").fetchone()[0]
+            if chat_rowid != newest:
+                chat_rowid = self.move_to_end(db, chat_rowid, newest + 1, keep_messages=start > 0)
+            elif start == 0:
+                self.delete_messages(db, chat_rowid)
+            self.index_messages(db, chat_rowid, chat_id, messages[start:], start)
+        self.invalidate()
+
+    def move_to_end(self, db, chat_rowid, new_rowid, keep_messages=True):
+        """Give a resumed chat the newest rowid, so message rowids stay in order of last write"""
+        rows = db.execute(
+            f"SELECT rowid, content, chat_id, position, role FROM {self.text_table} WHERE rowid >= ? AND rowid < ?",
+            (chat_rowid * MESSAGE_SLOTS, (chat_rowid + 1) * MESSAGE_SLOTS)
+        ).fetchall() if keep_messages else []
+        self.delete_messages(db, chat_rowid)
+        db.execute("UPDATE chats SET chat_rowid = ? WHERE chat_rowid = ?", (new_rowid, chat_rowid))
+        offset = (new_rowid - chat_rowid) * MESSAGE_SLOTS
+        db.executemany(
+            f"INSERT INTO {self.text_table} (rowid, content, chat_id, position, role) VALUES (?, ?, ?, ?, ?)",
+            ((rowid + offset, *rest) for rowid, *rest in rows)
+        )
+        return new_rowid
+
+    def index_messages(self, db, chat_rowid, chat_id, messages, start):
+        db.executemany(
+            f"INSERT INTO {self.text_table} (rowid, content, chat_id, position, role) VALUES (?, ?, ?, ?, ?)",
+            (
+                (chat_rowid * MESSAGE_SLOTS + position, message.get("content", ""), chat_id, position, message.get("role"))
+                for position, message in enumerate(messages, start)
+            )
+        )
+
+    def delete_messages(self, db, chat_rowid):
+        db.execute(
+            f"DELETE FROM {self.text_table} WHERE rowid >= ? AND rowid < ?",
+            (chat_rowid * MESSAGE_SLOTS, (chat_rowid + 1) * MESSAGE_SLOTS)
+        )
+
+    def remove(self, chat_id):
+        """Drop a chat from the index"""
+        with self.connection() as db:
+            row = db.execute("SELECT chat_rowid FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row:
+                self.delete_messages(db, row[0])
+                db.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+        self.invalidate()
+
+    def search(self, query, limit=20):
+        """Find messages matching every word of query, best match first
+
+        Returns dicts with the chat's ID and title, the message's position
+        and role, and a snippet with matches wrapped in ** for markdown.
+        """
+        terms = _QUERY_TERM.findall(query.lower())
+        if not terms:
+            return []
+        db = self.connection()
+        if not self.has_fts:
+            return self.search_like(terms, limit)
+        # Quote each term so user input can't be read as FTS syntax; the last may be a prefix
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        # Only the most recent candidates are ranked, so common words can't make a
+        # query score every message in the history
+        floor = db.execute(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, self.search_candidates - 1)
+        ).fetchone()
+        rows = db.execute(
+            "SELECT messages_fts.chat_id, chats.title, position, role, content, bm25(messages_fts) AS score "
+            "FROM messages_fts LEFT JOIN chats ON chats.chat_rowid = messages_fts.rowid / ? "
+            "WHERE messages_fts MATCH ? AND messages_fts.rowid >= ? ORDER BY score LIMIT ?",
+            (MESSAGE_SLOTS, match, floor[0] if floor else 0, limit)
+        ).fetchall()
+        return [
+            {"chat_id": chat_id, "title": title, "position": position, "role": role,
+             "snippet": make_snippet(content, terms), "score": score}
+            for chat_id, title, position, role, content, score in rows
+        ]
+
+    def search_like(self, terms, limit):
+        """Substring search for SQLite builds without FTS5, most recent chats first"""
+        conditions = " AND ".join("m.content LIKE ?" for _ in terms)
+        rows = self.connection().execute(
+            "SELECT m.chat_id, c.title, m.position, m.role, m.content "
+            "FROM messages_text m LEFT JOIN chats c ON c.chat_id = m.chat_id "
+            f"WHERE {conditions} ORDER BY c.updated_at DESC, m.position LIMIT ?",
+            [f"%{term}%" for term in terms] + [limit]
+        ).fetchall()
+        return [
+            {"chat_id": chat_id, "title": title, "position": position, "role": role,
+             "snippet": make_snippet(content, terms), "score": 0.0}
+            for chat_id, title, position, role, content in rows
+        ]
+
+    def list_chats(self, offset=0, limit=10):
+        """Get one page of chat metadata, most recently updated first"""
+        key = (offset, limit)
+        stamp = self.stamp()
+        with self.cache_lock:
+            cached = self.page_cache.get(key)
+            if cached and cached[0] == stamp:
+                return cached[1]
+        rows = self.connection().execute(
+            "SELECT chat_id, title, created_at, updated_at, message_count, size_bytes FROM chats "
+            "ORDER BY updated_at DESC LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        page = [
+            dict(zip(("chat_id", "title", "created_at", "updated_at", "message_count", "size_bytes"), row))
+            for row in rows
+        ]
+        with self.cache_lock:
+            self.page_cache[key] = (stamp, page)
+        return page
+
+    def count(self):
+        """Get the number of indexed chats"""
+        return self.connection().execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def is_built(self):
+        row = self.connection().execute("SELECT value FROM index_state WHERE key = 'version'").fetchone()
+        return row is not None and row[0] == INDEX_VERSION
+
+    def rebuild(self, store):
+        """Index every chat log in a store (for first use and after migration)"""
+        with self.connection() as db:
+            db.execute("DELETE FROM chats")
+            db.execute(f"DELETE FROM {self.text_table}")
+            # Least recently written first, so rowids follow the order chats were last written
+            for chat_id in sorted(store.scan_chat_ids(), key=lambda chat_id: modified_time(store.path(chat_id))):
+                try:
+                    messages = []
+                    created = None
+                    for record in store.read_records(chat_id):
+                        if record.get("type") == "meta":
+                            created = record.get("created")
+                        elif record.get("type") == "message":
+                            messages.append(record)
+                    path = store.path(chat_id)
+                    updated = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+                    chat_rowid = db.execute(
+                        "INSERT INTO chats (chat_id, title, created_at, updated_at, message_count, size_bytes) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (chat_id, make_title(messages[:4]), created or updated, updated, len(messages), os.path.getsize(path))
+                    ).lastrowid
+                    self.index_messages(db, chat_rowid, chat_id, messages, 0)
+                except (OSError, ValueError) as e:
+                    print(f"Error indexing chat {chat_id}: {e}")
+            db.execute("INSERT OR REPLACE INTO index_state VALUES ('version', ?)", (INDEX_VERSION,))
+        self.invalidate()
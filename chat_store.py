@@ -0,0 +1,275 @@
+"""
+Chat history storage for Phin AI Assistant
+Each conversation is one append-only JSONL log keyed by a stable chat ID;
+saves append only what changed and logs are compacted now and then
+"""
+import glob
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+from chat_index import ChatIndex
+from config import CHAT_HISTORY_DIR, LEGACY_CHAT_DIRS, CHAT_COMPACT_MIN_RECORDS, CHAT_COMPACT_RATIO
+
+LOG_EXTENSION = ".jsonl"
+
+def new_chat_id():
+    """Create a chat ID that sorts by creation time"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def encode_record(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+class ChatLog:
+    """What has already been written for one chat, so saves only append the difference"""
+
+    def __init__(self):
+        self.message_count = 0
+        self.ratings = {}
+        self.records = 0
+        self.lock = threading.Lock()
+
+class ChatStore:
+    def __init__(self, directory=CHAT_HISTORY_DIR, legacy_dirs=LEGACY_CHAT_DIRS,
+                 compact_min_records=CHAT_COMPACT_MIN_RECORDS, compact_ratio=CHAT_COMPACT_RATIO, index=None):
+        self.directory = directory
+        self.index = index
+        self.legacy_dirs = legacy_dirs
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self.logs = {}
+        self.logs_lock = threading.Lock()
+        self.migrated = False
+
+    def path(self, chat_id):
+        return os.path.join(self.directory, chat_id + LOG_EXTENSION)
+
+    def get_log(self, chat_id):
+        """Get the write state for a chat, reading it from disk the first time"""
+        with self.logs_lock:
+            log = self.logs.get(chat_id)
+            if log is None:
+                log = self.logs[chat_id] = ChatLog()
+                if os.path.exists(self.path(chat_id)):
+                    for record in self.read_records(chat_id):
+                        self.apply_record(log, record)
+        return log
+
+    def apply_record(self, log, record):
+        log.records += 1
+        if record.get("type") == "message":
+            log.message_count += 1
+        elif record.get("type") == "rating":
+            log.ratings[record["index"]] = record["value"]
+
+    def save(self, chat_id, messages, ratings=None):
+        """Append messages and rating changes not yet written; returns the bytes written"""
+        ratings = ratings or {}
+        log = self.get_log(chat_id)
+        with log.lock:
+            if len(messages) < log.message_count:
+                # The conversation was rewritten rather than extended
+                return self.compact(chat_id, log, messages, ratings)
+            records = []
+            if log.records == 0:
+                records.append({"type": "meta", "chat_id": chat_id, "created": datetime.now().isoformat()})
+            records.extend({"type": "message", **message} for message in messages[log.message_count:])
+            records.extend(
+                {"type": "rating", "index": int(index), "value": value}
+                for index, value in ratings.items() if log.ratings.get(int(index)) != value
+            )
+            if not records:
+                return 0
+            live_records = 1 + len(messages) + len(ratings)
+            if log.records + len(records) >= max(self.compact_min_records, live_records * self.compact_ratio):
+                return self.compact(chat_id, log, messages, ratings)
+            payload = "".join(encode_record(record) for record in records)
+            os.makedirs(self.directory, exist_ok=True)
+            self.repair_tail(self.path(chat_id))
+            # One write per save, so a crash leaves at most a torn last line (skipped on load)
+            with open(self.path(chat_id), "a", encoding="utf-8") as f:
+                f.write(payload)
+            start = log.message_count
+            for record in records:
+                self.apply_record(log, record)
+            self.record_save(chat_id, messages, start)
+            return len(payload)
+
+    def repair_tail(self, path):
+        """Make sure a log ends with a line break before appending to it
+
+        A torn last line from an interrupted append is cut off (load already
+        skips it), so the next record isn't glued onto it and lost as well.
+        """
+        try:
+            f = open(path, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Walk back to the start of the last line
+            start = size
+            while start:
+                block_start = max(0, start - 4096)
+                f.seek(block_start)
+                newline = f.read(start - block_start).rfind(b"\n")
+                if newline >= 0:
+                    start = block_start + newline + 1
+                    break
+                start = block_start
+            f.seek(start)
+            try:
+                # A whole record that only lost its line break is kept
+                json.loads(f.read())
+                f.write(b"\n")
+            except ValueError:
+                f.truncate(start)
+
+    def compact(self, chat_id, log, messages, ratings, created=None):
+        """Rewrite a chat's log with only its live records, atomically"""
+        if log.records:
+            for record in self.read_records(chat_id):
+                created = record.get("created") if record.get("type") == "meta" else None
+                break
+        records = [{"type": "meta", "chat_id": chat_id, "created": created or datetime.now().isoformat()}]
+        records.extend({"type": "message", **message} for message in messages)
+        records.extend(
+            {"type": "rating", "index": int(index), "value": value} for index, value in ratings.items()
+        )
+        payload = "".join(encode_record(record) for record in records)
+        self.write_atomic(self.path(chat_id), payload)
+        log.message_count = len(messages)
+        log.ratings = {int(index): value for index, value in ratings.items()}
+        log.records = len(records)
+        self.record_save(chat_id, messages, 0)
+        return len(payload)
+
+    def record_save(self, chat_id, messages, start):
+        """Keep the chat index in step with a write of messages[start:]"""
+        if self.index is not None:
+            self.index.record_save(chat_id, messages, os.path.getsize(self.path(chat_id)), start)
+
+    def write_atomic(self, path, payload):
+        """Write a file via a temporary file and rename, so readers never see a partial file"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def read_records(self, chat_id):
+        """Stream a chat's records line by line"""
+        with open(self.path(chat_id), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn final line from an interrupted append
+                    continue
+
+    def iter_messages(self, chat_id):
+        """Stream a chat's messages without loading the whole log"""
+        for record in self.read_records(chat_id):
+            if record.get("type") == "message":
+                record.pop("type")
+                yield record
+
+    def load(self, chat_id):
+        """Load a chat's messages and ratings"""
+        log = ChatLog()
+        messages = []
+        for record in self.read_records(chat_id):
+            self.apply_record(log, record)
+            if record.pop("type", None) == "message":
+                messages.append(record)
+        with self.logs_lock:
+            current = self.logs.setdefault(chat_id, log)
+        if current is not log:
+            with current.lock:
+                current.message_count, current.ratings, current.records = log.message_count, log.ratings, log.records
+        return messages, dict(log.ratings)
+
+    def delete(self, chat_id):
+        """Remove a chat's log"""
+        with self.logs_lock:
+            self.logs.pop(chat_id, None)
+        if self.index is not None:
+            self.index.remove(chat_id)
+        try:
+            os.remove(self.path(chat_id))
+        except FileNotFoundError:
+            pass
+
+    def list_chats(self, offset=0, limit=10):
+        """Get one page of saved chats' metadata, most recently updated first"""
+        self.prepare()
+        if self.index is None:
+            return [{"chat_id": chat_id, "title": None} for chat_id in self.scan_chat_ids()[offset:offset + limit]]
+        return self.index.list_chats(offset, limit)
+
+    def count_chats(self):
+        """Get the number of saved chats"""
+        self.prepare()
+        return len(self.scan_chat_ids()) if self.index is None else self.index.count()
+
+    def search(self, query, limit=20):
+        """Full-text search over every saved chat's messages (see ChatIndex.search)"""
+        self.prepare()
+        if self.index is None:
+            return []
+        return self.index.search(query, limit)
+
+    def scan_chat_ids(self):
+        """List chat IDs from the directory itself, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-len(LOG_EXTENSION)] for name in names if name.endswith(LOG_EXTENSION)), reverse=True)
+
+    def prepare(self):
+        """Migrate legacy chats and build the index, once per process"""
+        if self.migrated:
+            return
+        self.migrate_legacy()
+        if self.index is not None and not self.index.is_built():
+            self.index.rebuild(self)
+
+    def migrate_legacy(self):
+        """Convert whole-file JSON chats from older versions into logs, once per process"""
+        if self.migrated:
+            return
+        self.migrated = True
+        for directory in self.legacy_dirs:
+            for legacy_path in glob.glob(os.path.join(directory, "chat_*.json")):
+                chat_id = os.path.basename(legacy_path)[len("chat_"):-len(".json")]
+                try:
+                    with open(legacy_path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    if not os.path.exists(self.path(chat_id)):
+                        # Keep the chat's original time so it sorts where it used to
+                        saved_at = os.path.getmtime(legacy_path)
+                        self.compact(
+                            chat_id, ChatLog(), data.get("messages", []), data.get("ratings", {}),
+                            created=datetime.fromtimestamp(saved_at).isoformat()
+                        )
+                        os.utime(self.path(chat_id), (saved_at, saved_at))
+                    # Keep the original next to the log rather than deleting it
+                    os.replace(legacy_path, legacy_path + ".migrated")
+                except (OSError, ValueError) as e:
+                    print(f"Error migrating {legacy_path}: {e}")
+
+chat_store = ChatStore(index=ChatIndex())
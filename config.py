@@ -29,6 +29,18 @@ if not GROQ_API_KEY:
 if not GROQ_API_KEY or not GROQ_API_KEY.startswith('gsk_'):
     raise ValueError("Invalid or missing GROQ_API_KEY. Please check your environment variables.")
 
+# Optional override so the app can be pointed at a local fake Groq server
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL') or None
+
+# Groq Connection Pool
+MAX_CONCURRENT_LLM_CALLS = 64  # In-flight Groq requests allowed per process
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+HTTP_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle pooled connection is kept open
+GROQ_CONNECT_TIMEOUT = 5.0
+GROQ_READ_TIMEOUT = 60.0
+BLOCKING_IO_WORKERS = 64  # Threads for search and context assembly run alongside LLM calls
+
 # Available AI Models
 AVAILABLE_MODELS = {
     "llama-3.1-70b-versatile": "Llama 3.1 70B",
@@ -40,12 +52,164 @@ AVAILABLE_MODELS = {
     "gemma-7b-it": "Gemma 7B"
 }
 
+# Context windows (tokens) for budgeting prompts per model
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.1-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "llama3-groq-70b-8192-tool-use-preview": 8192,
+    "llama3-groq-8b-8192-tool-use-preview": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "deepseek-r1-distill-llama-70b": 131072,
+    "gemma-7b-it": 8192
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Model Routing
+ROUTER_AUTO_ROUTE = False  # Default for the sidebar's auto-route toggle
+ROUTER_FAST_MODEL = "llama-3.1-8b-instant"  # Where auto-routing sends short, simple prompts
+ROUTER_FALLBACK_MODELS = [  # Tried, healthiest first, when the chosen model fails
+    "llama-3.1-70b-versatile",
+    "deepseek-r1-distill-llama-70b",
+    "llama-3.1-8b-instant"
+]
+ROUTER_SIMPLE_MAX_TOKENS = 48  # Longest prompt auto-routing can treat as simple
+ROUTER_MAX_ATTEMPTS = 3  # Requests per turn, counting fallbacks, retries and hedges
+ROUTER_HEDGE_DELAY = 4.0  # Seconds without a first token before racing the next model (0 disables)
+ROUTER_HEDGE_FACTOR = 3.0  # ...or this many times the model's usual first-token time, if longer
+ROUTER_BACKOFF_BASE = 0.1  # Seconds; doubles per retry, with full jitter
+ROUTER_BACKOFF_CAP = 2.0
+ROUTER_RATE_LIMIT_COOLDOWN = 10.0  # Seconds a rate-limited model is skipped when Groq sends no Retry-After
+ROUTER_EWMA_ALPHA = 0.2  # Weight of the newest request in latency and error-rate averages
+ROUTER_ERROR_PENALTY = 4.0  # How much a model's error rate inflates its routing cost
+ROUTER_UNHEALTHY_ERROR_RATE = 0.5  # Error rate above which even the chosen model is tried last
+ROUTER_ERROR_HALF_LIFE = 60.0  # Seconds for an unused model's error rate to halve, so it gets tried again
+ROUTER_PRIOR_LATENCY = 1.0  # Assumed first-token seconds for a model not used yet
+
+# Rate Limiting
+RATE_LIMIT_ENABLED = os.getenv('PHIN_RATE_LIMIT', '0') == '1'  # Off unless set, as the limits must match your Groq plan
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv('PHIN_GROQ_RPM', '30'))  # Per model; Groq's free tier by default
+RATE_LIMIT_TOKENS_PER_MINUTE = int(os.getenv('PHIN_GROQ_TPM', '6000'))
+MODEL_RATE_LIMITS = {}  # model -> (requests, tokens) per minute, where it differs from the above
+RATE_LIMIT_STATE_DB = os.getenv('PHIN_RATE_LIMIT_DB', '')  # Share the limits with other processes on the host; empty keeps them per process
+RATE_LIMIT_STATE_MAX_ERRORS = 5  # Failed state file calls in a row before limiting per process for good
+RATE_LIMIT_QUEUE_DEADLINE = 20.0  # Seconds a request may wait for its turn before it's turned away
+RATE_LIMIT_COMPLETION_ESTIMATE = 512  # Completion tokens reserved up front, corrected once usage is known
+
+# Prompt Assembly
+PROMPT_TOKEN_CAP = 16000  # Never send more than this, even to long-context models
+PROMPT_SAFETY_MARGIN = 256  # Slack for tokenizer estimate error and message framing
+PROMPT_MESSAGE_OVERHEAD = 4  # Tokens of framing per chat message
+PROMPT_BUDGET_SHARES = {  # Share of the flexible budget per section; unused share goes to history
+    "memory": 0.10,
+    "files": 0.25,
+    "search": 0.10
+}
+
+# Uploaded Files
+FILE_CHUNK_TOKENS = 300  # Target size of each indexed file chunk
+FILE_CHUNK_OVERLAP = 40  # Tokens repeated between neighbouring chunks
+FILE_RETRIEVAL_TOP_K = 8  # Chunks considered per prompt
+FILE_READ_BLOCK = 64 * 1024  # Characters read at a time from text uploads
+FILE_UPLOAD_TYPES = ["txt", "md", "py", "js", "json", "csv", "html", "pdf", "docx"]
+
+# Conversation Summarization
+SUMMARIZATION_ENABLED = True
+SUMMARY_MODEL = "llama-3.1-8b-instant"  # Cheap model that compacts older turns
+HISTORY_TOKEN_BUDGET = 3072  # Recent history sent verbatim; older turns are summarized
+SUMMARY_BATCH_MESSAGES = 6  # Wait for this many turns to leave the window before re-summarizing
+SUMMARY_INPUT_TOKENS = 6000  # Most history folded into the summary per request
+SUMMARY_MAX_TOKENS = 400
+
 # Default Settings
 DEFAULT_SYSTEM_PROMPT = """You are Phin, a helpful AI assistant created by a developer. You are knowledgeable, friendly, and always try to provide accurate and helpful responses. You can help with a wide variety of tasks including answering questions, writing, coding, analysis, and creative tasks. Always be concise but thorough in your responses."""
 
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_MAX_TOKENS = 2048
 DEFAULT_MODEL = "llama-3.1-70b-versatile"
+SHOW_REASONING = True  # Keep reasoning models' <think> sections in a collapsed expander
+
+# Streaming Configuration
+STREAM_UPDATE_INTERVAL = 0.05  # Seconds between placeholder repaints while streaming
+STREAM_UPDATE_TOKENS = 16  # Repaint early once this many tokens have arrived
+STREAM_MIN_GROWTH = 0.1  # Repaint only after visible text grew by this fraction
+
+# Web Search
+SEARCH_RESULTS = 3
+SEARCH_DEADLINE = 2.5  # Seconds to wait for results before answering without them
+SEARCH_CACHE_TTL = 15 * 60
+SEARCH_CACHE_MAX_ENTRIES = 512
+SEARCH_WORKERS = 16
+
+# Memory Persistence
+MEMORY_WRITE_BEHIND = True  # Coalesce memory writes in a background flusher
+MEMORY_FLUSH_INTERVAL = 2.0  # Seconds between background flushes
+MEMORY_DB_PATH = os.getenv('PHIN_MEMORY_DB', 'memory/memory.db')
+# Key that signs the user ID kept in the page URL; empty keeps a random one in MEMORY_SECRET_FILE
+MEMORY_SECRET = os.getenv('PHIN_MEMORY_SECRET', '')
+MEMORY_SECRET_FILE = os.getenv('PHIN_MEMORY_SECRET_FILE', os.path.join(os.path.dirname(MEMORY_DB_PATH), 'secret.key'))
+MEMORY_CACHE_SIZE = 256  # Users whose memory stays loaded per process
+MEMORY_CONTEXT_MAX_TOKENS = 1024  # Budget so memory never crowds out the conversation
+MEMORY_MAX_TOPICS = 50
+MEMORY_MAX_FACTS = 100
+MEMORY_RETRIEVAL_TOPICS = 10  # Topics retrieved per prompt
+MEMORY_RETRIEVAL_FACTS = 20  # Facts retrieved per prompt
+
+# Chat History
+CHAT_HISTORY_DIR = os.getenv('PHIN_CHAT_DIR', 'chat-history')
+LEGACY_CHAT_DIRS = ['chat_history', 'chat-history']  # Where whole-file JSON chats were saved before
+CHAT_COMPACT_MIN_RECORDS = 64  # Don't bother compacting small chat logs
+CHAT_COMPACT_RATIO = 1.5  # Compact once a log holds this many records per live entry
+CHAT_INDEX_DB = os.getenv('PHIN_CHAT_INDEX_DB', os.path.join(CHAT_HISTORY_DIR, 'index.db'))
+CHAT_PAGE_SIZE = 10  # Chats listed per sidebar page
+CHAT_TITLE_LENGTH = 48
+CHAT_SNIPPET_WORDS = 12  # Words of context shown around a search match
+CHAT_SEARCH_RESULTS = 8  # Chats listed for a sidebar search
+CHAT_SEARCH_CANDIDATES = 2000  # Most recent matching messages ranked per search
+CHAT_RENDER_WINDOW = 30  # Messages shown before "load earlier" is needed
+CHAT_RENDER_STEP = 30  # Messages revealed per "load earlier" click
+
+# Response Cache
+RESPONSE_CACHE_ENABLED = False  # Opt-in default for the sidebar toggle
+CACHE_MAX_TEMPERATURE = 0.3  # Only cache near-deterministic generations
+CACHE_TTL_SECONDS = 6 * 60 * 60
+CACHE_MAX_BYTES = 16 * 1024 * 1024  # In-process tier size cap
+RESPONSE_CACHE_DB = os.getenv('PHIN_RESPONSE_CACHE_DB', 'cache/response_cache.db')  # Empty disables the disk tier
+CACHE_DB_MAX_BYTES = 256 * 1024 * 1024
+
+# Background Work
+BACKGROUND_WORKERS = 4  # Threads for saves and memory analysis
+BACKGROUND_QUEUE_SIZE = 256  # Pending tasks before submitters wait
+BACKGROUND_SUBMIT_TIMEOUT = 5.0  # Seconds a submitter waits for a free slot
+BACKGROUND_SHUTDOWN_TIMEOUT = 10.0  # Seconds to let pending work finish at exit
+BACKGROUND_METRIC_SAMPLES = 512  # Recent timings kept per task type
+
+# Tracing
+TRACING_ENABLED = os.getenv('PHIN_TRACING', '1') != '0'  # Time each stage of every chat turn
+TRACE_SAMPLES = 512  # Recent timings kept per model and stage for percentiles
+METRICS_FILE = os.getenv('PHIN_METRICS_FILE', '')  # .prom for Prometheus text, else JSON; empty disables
+METRICS_EXPORT_INTERVAL = 15.0  # Minimum seconds between metrics file writes
+
+# Text-to-Speech
+TTS_DRIVER = os.getenv('PHIN_TTS_DRIVER') or None  # pyttsx3 driver; "dummy" speaks silently (for testing)
+TTS_QUEUE_SIZE = 64  # Sentences waiting to be spoken
+TTS_RATE = 180  # Words per minute; slightly faster, more natural
+TTS_VOLUME = 0.9
+TTS_PREFERRED_VOICES = ['female', 'samantha', 'alex']
+
+# Optional Dependencies (package name, module), imported only when the feature is used
+VOICE_DEPENDENCIES = [('SpeechRecognition', 'speech_recognition'), ('pyttsx3', 'pyttsx3')]
+
+# Response Animation
+ANIMATION_MODES = {
+    "chunk": "Chunked",
+    "css": "Typewriter (browser)",
+    "none": "Instant"
+}
+DEFAULT_ANIMATION_MODE = "chunk"
+MAX_ANIMATION_UPDATES = 30  # Upper bound on placeholder updates per message
+ANIMATION_FRAME_DELAY = 0.03  # Seconds between chunked animation frames
+TYPEWRITER_CHARS_PER_SECOND = 400  # Reveal speed for the browser-side typewriter
+TYPEWRITER_MAX_DURATION = 6.0  # Cap in seconds so long answers don't crawl
 
 # UI Configuration
 PAGE_TITLE = "🐠 Phin AI Assistant"
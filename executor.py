@@ -0,0 +1,132 @@
+"""
+Background work for Phin AI Assistant
+A shared, bounded thread pool for work that shouldn't hold up a rerun (chat
+saves, memory analysis), with per-key ordering and queue metrics
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    BACKGROUND_WORKERS, BACKGROUND_QUEUE_SIZE, BACKGROUND_SUBMIT_TIMEOUT,
+    BACKGROUND_SHUTDOWN_TIMEOUT, BACKGROUND_METRIC_SAMPLES
+)
+
+class QueueFull(Exception):
+    """Raised when a task can't be queued because the executor stayed at its limit"""
+
+class BackgroundExecutor:
+    def __init__(self, workers=BACKGROUND_WORKERS, max_queue=BACKGROUND_QUEUE_SIZE,
+                 submit_timeout=BACKGROUND_SUBMIT_TIMEOUT, samples=BACKGROUND_METRIC_SAMPLES):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="background")
+        self.max_queue = max_queue
+        self.submit_timeout = submit_timeout
+        self.condition = threading.Condition()
+        self.pending = 0  # Tasks queued or running
+        self.keyed = {}  # key -> deque of tasks waiting behind that key's running task
+        self.closed = False
+        self.samples = samples
+        self.metrics = {}  # task name -> {"submitted", "completed", "failed", "waits", "runs"}
+        self.max_depth = 0
+
+    def submit(self, fn, *args, key=None, name=None, **kwargs):
+        """Run fn(*args, **kwargs) in the background
+
+        Tasks sharing a key run one at a time in submission order. When
+        max_queue tasks are already pending the caller waits (back-pressure),
+        raising QueueFull if no slot frees up within submit_timeout.
+        """
+        name = name or getattr(fn, "__name__", "task")
+        task = (fn, args, kwargs, name, time.perf_counter())
+        with self.condition:
+            if self.closed:
+                raise QueueFull("executor is shut down")
+            if not self.condition.wait_for(lambda: self.pending < self.max_queue, self.submit_timeout):
+                self.metric(name)["rejected"] += 1
+                raise QueueFull(f"{self.pending} background tasks pending")
+            self.pending += 1
+            self.max_depth = max(self.max_depth, self.pending)
+            self.metric(name)["submitted"] += 1
+            if key is not None:
+                waiting = self.keyed.get(key)
+                if waiting is not None:
+                    # A task for this key is running; it starts this one when it finishes
+                    waiting.append(task)
+                    return
+                self.keyed[key] = deque()
+        self.pool.submit(self.run, task, key)
+
+    def run(self, task, key):
+        """Run a task, then any tasks queued behind it for the same key"""
+        while task is not None:
+            fn, args, kwargs, name, submitted_at = task
+            started_at = time.perf_counter()
+            failed = False
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                print(f"Background task {name} failed: {e}")
+            finished_at = time.perf_counter()
+            with self.condition:
+                metric = self.metric(name)
+                metric["failed" if failed else "completed"] += 1
+                metric["waits"].append(started_at - submitted_at)
+                metric["runs"].append(finished_at - started_at)
+                self.pending -= 1
+                task = None
+                if key is not None:
+                    waiting = self.keyed[key]
+                    if waiting:
+                        task = waiting.popleft()
+                    else:
+                        del self.keyed[key]
+                self.condition.notify_all()
+
+    def wait(self, key, timeout=None):
+        """Wait for every task submitted under key to finish; returns False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: key not in self.keyed, timeout)
+
+    def metric(self, name):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = {
+                "submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                "waits": deque(maxlen=self.samples), "runs": deque(maxlen=self.samples)
+            }
+        return metric
+
+    def stats(self):
+        """Get queue depth and per-task counts with p50/p95 queue wait and run time (seconds)"""
+        def percentile(values, pct):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+        with self.condition:
+            tasks = {
+                name: {
+                    "submitted": metric["submitted"], "completed": metric["completed"],
+                    "failed": metric["failed"], "rejected": metric["rejected"],
+                    "wait_p50": percentile(metric["waits"], 0.5), "wait_p95": percentile(metric["waits"], 0.95),
+                    "run_p50": percentile(metric["runs"], 0.5), "run_p95": percentile(metric["runs"], 0.95)
+                }
+                for name, metric in self.metrics.items()
+            }
+            return {"pending": self.pending, "max_depth": self.max_depth, "tasks": tasks}
+
+    def shutdown(self, timeout=BACKGROUND_SHUTDOWN_TIMEOUT):
+        """Stop taking tasks and wait (up to timeout) for pending ones to finish; returns True if drained"""
+        with self.condition:
+            self.closed = True
+            drained = self.condition.wait_for(lambda: self.pending == 0, timeout)
+        if not drained:
+            print(f"Exiting with {self.pending} background tasks unfinished")
+        self.pool.shutdown(wait=drained)
+        return drained
+
+background = BackgroundExecutor()
+# The pool already finishes queued work when the interpreter exits; this also
+# waits out tasks chained behind a key and reports any that didn't finish
+atexit.register(background.shutdown)
@@ -0,0 +1,179 @@
+"""
+Uploaded file indexing for Phin AI Assistant
+Files are extracted and chunked once at upload time; each prompt then gets
+only the chunks most relevant to it
+"""
+import io
+import os
+import re
+from retrieval import BM25Index
+from tokens import estimate_tokens
+from config import FILE_CHUNK_TOKENS, FILE_CHUNK_OVERLAP, FILE_RETRIEVAL_TOP_K, FILE_READ_BLOCK
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_WORD_SLICE = re.compile(r'\s+|\S+\s*')
+_LEADING_BLANK_LINES = re.compile(r'\A(?:[ \t]*\n)+')
+
+def extract_text(filename, fileobj):
+    """Yield a file's text piece by piece (pages, paragraphs or blocks) rather than all at once"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".pdf":
+        from PyPDF2 import PdfReader
+        for page in PdfReader(fileobj).pages:
+            yield page.extract_text() or ""
+    elif extension == ".docx":
+        import docx
+        for paragraph in docx.Document(fileobj).paragraphs:
+            yield paragraph.text + "\n\n"
+    else:
+        reader = io.TextIOWrapper(fileobj, encoding="utf-8", errors="replace")
+        try:
+            while True:
+                block = reader.read(FILE_READ_BLOCK)
+                if not block:
+                    break
+                yield block
+        finally:
+            # Don't let the wrapper close the caller's file
+            reader.detach()
+
+def split_paragraphs(pieces, max_carry=FILE_READ_BLOCK):
+    """Re-split streamed text into whole paragraphs, even when they span pieces
+
+    Each paragraph keeps the blank lines after it, so the paragraphs join back
+    into the original text. Text without blank lines (CSV, logs, minified JSON)
+    is let go at a line or word boundary once more than max_carry characters are held.
+    """
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        pos = 0
+        for match in _PARAGRAPH_BREAK.finditer(text):
+            if match.end() == len(text):
+                # The break may go on in the next piece
+                break
+            yield text[pos:match.end()]
+            pos = match.end()
+        carry = text[pos:]
+        if len(carry) > max_carry:
+            # Cut before the last line break, so a blank line completed by the next piece still splits
+            cut = carry.rfind("\n")
+            if cut <= 0:
+                cut = carry.rfind(" ")
+            if cut <= 0:
+                cut = len(carry)
+            yield carry[:cut]
+            carry = carry[cut:]
+    if carry:
+        yield carry
+
+def split_units(paragraph, chunk_tokens):
+    """Split a paragraph into (text, tokens) pieces a chunk can end after: its lines,
+    or the words of a line too long for one chunk
+    """
+    for line in paragraph.splitlines(keepends=True):
+        tokens = estimate_tokens(line)
+        if tokens <= chunk_tokens:
+            yield line, tokens
+        else:
+            for match in _WORD_SLICE.finditer(line):
+                yield match.group(), estimate_tokens(match.group())
+
+def chunk_text(pieces, chunk_tokens=FILE_CHUNK_TOKENS, overlap=FILE_CHUNK_OVERLAP):
+    """Group streamed text into chunks of about chunk_tokens, split on paragraph, line and word boundaries
+
+    Chunks are slices of the original text, so code, tables and lists keep their layout.
+    """
+    units, unit_tokens, size = [], [], 0
+    fresh = False  # Whether text was added since the last chunk was emitted
+    for paragraph in split_paragraphs(pieces):
+        for unit, tokens in split_units(paragraph, chunk_tokens):
+            units.append(unit)
+            unit_tokens.append(tokens)
+            size += tokens
+            fresh = fresh or tokens > 0
+            if size >= chunk_tokens:
+                yield _join_chunk(units)
+                units, unit_tokens, size = _keep_overlap(units, unit_tokens, overlap)
+                fresh = False
+        if fresh and size >= chunk_tokens // 2:
+            # Prefer ending chunks at paragraph breaks once they're reasonably full
+            yield _join_chunk(units)
+            units, unit_tokens, size = _keep_overlap(units, unit_tokens, overlap)
+            fresh = False
+    if fresh:
+        yield _join_chunk(units)
+
+def _join_chunk(units):
+    """Join a chunk's pieces of text, without blank lines at either end"""
+    return _LEADING_BLANK_LINES.sub("", "".join(units)).rstrip()
+
+def _keep_overlap(units, unit_tokens, overlap):
+    """Keep the trailing lines worth about overlap tokens to start the next chunk"""
+    kept = 0
+    start = len(units)
+    while start > 0 and kept + unit_tokens[start - 1] <= overlap:
+        start -= 1
+        kept += unit_tokens[start]
+    return units[start:], unit_tokens[start:], kept
+
+class FileIndex:
+    """Chunks of every uploaded file in a session, indexed for retrieval"""
+
+    def __init__(self):
+        self.index = BM25Index()
+        self.chunks = {}  # chunk id -> (filename, position, text)
+        self.files = {}  # filename -> (fingerprint, [chunk ids])
+        self.next_chunk_id = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def has_file(self, filename, fingerprint=None):
+        """Check whether a file (optionally this exact version of it) is indexed"""
+        entry = self.files.get(filename)
+        return entry is not None and (fingerprint is None or entry[0] == fingerprint)
+
+    def add_file(self, filename, fileobj, fingerprint=None):
+        """Extract, chunk and index a file, replacing any earlier version; returns the chunk count"""
+        self.remove_file(filename)
+        chunk_ids = []
+        for position, text in enumerate(chunk_text(extract_text(filename, fileobj))):
+            chunk_id = self.next_chunk_id
+            self.next_chunk_id += 1
+            self.chunks[chunk_id] = (filename, position, text)
+            self.index.add(chunk_id, text)
+            chunk_ids.append(chunk_id)
+        self.files[filename] = (fingerprint, chunk_ids)
+        return len(chunk_ids)
+
+    def remove_file(self, filename):
+        """Drop a file and its chunks"""
+        entry = self.files.pop(filename, None)
+        if entry is None:
+            return
+        for chunk_id in entry[1]:
+            _, _, text = self.chunks.pop(chunk_id)
+            self.index.remove(chunk_id, text)
+
+    def retrieve(self, query, max_tokens, top_k=FILE_RETRIEVAL_TOP_K):
+        """Get the (filename, text) chunks most relevant to query that fit in max_tokens
+
+        Falls back to the opening chunk of each file when nothing matches, so
+        prompts like "summarize this" still see the document.
+        """
+        ranked = [chunk_id for chunk_id, _ in self.index.search(query, top_k)]
+        if not ranked:
+            ranked = [chunk_ids[0] for _, chunk_ids in self.files.values() if chunk_ids]
+        selected = []
+        remaining = max_tokens
+        for chunk_id in ranked:
+            filename, position, text = self.chunks[chunk_id]
+            cost = estimate_tokens(text) + 8
+            if cost > remaining:
+                continue
+            selected.append((filename, position, text))
+            remaining -= cost
+        # Present chunks in document order
+        selected.sort(key=lambda chunk: (chunk[0], chunk[1]))
+        return [(filename, text) for filename, _, text in selected]
@@ -0,0 +1,233 @@
+"""
+Async Groq request layer for Phin AI Assistant
+Runs a single background event loop per process so every session shares one
+pooled AsyncGroq client instead of blocking its script thread on a sync client
+"""
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from router import router
+from rate_limiter import rate_limiter, QueueStatus
+from prompt_builder import message_tokens
+from config import (
+    GROQ_API_KEY, GROQ_BASE_URL, MAX_CONCURRENT_LLM_CALLS,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+    GROQ_CONNECT_TIMEOUT, GROQ_READ_TIMEOUT, BLOCKING_IO_WORKERS, RATE_LIMIT_COMPLETION_ESTIMATE
+)
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_llm_slots = None
+_STREAM_END = object()
+
+def get_loop():
+    """Get the shared event loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            # Blocking helpers (web search, file/memory assembly) run via to_thread on this pool
+            loop.set_default_executor(ThreadPoolExecutor(BLOCKING_IO_WORKERS, thread_name_prefix="groq-io"))
+            threading.Thread(target=loop.run_forever, name="groq-event-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop and return a concurrent future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared loop and wait for its result"""
+    return submit(coro).result(timeout)
+
+def _create_http_client():
+    """Create the shared keep-alive connection pool, using HTTP/2 when h2 is installed"""
+    import httpx
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(GROQ_READ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+    except ImportError:
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def get_client():
+    """Get the pooled AsyncGroq client (only call from the shared loop)"""
+    global _client, _llm_slots
+    if _client is None:
+        # groq (and its pydantic models) is the slowest import in the app, so it's
+        # deferred until the first request or prewarm()
+        import groq
+        _client = groq.AsyncGroq(
+            api_key=GROQ_API_KEY,
+            base_url=GROQ_BASE_URL,
+            http_client=_create_http_client(),
+            # The router retries on other models instead of the SDK retrying the same one
+            max_retries=0
+        )
+        _llm_slots = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+    return _client
+
+def prewarm():
+    """Create the client on the shared loop in the background so the first request doesn't pay for it"""
+    loop = get_loop()
+    loop.call_soon_threadsafe(get_client)
+
+def as_model_list(models):
+    return [models] if isinstance(models, str) else list(models)
+
+def estimate_request_tokens(messages, max_tokens):
+    """Tokens to reserve against the rate limits: the prompt plus a typical reply"""
+    return sum(message_tokens(message) for message in messages) + min(max_tokens, RATE_LIMIT_COMPLETION_ESTIMATE)
+
+def used_tokens(usage):
+    """Total tokens from a usage report, if it has them"""
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+async def create_completion(messages, models, temperature, max_tokens, session=None, on_queued=None):
+    """Request a full (non-streamed) completion, falling back across models; returns (text, model)
+
+    session and on_queued are passed to rate_limiter.acquire.
+    """
+    client = get_client()
+    tokens = estimate_request_tokens(messages, max_tokens)
+    
+    async def attempt(model, admitted):
+        permit = await rate_limiter.acquire(model, tokens, session, on_queued)
+        used = 0
+        try:
+            async with _llm_slots:
+                admitted()
+                completion = await client.chat.completions.create(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            used = used_tokens(completion.usage)
+            return completion.choices[0].message.content
+        finally:
+            permit.settle(used)
+    
+    model, text = await router.run(as_model_list(models), attempt)
+    return text, model
+
+def complete_chat(messages, models, temperature, max_tokens, session=None, on_queued=None):
+    """Blocking wrapper around create_completion for the Streamlit script thread
+
+    on_queued(QueueStatus) is called in this thread while the request waits on the rate limiter.
+    """
+    if on_queued is None:
+        return run(create_completion(messages, models, temperature, max_tokens, session))
+    statuses = queue.Queue()
+    future = submit(create_completion(messages, models, temperature, max_tokens, session, statuses.put))
+    future.add_done_callback(lambda _: statuses.put(_STREAM_END))
+    while True:
+        status = statuses.get()
+        if status is _STREAM_END:
+            return future.result()
+        on_queued(status)
+
+async def open_stream(messages, model, temperature, max_tokens, tokens=None, session=None, on_queued=None,
+                      admitted=None):
+    """Wait for the rate limiter, start a streamed completion and wait for its first chunk
+
+    Returns (stream, iterator, first chunk or None, permit); the caller holds
+    an LLM slot until it passes the result to close_stream. admitted() is
+    called once the request is past the limiter and holds a slot.
+    """
+    client = get_client()
+    if tokens is None:
+        tokens = estimate_request_tokens(messages, max_tokens)
+    permit = await rate_limiter.acquire(model, tokens, session, on_queued)
+    try:
+        await _llm_slots.acquire()
+    except BaseException:
+        permit.settle(0)
+        raise
+    if admitted is not None:
+        admitted()
+    stream = None
+    try:
+        stream = await client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        iterator = stream.__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return stream, iterator, first, permit
+    except BaseException:
+        await close_stream((stream, None, None, permit), 0)
+        raise
+
+async def close_stream(opened, used=None):
+    """Close a stream from open_stream, settle its rate limit permit and give back its LLM slot"""
+    stream, _, _, permit = opened
+    try:
+        if stream is not None:
+            await stream.close()
+    finally:
+        permit.settle(used)
+        _llm_slots.release()
+
+def stream_chat(messages, models, temperature, max_tokens, session=None, on_queued=None):
+    """Yield streamed completion chunks in the calling thread as the loop receives them
+
+    models is a model or a list to fall back across (see router.Router.run);
+    a stream that fails after its first chunk is not retried. on_queued(QueueStatus)
+    is called in this thread while the request waits on the rate limiter.
+    """
+    chunks = queue.Queue()
+    tokens = estimate_request_tokens(messages, max_tokens)
+    
+    async def pump():
+        try:
+            _, opened = await router.run(
+                as_model_list(models),
+                lambda model, admitted: open_stream(
+                    messages, model, temperature, max_tokens, tokens, session,
+                    chunks.put if on_queued is not None else None, admitted
+                ),
+                streaming=True, discard=close_stream
+            )
+            stream, iterator, first, _ = opened
+            used = None
+            try:
+                if first is not None:
+                    chunks.put(first)
+                async for chunk in iterator:
+                    used = used_tokens(getattr(getattr(chunk, 'x_groq', None), 'usage', None)) or used
+                    chunks.put(chunk)
+            finally:
+                await close_stream(opened, used)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(_STREAM_END)
+    
+    future = submit(pump())
+    try:
+        while True:
+            item = chunks.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, QueueStatus):
+                on_queued(item)
+                continue
+            yield item
+    finally:
+        # Stop generating if the consumer went away (e.g. the script was rerun)
+        future.cancel()
@@ -1,33 +1,168 @@
 """
 Memory management for Phin AI Assistant
-Handles conversation memory and context persistence
+Handles per-user conversation memory and its persistence in SQLite
 """
+import atexit
+import copy
+import hashlib
+import hmac
 import json
 import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
+from tokens import estimate_tokens
+from retrieval import BM25Index
+from config import (
+    MEMORY_WRITE_BEHIND, MEMORY_FLUSH_INTERVAL, MEMORY_DB_PATH, MEMORY_CACHE_SIZE,
+    MEMORY_MAX_TOPICS, MEMORY_MAX_FACTS, MEMORY_RETRIEVAL_TOPICS, MEMORY_RETRIEVAL_FACTS,
+    MEMORY_SECRET, MEMORY_SECRET_FILE
+)
+
+IMPORTANT_KEYWORDS = ["my name is", "i am", "i work", "i study", "i live"]
+# Each keyword followed by the rest of its sentence
+_EXTRACTION_PATTERN = re.compile(r"\b(i like|i prefer|my name is|i am|i work|i study|i live)\b([^.]*)")
+
+class MemoryStore:
+    """SQLite (WAL) store holding one memory document per user
+
+    Writes go through update(), which merges under the database's write lock,
+    so several processes can change the same user's memory without losing
+    each other's changes.
+    """
+    
+    def __init__(self, db_path=MEMORY_DB_PATH, flush_interval=MEMORY_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.local = threading.local()
+        self.dirty = set()
+        self.dirty_lock = threading.Lock()
+        self.flusher = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS memories (
+                    user_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+        atexit.register(self.flush_all)
+    
+    def connection(self):
+        """Get this thread's connection (sqlite3 connections are not shared across threads)"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30)
+            # WAL lets readers proceed while another session or process writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+    
+    def load(self, user_id):
+        """Load a user's memory document and when it was written, or (None, None) if they have none yet"""
+        try:
+            row = self.connection().execute(
+                "SELECT data, updated_at FROM memories WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            return (json.loads(row[0]), row[1]) if row else (None, None)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error loading memory: {e}")
+            return None, None
+    
+    def stamp(self, user_id):
+        """Get when a user's memory was last written, or None"""
+        row = self.connection().execute(
+            "SELECT updated_at FROM memories WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def update(self, user_id, change):
+        """Rewrite a user's memory document while holding the write lock
+
+        change gets the stored document (or None) and returns the one to write.
+        Returns (document written, updated_at before, updated_at after).
+        """
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT data, updated_at FROM memories WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            data = change(json.loads(row[0]) if row else None)
+            updated_at = datetime.now().isoformat()
+            db.execute(
+                "INSERT INTO memories (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (user_id, json.dumps(data, separators=(',', ':')), updated_at)
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        return data, row[1] if row else None, updated_at
+    
+    def delete(self, user_id):
+        """Remove a user's memory document"""
+        with self.connection() as db:
+            db.execute("DELETE FROM memories WHERE user_id = ?", (user_id,))
+    
+    def mark_dirty(self, memory):
+        """Queue a memory for the background flusher"""
+        with self.dirty_lock:
+            self.dirty.add(memory)
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.flush_loop, name="memory-flusher", daemon=True)
+                self.flusher.start()
+    
+    def flush_all(self):
+        """Write every pending memory now"""
+        with self.dirty_lock:
+            pending, self.dirty = self.dirty, set()
+        for memory in pending:
+            memory.flush()
+    
+    def flush_loop(self):
+        """Flush dirty memories every flush_interval seconds"""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush_all()
 
 class ConversationMemory:
-    def __init__(self, memory_file="memory/conversation_memory.json"):
-        self.memory_file = memory_file
-        self.memory_dir = os.path.dirname(memory_file)
-        self.ensure_memory_dir()
+    def __init__(self, user_id, store=None, write_behind=MEMORY_WRITE_BEHIND,
+                 max_topics=MEMORY_MAX_TOPICS, max_facts=MEMORY_MAX_FACTS):
+        self.user_id = user_id
+        self.store = store or get_memory_store()
+        self.write_behind = write_behind
+        self.max_topics = max_topics
+        self.max_facts = max_facts
+        self.indexes = None  # Built on the first relevance query, then kept up to date
+        self.entry_ids = {"topic": [], "fact": []}
+        self.next_entry_id = 0
+        self.known_facts = None  # Set of fact texts, for de-duplication
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.pending = []  # Changes not written yet, replayed onto the stored document when flushing
+        self.synced_at = None  # updated_at of the stored document this copy reflects
+        self.version = 0  # Bumped on every mutation to invalidate the rendered context
+        self.context_cache = {}  # max_tokens -> (version, rendered context)
+        self.profile_cache = {}  # max_tokens -> (version, fitted profile sections, tokens left)
         self.memory_data = self.load_memory()
     
-    def ensure_memory_dir(self):
-        """Ensure memory directory exists"""
-        if not os.path.exists(self.memory_dir):
-            os.makedirs(self.memory_dir)
-    
     def load_memory(self) -> Dict[str, Any]:
-        """Load memory from file"""
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return self.get_default_memory()
-        return self.get_default_memory()
+        """Load memory from the store"""
+        data, self.synced_at = self.store.load(self.user_id)
+        return data or self.get_default_memory()
     
     def get_default_memory(self) -> Dict[str, Any]:
         """Get default memory structure"""
@@ -40,17 +175,98 @@ class ConversationMemory:
         }
     
     def save_memory(self):
-        """Save memory to file"""
-        self.memory_data["last_updated"] = datetime.now().isoformat()
+        """Save memory (deferred to the background flusher in write-behind mode)"""
+        with self.lock:
+            self.memory_data["last_updated"] = datetime.now().isoformat()
+            self.version += 1
+        if self.write_behind:
+            self.store.mark_dirty(self)
+        else:
+            self.flush()
+    
+    def flush(self):
+        """Write pending changes to the store, merged into whatever other processes wrote"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                changes, self.pending = self.pending, []
+            try:
+                data, previous, updated_at = self.store.update(
+                    self.user_id, lambda stored: self.merge(stored, changes)
+                )
+            except Exception as e:
+                with self.lock:
+                    self.pending = changes + self.pending
+                print(f"Error saving memory: {e}")
+                return
+            with self.lock:
+                if previous != self.synced_at:
+                    # Someone else wrote since this copy was loaded: take their changes too
+                    self.adopt(self.merge(data, self.pending))
+                self.synced_at = updated_at
+    
+    def refresh(self):
+        """Pick up changes another process has written since this copy was loaded or flushed"""
         try:
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.memory_data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving memory: {e}")
+            stamp = self.store.stamp(self.user_id)
+        except sqlite3.Error as e:
+            print(f"Error checking memory: {e}")
+            return
+        with self.lock:
+            if stamp == self.synced_at:
+                return
+        if self.pending:
+            # Flushing merges both ways
+            self.flush()
+            return
+        data, stamp = self.store.load(self.user_id)
+        with self.lock:
+            self.adopt(self.merge(data, self.pending))
+            self.synced_at = stamp
+    
+    def merge(self, data, changes):
+        """Replay changes onto a copy of a stored memory document"""
+        data = copy.deepcopy(data) if data else self.get_default_memory()
+        for change in changes:
+            kind = change[0]
+            if kind == "clear":
+                data = self.get_default_memory()
+            elif kind == "preference":
+                data["user_preferences"][change[1]] = change[2]
+            elif kind == "context":
+                data["user_context"][change[1]] = change[2]
+            elif kind == "topic":
+                data["conversation_topics"] = (data["conversation_topics"] + [change[1]])[-self.max_topics:]
+            elif kind == "fact":
+                if all(entry["fact"] != change[1]["fact"] for entry in data["important_facts"]):
+                    data["important_facts"] = (data["important_facts"] + [change[1]])[-self.max_facts:]
+        data["last_updated"] = datetime.now().isoformat()
+        return data
+    
+    def adopt(self, data):
+        """Replace this copy's memory with a merged document (caller holds the lock)"""
+        self.memory_data = data
+        self.indexes = None
+        self.known_facts = None
+        self.version += 1
+    
+    def clear(self):
+        """Forget everything stored for this user"""
+        with self.lock:
+            self.memory_data = self.get_default_memory()
+            self.indexes = None
+            self.known_facts = None
+            self.pending.append(("clear",))
+        self.save_memory()
     
     def add_user_preference(self, key: str, value: Any):
         """Add or update user preference"""
-        self.memory_data["user_preferences"][key] = value
+        with self.lock:
+            if self.memory_data["user_preferences"].get(key) == value:
+                return
+            self.memory_data["user_preferences"][key] = value
+            self.pending.append(("preference", key, value))
         self.save_memory()
     
     def get_user_preference(self, key: str, default=None):
@@ -64,106 +280,326 @@ class ConversationMemory:
             "context": context,
             "timestamp": datetime.now().isoformat()
         }
-        self.memory_data["conversation_topics"].append(topic_entry)
-        
-        # Keep only last 50 topics
-        if len(self.memory_data["conversation_topics"]) > 50:
-            self.memory_data["conversation_topics"] = self.memory_data["conversation_topics"][-50:]
+        with self.lock:
+            self.memory_data["conversation_topics"].append(topic_entry)
+            self.pending.append(("topic", topic_entry))
+            self.index_entry("topic", topic)
+            
+            # Keep only the most recent topics
+            if len(self.memory_data["conversation_topics"]) > self.max_topics:
+                self.unindex_entries("topic", self.memory_data["conversation_topics"], self.max_topics)
+                self.memory_data["conversation_topics"] = self.memory_data["conversation_topics"][-self.max_topics:]
         
         self.save_memory()
     
-    def add_important_fact(self, fact: str, category: str = "general"):
-        """Add important fact to memory"""
+    def add_important_fact(self, fact: str, category: str = "general") -> bool:
+        """Add important fact to memory, returning False if it is already known"""
         fact_entry = {
             "fact": fact,
             "category": category,
             "timestamp": datetime.now().isoformat()
         }
-        self.memory_data["important_facts"].append(fact_entry)
-        
-        # Keep only last 100 facts
-        if len(self.memory_data["important_facts"]) > 100:
-            self.memory_data["important_facts"] = self.memory_data["important_facts"][-100:]
+        with self.lock:
+            if self.known_facts is None:
+                self.known_facts = {entry["fact"] for entry in self.memory_data["important_facts"]}
+            if fact in self.known_facts:
+                return False
+            self.known_facts.add(fact)
+            self.memory_data["important_facts"].append(fact_entry)
+            self.pending.append(("fact", fact_entry))
+            self.index_entry("fact", fact)
+            
+            # Keep only the most recent facts
+            if len(self.memory_data["important_facts"]) > self.max_facts:
+                self.unindex_entries("fact", self.memory_data["important_facts"], self.max_facts)
+                for entry in self.memory_data["important_facts"][:-self.max_facts]:
+                    self.known_facts.discard(entry["fact"])
+                self.memory_data["important_facts"] = self.memory_data["important_facts"][-self.max_facts:]
         
         self.save_memory()
+        return True
+    
+    def build_index(self):
+        """Index every topic and fact for relevance retrieval (caller holds the lock)"""
+        self.indexes = {"topic": BM25Index(), "fact": BM25Index()}
+        self.entry_ids = {"topic": [], "fact": []}
+        for entry in self.memory_data["conversation_topics"]:
+            self.index_entry("topic", entry["topic"])
+        for entry in self.memory_data["important_facts"]:
+            self.index_entry("fact", entry["fact"])
+    
+    def index_entry(self, kind, text):
+        """Add a new topic or fact to the retrieval index, if it has been built"""
+        if self.indexes is None:
+            return
+        entry_id = self.next_entry_id
+        self.next_entry_id += 1
+        self.entry_ids[kind].append(entry_id)
+        self.indexes[kind].add(entry_id, text)
+    
+    def unindex_entries(self, kind, entries, keep):
+        """Drop entries that are about to be trimmed from the index"""
+        if self.indexes is None:
+            return
+        trimmed = len(entries) - keep
+        ids = self.entry_ids[kind]
+        for entry_id, entry in zip(ids[:trimmed], entries[:trimmed]):
+            self.indexes[kind].remove(entry_id, entry[kind])
+        del ids[:trimmed]
+    
+    def retrieve(self, query, kind, k):
+        """Get the positions of the k entries of one kind most relevant to query"""
+        if self.indexes is None:
+            self.build_index()
+        ids = self.entry_ids[kind]
+        # IDs are handed out in insertion order, so an entry's position is a bisect away
+        return [bisect_left(ids, entry_id) for entry_id, _ in self.indexes[kind].search(query, k)]
     
     def update_user_context(self, key: str, value: Any):
         """Update user context information"""
-        self.memory_data["user_context"][key] = {
-            "value": value,
-            "timestamp": datetime.now().isoformat()
-        }
+        with self.lock:
+            self.memory_data["user_context"][key] = {
+                "value": value,
+                "timestamp": datetime.now().isoformat()
+            }
+            self.pending.append(("context", key, self.memory_data["user_context"][key]))
         self.save_memory()
     
-    def get_memory_context(self) -> str:
-        """Get formatted memory context for AI"""
+    def get_memory_context(self, max_tokens=None, query=None) -> str:
+        """Get formatted memory context for AI, optionally fitted to a token budget
+
+        With a query, topics and facts are the entries most relevant to it
+        rather than the most recent ones; preferences and user context don't
+        depend on it, so they're rendered once per version either way.
+        """
+        with self.lock:
+            if query:
+                (preferences, user_context), remaining = self.get_fitted_profile(max_tokens)
+                topics, facts = self.get_entry_sections(query)
+                if max_tokens is not None:
+                    # Facts before topics, each already in order of relevance
+                    facts, remaining = self.fit_section(facts, remaining)
+                    topics, remaining = self.fit_section(topics, remaining)
+                return self.join_sections([preferences, topics, facts, user_context])
+            cached = self.context_cache.get(max_tokens)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            if cached is None and len(self.context_cache) >= 4:
+                self.context_cache.clear()
+            context = self.render_memory_context(max_tokens)
+            self.context_cache[max_tokens] = (self.version, context)
+            return context
+    
+    def get_profile_sections(self):
+        """Get the preference and user context sections (caller holds the lock)"""
+        return [
+            ("User Preferences:", [
+                f"- {key}: {value}" for key, value in self.memory_data["user_preferences"].items()
+            ]),
+            ("\nUser Context:", [
+                f"- {key}: {data['value']}" for key, data in self.memory_data["user_context"].items()
+            ])
+        ]
+    
+    def get_fitted_profile(self, max_tokens):
+        """Get the profile sections fitted to max_tokens and the tokens they leave, cached by version"""
+        cached = self.profile_cache.get(max_tokens)
+        if cached is not None and cached[0] == self.version:
+            return cached[1], cached[2]
+        if cached is None and len(self.profile_cache) >= 4:
+            self.profile_cache.clear()
+        sections = self.get_profile_sections()
+        remaining = max_tokens
+        if max_tokens is not None:
+            fitted = []
+            for section in sections:
+                section, remaining = self.fit_section(section, remaining)
+                fitted.append(section)
+            sections = fitted
+        self.profile_cache[max_tokens] = (self.version, sections, remaining)
+        return sections, remaining
+    
+    def get_entry_sections(self, query=None):
+        """Get the topic and fact sections: the most relevant to query, or the most recent (caller holds the lock)"""
+        if query:
+            topics = self.memory_data["conversation_topics"]
+            facts = self.memory_data["important_facts"]
+            topics = [topics[i] for i in self.retrieve(query, "topic", MEMORY_RETRIEVAL_TOPICS)]
+            facts = [facts[i] for i in self.retrieve(query, "fact", MEMORY_RETRIEVAL_FACTS)]
+        else:
+            topics = self.memory_data["conversation_topics"][-10:]
+            facts = self.memory_data["important_facts"][-20:]
+        return [
+            # Recent (or, with a query, relevant) conversation topics
+            ("\nRelevant Conversation Topics:" if query else "\nRecent Conversation Topics:", [
+                f"- {topic['topic']}" for topic in topics
+            ]),
+            ("\nImportant Facts:", [
+                f"- {fact['fact']} ({fact['category']})" for fact in facts
+            ])
+        ]
+    
+    def get_context_sections(self, query=None):
+        """Get the (header, lines) sections of the memory context (caller holds the lock)"""
+        preferences, user_context = self.get_profile_sections()
+        topics, facts = self.get_entry_sections(query)
+        return [preferences, topics, facts, user_context]
+    
+    def fit_section(self, section, remaining, newest_first=False):
+        """Keep the leading (or, with newest_first, trailing) lines of a section that fit; returns (section, tokens left)"""
+        header, lines = section
+        fitted = []
+        for line in (reversed(lines) if newest_first else lines):
+            cost = estimate_tokens(line) + (0 if fitted else estimate_tokens(header))
+            if cost > remaining:
+                break
+            fitted.append(line)
+            remaining -= cost
+        if newest_first:
+            fitted.reverse()
+        return (header, fitted), remaining
+    
+    def fit_sections(self, sections, max_tokens):
+        """Keep the most useful lines of each section that fit in max_tokens (the newest topics and facts)"""
+        remaining = max_tokens
+        fitted = list(sections)
+        # Preferences and user context first, then facts and topics
+        for index, newest_first in ((0, False), (3, False), (2, True), (1, True)):
+            fitted[index], remaining = self.fit_section(sections[index], remaining, newest_first)
+        return fitted
+    
+    def render_memory_context(self, max_tokens=None) -> str:
+        """Format memory data as prompt context (caller holds the lock)"""
+        sections = self.get_context_sections()
+        if max_tokens is not None:
+            sections = self.fit_sections(sections, max_tokens)
+        return self.join_sections(sections)
+    
+    def join_sections(self, sections) -> str:
+        """Join (header, lines) sections into the context string"""
         context_parts = []
-        
-        # User preferences
-        if self.memory_data["user_preferences"]:
-            context_parts.append("User Preferences:")
-            for key, value in self.memory_data["user_preferences"].items():
-                context_parts.append(f"- {key}: {value}")
-        
-        # Recent conversation topics
-        recent_topics = self.memory_data["conversation_topics"][-10:]
-        if recent_topics:
-            context_parts.append("\nRecent Conversation Topics:")
-            for topic in recent_topics:
-                context_parts.append(f"- {topic['topic']}")
-        
-        # Important facts
-        recent_facts = self.memory_data["important_facts"][-20:]
-        if recent_facts:
-            context_parts.append("\nImportant Facts:")
-            for fact in recent_facts:
-                context_parts.append(f"- {fact['fact']} ({fact['category']})")
-        
-        # User context
-        if self.memory_data["user_context"]:
-            context_parts.append("\nUser Context:")
-            for key, data in self.memory_data["user_context"].items():
-                context_parts.append(f"- {key}: {data['value']}")
-        
+        for header, lines in sections:
+            if lines:
+                context_parts.append(header)
+                context_parts.extend(lines)
         return "\n".join(context_parts) if context_parts else ""
     
-    def analyze_and_store_conversation(self, messages: List[Dict[str, str]]):
-        """Analyze conversation and extract important information"""
-        if not messages:
-            return
-        
-        # Get recent messages for analysis
-        recent_messages = messages[-5:] if len(messages) > 5 else messages
+    def analyze_and_store_conversation(self, messages: List[Dict[str, str]], start: int = 0) -> int:
+        """Extract preferences, facts and topics from messages not analyzed yet
+
+        Only messages[start:] are scanned; the returned cursor is the start
+        for the next call.
+        """
+        if start > len(messages):
+            # The conversation was cleared or replaced since the last call
+            start = 0
         
-        # Extract topics and facts (simple keyword-based approach)
-        for message in recent_messages:
-            if message["role"] == "user":
-                content = message["content"].lower()
-                
-                # Detect preferences
-                if "i like" in content or "i prefer" in content:
-                    # Simple preference extraction
-                    if "i like" in content:
-                        pref = content.split("i like")[1].split(".")[0].strip()
-                        self.add_user_preference("likes", pref)
-                    elif "i prefer" in content:
-                        pref = content.split("i prefer")[1].split(".")[0].strip()
-                        self.add_user_preference("prefers", pref)
-                
-                # Detect important statements
-                important_keywords = ["my name is", "i am", "i work", "i study", "i live"]
-                for keyword in important_keywords:
-                    if keyword in content:
-                        fact = content.split(keyword)[1].split(".")[0].strip()
-                        self.add_important_fact(f"User {keyword} {fact}", "personal")
-                        break
+        for message in messages[start:]:
+            if message["role"] != "user":
+                continue
+            
+            # One pass over the message finds the first occurrence of every keyword
+            content = message["content"].lower()
+            found = {}
+            for match in _EXTRACTION_PATTERN.finditer(content):
+                found.setdefault(match.group(1), match.group(2).strip())
+            
+            # Detect preferences
+            if "i like" in found:
+                self.add_user_preference("likes", found["i like"])
+            elif "i prefer" in found:
+                self.add_user_preference("prefers", found["i prefer"])
+            
+            # Detect important statements
+            for keyword in IMPORTANT_KEYWORDS:
+                if keyword in found:
+                    self.add_important_fact(f"User {keyword} {found[keyword]}", "personal")
+                    break
         
-        # Add conversation topic based on last user message
-        if messages and messages[-1]["role"] == "user":
-            last_message = messages[-1]["content"]
+        # Add conversation topic based on the newest user message (the reply usually follows it)
+        last_message = next(
+            (message["content"] for message in reversed(messages[start:]) if message["role"] == "user"), None
+        )
+        if last_message:
             # Extract first sentence as topic
             topic = last_message.split(".")[0][:100]
             self.add_conversation_topic(topic)
+        
+        return len(messages)
+
+_store = None
+_memories = OrderedDict()
+# Memories pushed out of _memories that a session or background task still holds
+_evicted = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+
+def get_memory_store() -> MemoryStore:
+    """Get the process-wide memory store"""
+    global _store
+    with _registry_lock:
+        if _store is None:
+            _store = MemoryStore()
+        return _store
+
+def get_conversation_memory(user_id) -> ConversationMemory:
+    """Get the memory for a user, shared by all of their sessions in this process
+
+    It's refreshed on each call, so changes written by other processes show up.
+    """
+    store = get_memory_store()
+    evicted = []
+    with _registry_lock:
+        memory = _memories.get(user_id)
+        if memory is None:
+            # Still in use somewhere after eviction: keep using that copy rather than loading a second
+            memory = _evicted.pop(user_id, None) or ConversationMemory(user_id, store)
+            _memories[user_id] = memory
+        _memories.move_to_end(user_id)
+        # Keep only recently active users loaded
+        while len(_memories) > MEMORY_CACHE_SIZE:
+            evicted_id, evicted_memory = _memories.popitem(last=False)
+            _evicted[evicted_id] = evicted_memory
+            evicted.append(evicted_memory)
+    for evicted_memory in evicted:
+        evicted_memory.flush()
+    memory.refresh()
+    return memory
+
+_secret = None
+_secret_lock = threading.Lock()
+
+def get_memory_secret() -> bytes:
+    """Get the key user tokens are signed with: MEMORY_SECRET, or a random one kept in MEMORY_SECRET_FILE"""
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            if MEMORY_SECRET:
+                _secret = MEMORY_SECRET.encode()
+            else:
+                directory = os.path.dirname(MEMORY_SECRET_FILE)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                try:
+                    # Only this user can read it, and another process creating it first wins
+                    fd = os.open(MEMORY_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    with os.fdopen(fd, "w") as f:
+                        f.write(secrets.token_hex(32))
+                except FileExistsError:
+                    pass
+                with open(MEMORY_SECRET_FILE, "r") as f:
+                    _secret = f.read().strip().encode()
+        return _secret
+
+def _signature(user_id):
+    return hmac.new(get_memory_secret(), user_id.encode(), hashlib.sha256).hexdigest()
+
+def make_user_token(user_id) -> str:
+    """Sign a user ID for the page URL, so only IDs this server handed out are accepted back"""
+    return f"{user_id}.{_signature(user_id)}"
 
-# Global memory instance
-conversation_memory = ConversationMemory()
+def user_id_from_token(token):
+    """Get the user ID a make_user_token token carries, or None if it's missing or wasn't signed here"""
+    user_id, _, signature = (token or "").rpartition(".")
+    if user_id and hmac.compare_digest(signature, _signature(user_id)):
+        return user_id
+    return None
@@ -9,8 +9,14 @@ from ui_components import (
     render_voice_input, render_chat_messages, auto_save_chat
 )
 from chat_handler import handle_chat_input, handle_voice_input
-from config import PAGE_TITLE, PAGE_ICON, LAYOUT, AVAILABLE_MODELS, DEFAULT_SYSTEM_PROMPT, GROQ_API_KEY
+from summarizer import new_summary
+from file_index import FileIndex
+from chat_store import new_chat_id
+from memory import make_user_token, user_id_from_token
+import groq_client
+from config import PAGE_TITLE, PAGE_ICON, LAYOUT, AVAILABLE_MODELS, DEFAULT_SYSTEM_PROMPT, DEFAULT_ANIMATION_MODE, RESPONSE_CACHE_ENABLED, CHAT_RENDER_WINDOW, SHOW_REASONING, ROUTER_AUTO_ROUTE, GROQ_API_KEY
 import os
+import uuid
 
 # Debug: Print environment variables and API key status
 print("Environment Variables:", os.environ)
@@ -25,17 +31,36 @@ def init_session_state():
         'temperature': 0.7,
         'max_tokens': 2048,
         'custom_system_prompt': DEFAULT_SYSTEM_PROMPT,
-        'uploaded_files_content': {},
+        'file_index': FileIndex(),
+        'uploader_generation': 0,
+        'chat_id': new_chat_id(),
         'chat_ratings': {},
+        'last_saved_count': 0,
+        'chat_history_page': 0,
+        'render_window': CHAT_RENDER_WINDOW,
         'voice_enabled': False,
         'messages': [],
         'selected_language': 'en',
-        'streaming_enabled': True
+        'streaming_enabled': True,
+        'show_reasoning': SHOW_REASONING,
+        'auto_route': ROUTER_AUTO_ROUTE,
+        'animation_mode': DEFAULT_ANIMATION_MODE,
+        'use_response_cache': RESPONSE_CACHE_ENABLED,
+        'memory_cursor': 0,
+        'conversation_summary': new_summary(),
+        'summary_job': None
     }
     
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
+    
+    # Identify the user so memory isn't shared between sessions. The URL carries the
+    # ID signed by the server, so a reload finds the same memory but an ID typed
+    # into the URL is never used
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = user_id_from_token(st.query_params.get('user')) or uuid.uuid4().hex
+        st.query_params['user'] = make_user_token(st.session_state.user_id)
 
 def main():
     """Main application function"""
@@ -76,6 +101,9 @@ def main():
     if st.session_state.messages:
         auto_save_chat()
     
+    # Create the Groq client in the background while the user reads the page
+    groq_client.prewarm()
+    
     # Chat input
     if prompt := st.chat_input("What would you like to know?"):
         handle_chat_input(prompt)
@@ -0,0 +1,113 @@
+"""
+Prompt assembly for Phin AI Assistant
+Fits the system prompt, memory, files, web results and chat history into the
+selected model's context window, packing the most valuable content first
+"""
+from functools import lru_cache
+from tokens import estimate_tokens
+from config import (
+    MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, PROMPT_TOKEN_CAP,
+    PROMPT_SAFETY_MARGIN, PROMPT_MESSAGE_OVERHEAD, PROMPT_BUDGET_SHARES
+)
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """Estimate tokens for a piece of text, cached so history messages are only counted once"""
+    return estimate_tokens(text)
+
+def message_tokens(message):
+    """Estimate the tokens a chat message costs, including framing"""
+    return count_tokens(message["content"]) + PROMPT_MESSAGE_OVERHEAD
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    # Scale by the text's own chars-per-token ratio, then trim any overshoot
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut]
+
+def get_context_window(model):
+    """Get the context window for a model"""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def plan_budget(model, max_tokens, system_prompt, prompt):
+    """Split the prompt budget for a turn across its sections
+
+    The system prompt and the user's prompt are always sent; memory, files
+    and search get fixed shares of what's left, and history gets the rest.
+    """
+    available = min(get_context_window(model) - max_tokens, PROMPT_TOKEN_CAP) - PROMPT_SAFETY_MARGIN
+    required = count_tokens(system_prompt) + count_tokens(prompt) + 2 * PROMPT_MESSAGE_OVERHEAD
+    flexible = max(0, available - required)
+    plan = {section: int(flexible * share) for section, share in PROMPT_BUDGET_SHARES.items()}
+    plan["total"] = available
+    plan["required"] = required
+    plan["flexible"] = flexible
+    return plan
+
+def format_file_context(file_chunks, max_tokens):
+    """Format retrieved (filename, text) file chunks, grouped under their file names"""
+    if not file_chunks or max_tokens <= 0:
+        return ""
+    context = "Relevant excerpts from uploaded files:\n"
+    remaining = max_tokens - count_tokens(context)
+    current_file = None
+    for filename, text in file_chunks:
+        entry = f"{text}\n"
+        if filename != current_file:
+            entry = f"\n--- {filename} ---\n{entry}"
+        cost = count_tokens(entry)
+        if cost > remaining:
+            break
+        context += entry
+        remaining -= cost
+        current_file = filename
+    return context if current_file else ""
+
+def format_search_context(search_results, max_tokens):
+    """Format web results, best first, until the budget runs out"""
+    if not search_results or max_tokens <= 0:
+        return ""
+    context = "\nWeb search results:\n"
+    remaining = max_tokens - count_tokens(context)
+    for idx, result in enumerate(search_results, 1):
+        line = truncate_to_tokens(f"{idx}. {result['title']}: {result['body']}", remaining) + "\n"
+        remaining -= count_tokens(line)
+        context += line
+        if remaining <= 0:
+            break
+    return context + "\n"
+
+def pack_history(history, max_tokens):
+    """Keep the newest messages that fit, returning them and the index of the oldest kept"""
+    remaining = max_tokens
+    start = len(history)
+    while start > 0:
+        cost = message_tokens(history[start - 1])
+        if cost > remaining:
+            break
+        remaining -= cost
+        start -= 1
+    return [{"role": msg["role"], "content": msg["content"]} for msg in history[start:]], start
+
+def build_messages(system_prompt, history, prompt, plan, context="", max_history_tokens=None):
+    """Assemble the final messages: system prompt, packed history, then the prompt with context
+
+    Returns the messages and the index of the oldest history message included.
+    """
+    user_content = f"{context}\n\n{prompt}" if context else prompt
+    used = plan["required"] + count_tokens(user_content) - count_tokens(prompt)
+    history_budget = plan["total"] - used
+    if max_history_tokens is not None:
+        history_budget = min(history_budget, max_history_tokens)
+    recent_messages, first_index = pack_history(history, history_budget)
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(recent_messages)
+    messages.append({"role": "user", "content": user_content})
+    return messages, first_index
@@ -0,0 +1,385 @@
+"""
+Client-side rate limiting for Phin AI Assistant
+Admits Groq requests through per-model token buckets for requests and tokens
+per minute, shared by every session in the process (or, with a state file,
+every process on the host). Waiting requests are served round-robin across
+sessions, and those that can't start before their deadline are turned away
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE,
+    MODEL_RATE_LIMITS, RATE_LIMIT_STATE_DB, RATE_LIMIT_STATE_MAX_ERRORS, RATE_LIMIT_QUEUE_DEADLINE
+)
+
+# Where a waiting request is in line (position 0 once it's admitted) and the seconds until its turn
+QueueStatus = namedtuple("QueueStatus", "position wait")
+
+class Overloaded(Exception):
+    """A request couldn't be admitted within its deadline"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"Too many requests for {model} right now; try again in about {max(1, round(retry_after))}s")
+        self.model = model
+        self.retry_after = retry_after
+
+class RequestTooLarge(Overloaded):
+    """A request needs more tokens than its model's per-minute limit, so it could never be admitted"""
+
+    def __init__(self, model, tokens, limit):
+        Exception.__init__(
+            self, f"This request needs about {tokens} tokens, more than the {limit} per minute allowed for {model}"
+        )
+        self.model = model
+        self.retry_after = None
+
+def refill(level, updated, limit, period, now):
+    """Level of a bucket holding up to limit that refills at limit per period"""
+    return min(limit, level + max(0.0, now - updated) * limit / period)
+
+def shortfall(levels, amounts, limits, period):
+    """Seconds until every bucket holds its amount"""
+    return max(max(0.0, amounts[kind] - levels[kind]) * period / limits[kind] for kind in amounts)
+
+class LocalBuckets:
+    """Bucket levels kept in this process"""
+    blocking = False
+
+    def __init__(self):
+        self.state = {}  # (model, kind) -> (level, updated)
+        self.lock = threading.Lock()
+
+    def update(self, model, limits, period, change):
+        """Call change with model's refilled levels ({kind: level}), store what it leaves and return its result"""
+        now = time.time()
+        with self.lock:
+            levels = {
+                kind: refill(*self.state.get((model, kind), (limit, now)), limit, period, now)
+                for kind, limit in limits.items()
+            }
+            result = change(levels)
+            for kind, level in levels.items():
+                self.state[(model, kind)] = (level, now)
+        return result
+
+class SqliteBuckets:
+    """Bucket levels in a SQLite file, so every process on the host draws on the same limits
+
+    Calls can wait on the file's lock, so RateLimiter makes them off the event loop.
+    """
+    blocking = True
+
+    def __init__(self, path, max_errors=RATE_LIMIT_STATE_MAX_ERRORS):
+        self.path = path
+        self.db = None
+        self.local = LocalBuckets()  # Used for calls the file can't serve
+        self.lock = threading.Lock()
+        self.max_errors = max_errors
+        self.errors = 0  # Failed calls in a row
+
+    def _get_db(self):
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Transactions are begun explicitly so the read-modify-write holds the write lock
+            db = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    model TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (model, kind)
+                )
+            """)
+            self.db = db
+        return self.db
+
+    def update(self, model, limits, period, change):
+        with self.lock:
+            if not self.path:
+                return self.local.update(model, limits, period, change)
+            try:
+                db = self._get_db()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    now = time.time()
+                    stored = {
+                        kind: (level, updated) for kind, level, updated in
+                        db.execute("SELECT kind, level, updated FROM buckets WHERE model = ?", (model,))
+                    }
+                    levels = {
+                        kind: refill(*stored.get(kind, (limit, now)), limit, period, now)
+                        for kind, limit in limits.items()
+                    }
+                    result = change(levels)
+                    db.executemany(
+                        "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                        [(model, kind, level, now) for kind, level in levels.items()]
+                    )
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                self.errors = 0
+                return result
+            except (OSError, sqlite3.Error) as e:
+                # A busy or briefly unavailable file only moves this call to the local buckets
+                self.errors += 1
+                if self.errors >= self.max_errors:
+                    print(f"Shared rate limits disabled after {self.errors} errors in a row, limiting per process: {e}")
+                    self.path = None
+                else:
+                    print(f"Shared rate limits unavailable, limiting per process for now: {e}")
+                return self.local.update(model, limits, period, change)
+
+class Permit:
+    """An admitted request's draw on the limits"""
+
+    def __init__(self, limiter, model, costs):
+        self.limiter = limiter
+        self.model = model
+        self.costs = costs
+        self.settled = False
+
+    def settle(self, used_tokens=None):
+        """Correct the token reservation to what the request used (0 if it failed; None keeps the estimate)
+
+        Call on the event loop; the correction is made in the background.
+        """
+        if self.settled:
+            return
+        self.settled = True
+        if used_tokens is not None and self.limiter.enabled:
+            self.limiter.spawn(self.limiter.credit(self.model, self.costs["tokens"] - used_tokens))
+
+class Waiter:
+    def __init__(self, session, costs, deadline, on_wait, future):
+        self.session = session
+        self.costs = costs
+        self.deadline = deadline  # On the event loop's clock
+        self.on_wait = on_wait
+        self.future = future
+        self.position = None
+
+class RateLimiter:
+    def __init__(self, enabled=RATE_LIMIT_ENABLED, requests_per_minute=RATE_LIMIT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=RATE_LIMIT_TOKENS_PER_MINUTE, model_limits=MODEL_RATE_LIMITS,
+                 state_db=RATE_LIMIT_STATE_DB, deadline=RATE_LIMIT_QUEUE_DEADLINE, period=60.0):
+        self.enabled = enabled
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits
+        self.deadline = deadline
+        self.period = period  # Seconds the per-minute limits refill over
+        self.buckets = SqliteBuckets(state_db) if state_db else LocalBuckets()
+        # Only touched on the event loop: model -> session -> waiters, sessions in round-robin order
+        self.queues = {}
+        self.locks = {}  # model -> asyncio.Lock held while admitting its requests
+        self.timers = {}  # model -> handle of its next dispatch
+        self.tasks = set()  # Background corrections and dispatches
+        self.counts = {}  # model -> {"admitted", "queued", "shed"}
+
+    def limits(self, model):
+        requests, tokens = self.model_limits.get(model, (self.requests_per_minute, self.tokens_per_minute))
+        return {"requests": requests, "tokens": tokens}
+
+    def count(self, model, outcome):
+        counts = self.counts.setdefault(model, {"admitted": 0, "queued": 0, "shed": 0})
+        counts[outcome] += 1
+
+    def lock(self, model):
+        lock = self.locks.get(model)
+        if lock is None:
+            lock = self.locks[model] = asyncio.Lock()
+        return lock
+
+    def spawn(self, coro):
+        """Run coro on the event loop without waiting for it"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def update(self, model, change):
+        """Call change with model's bucket levels (see LocalBuckets.update), off the event loop if that can block"""
+        limits = self.limits(model)
+        if self.buckets.blocking:
+            return await asyncio.to_thread(self.buckets.update, model, limits, self.period, change)
+        return self.buckets.update(model, limits, self.period, change)
+
+    async def acquire(self, model, tokens, session=None, on_wait=None, deadline=None):
+        """Wait until model's limits admit a request of about tokens tokens; returns its Permit
+
+        Waiting requests are admitted round-robin across sessions, so one busy
+        session can't hold up the rest. on_wait(QueueStatus) is called as the
+        request moves up the line, and once more with position 0 when it's
+        admitted. Raises Overloaded if it wouldn't start within deadline seconds,
+        and RequestTooLarge (an Overloaded) at once if it's bigger than the token limit.
+        """
+        permit = Permit(self, model, {"requests": 1, "tokens": tokens})
+        if not self.enabled:
+            return permit
+        limits = self.limits(model)
+        if tokens > limits["tokens"]:
+            # It would wait forever for a bucket that never holds enough
+            raise RequestTooLarge(model, tokens, limits["tokens"])
+        queue = self.queues.setdefault(model, OrderedDict())
+        if not queue:
+            async with self.lock(model):
+                if not queue and not await self.take(model, permit.costs):
+                    self.count(model, "admitted")
+                    return permit
+
+        loop = asyncio.get_running_loop()
+        waiter = Waiter(session, permit.costs, loop.time() + (deadline or self.deadline), on_wait, loop.create_future())
+        queue.setdefault(session, deque()).append(waiter)
+        self.count(model, "queued")
+        try:
+            await self.dispatch(model)
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Admitted just as the caller gave up: hand the draw back
+                self.spawn(self.credit(model, permit.costs["tokens"], requests=1))
+            else:
+                self.remove(model, waiter)
+                self.schedule(model)
+            raise
+        return permit
+
+    async def take(self, model, costs):
+        """Draw costs from model's buckets if they hold them all; returns 0.0, or seconds until they would"""
+        limits = self.limits(model)
+
+        def change(levels):
+            wait = shortfall(levels, costs, limits, self.period)
+            if not wait:
+                for kind, amount in costs.items():
+                    levels[kind] -= amount
+            return wait
+        return await self.update(model, change)
+
+    async def refund(self, model, tokens, requests=0):
+        """Return an over-estimate to model's buckets (negative amounts draw more)"""
+        limits = self.limits(model)
+
+        def change(levels):
+            levels["tokens"] = min(limits["tokens"], levels["tokens"] + tokens)
+            levels["requests"] = min(limits["requests"], levels["requests"] + requests)
+        await self.update(model, change)
+
+    async def credit(self, model, tokens, requests=0):
+        """Refund model's buckets, then admit who now fits"""
+        if not tokens and not requests:
+            return
+        await self.refund(model, tokens, requests)
+        if self.queues.get(model):
+            self.schedule(model)
+
+    def remove(self, model, waiter):
+        queue = self.queues.get(model, {})
+        waiters = queue.get(waiter.session)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.session]
+
+    def schedule(self, model, delay=0.0):
+        """Dispatch model's queue in delay seconds, unless a dispatch is already planned before then"""
+        loop = asyncio.get_running_loop()
+        timer = self.timers.get(model)
+        if timer is not None:
+            if timer.when() <= loop.time() + delay:
+                return
+            timer.cancel()
+        self.timers[model] = loop.call_later(delay, lambda: self.spawn(self.dispatch(model)))
+
+    async def dispatch(self, model):
+        """Admit waiting requests round-robin while the buckets allow, then update everyone's place in line
+
+        Requests that wouldn't be admitted before their deadline are turned away now
+        rather than when it passes.
+        """
+        async with self.lock(model):
+            timer = self.timers.pop(model, None)
+            if timer is not None:
+                timer.cancel()
+            queue = self.queues.get(model)
+            while queue:
+                session, waiters = next(iter(queue.items()))
+                waiter = waiters[0]
+                if waiter.future.done():
+                    # Its caller gave up and hasn't left the line yet
+                    self.remove(model, waiter)
+                    continue
+                if await self.take(model, waiter.costs):
+                    break
+                if waiter.future.done() or queue.get(session) is not waiters or waiters[0] is not waiter:
+                    # The caller gave up while the buckets were being read: hand the draw back
+                    await self.refund(model, waiter.costs["tokens"], waiter.costs["requests"])
+                    continue
+                waiters.popleft()
+                if waiters:
+                    queue.move_to_end(session)
+                else:
+                    del queue[session]
+                self.count(model, "admitted")
+                waiter.future.set_result(None)
+                if waiter.position and waiter.on_wait is not None:
+                    waiter.on_wait(QueueStatus(0, 0.0))
+            if not queue:
+                return
+
+            levels = await self.update(model, dict)
+            if not queue:
+                return
+            loop = asyncio.get_running_loop()
+            limits = self.limits(model)
+            ahead = {kind: 0 for kind in limits}
+            position = 0
+            first_wait = None
+            for waiter in list(self.service_order(queue)):
+                if waiter.future.done():
+                    self.remove(model, waiter)
+                    continue
+                wait = shortfall(levels, {kind: ahead[kind] + waiter.costs[kind] for kind in ahead}, limits, self.period)
+                if loop.time() + wait > waiter.deadline:
+                    self.remove(model, waiter)
+                    self.count(model, "shed")
+                    waiter.future.set_exception(Overloaded(model, wait))
+                    continue
+                for kind in ahead:
+                    ahead[kind] += waiter.costs[kind]
+                position += 1
+                if first_wait is None:
+                    first_wait = wait
+                if waiter.position != position and waiter.on_wait is not None:
+                    waiter.on_wait(QueueStatus(position, wait))
+                waiter.position = position
+            if queue and first_wait is not None:
+                # Another process may draw on shared buckets meanwhile, so this is only a first guess
+                self.schedule(model, max(first_wait, 0.05))
+
+    @staticmethod
+    def service_order(queue):
+        """Waiters in the order they'll be admitted: one per session in turn"""
+        lanes = list(queue.values())
+        for index in range(max(len(lane) for lane in lanes)):
+            for lane in lanes:
+                if index < len(lane):
+                    yield lane[index]
+
+    def stats(self):
+        """Get admitted, queued and shed counts and how many are waiting, per model"""
+        return {
+            model: dict(counts, waiting=sum(len(lane) for lane in list(self.queues.get(model, {}).values())))
+            for model, counts in list(self.counts.items())
+        }
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,204 @@
+"""
+Response cache for Phin AI Assistant
+Serves repeated prompts from an in-process LRU/TTL store backed by an
+optional SQLite tier shared by every Streamlit worker on the host
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    CACHE_TTL_SECONDS, CACHE_MAX_BYTES,
+    CACHE_MAX_TEMPERATURE, RESPONSE_CACHE_DB, CACHE_DB_MAX_BYTES
+)
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.]+$')
+
+def normalize_text(text):
+    """Normalize text so near-identical prompts share a cache key"""
+    text = _WHITESPACE.sub(' ', text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+class ResponseCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS,
+                 db_path=RESPONSE_CACHE_DB, db_max_bytes=CACHE_DB_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+        self.db_max_bytes = db_max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, response, size)
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        self.disk_writes = 0
+    
+    def is_cacheable(self, temperature):
+        """Only near-deterministic settings are worth caching"""
+        return temperature <= CACHE_MAX_TEMPERATURE
+    
+    def make_key(self, model, temperature, max_tokens, messages):
+        """Build a cache key from the request settings and the normalized messages sent to the model
+
+        messages is the final list, so the system prompt with its summary, the
+        history that fit and the prompt's context all count.
+        """
+        payload = json.dumps({
+            "model": model,
+            "temperature": round(temperature, 2),
+            "max_tokens": max_tokens,
+            "messages": [(message["role"], normalize_text(message["content"])) for message in messages]
+        }, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, key):
+        """Get a cached response, checking memory first and then disk"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+            
+            response = self._disk_get(key, now)
+            if response is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store(key, response, now + self.ttl)
+                return response
+            self.misses += 1
+            return None
+    
+    def put(self, key, response):
+        """Cache a response in memory and on disk"""
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self._store(key, response, expires_at)
+            self._disk_put(key, response, expires_at)
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+            db = self._get_db()
+            if db is not None:
+                with db:
+                    db.execute("DELETE FROM responses")
+    
+    def stats(self):
+        """Get hit/miss counters and cache size"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.current_bytes
+            }
+    
+    def _store(self, key, response, expires_at):
+        size = len(response.encode())
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (expires_at, response, size)
+        self.current_bytes += size
+        # Evict least recently used entries until we're back under the byte cap
+        while self.current_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+    
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.current_bytes -= size
+    
+    def _get_db(self):
+        """Open the shared SQLite tier on first use"""
+        if not self.db_path:
+            return None
+        if self.db is None:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        response TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        expires_at REAL NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                """)
+                db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+                self.db = db
+            except sqlite3.Error as e:
+                print(f"Response cache disk tier disabled: {e}")
+                self.db_path = None
+        return self.db
+    
+    def _disk_get(self, key, now):
+        db = self._get_db()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            with db:
+                if row[1] <= now:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"Response cache read error: {e}")
+            return None
+    
+    def _disk_put(self, key, response, expires_at):
+        db = self._get_db()
+        if db is None:
+            return
+        now = time.time()
+        try:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode()), expires_at, now)
+                )
+                self.disk_writes += 1
+                if self.disk_writes % 50:
+                    return
+                # Periodically drop expired rows and enforce the disk size cap
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.db_max_bytes:
+                    # Trim the least recently used quarter rather than one row per write
+                    count = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                    db.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                        (max(1, count // 4),)
+                    )
+        except sqlite3.Error as e:
+            print(f"Response cache write error: {e}")
+
+# Global cache instance shared by every session in the process
+response_cache = ResponseCache()
@@ -0,0 +1,76 @@
+"""
+Local lexical retrieval for Phin AI Assistant
+An incrementally maintained BM25 index, used to pick the memory entries and
+file chunks that are relevant to the current prompt
+"""
+import heapq
+import math
+import re
+from collections import Counter
+
+_WORDS = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in is it its
+me my of on or so that the their them then there these they this to was we were what
+when where which who why will with you your
+""".split())
+
+def tokenize(text):
+    """Split text into lowercase terms, dropping common stopwords"""
+    return [word for word in _WORDS.findall(text.lower()) if word not in STOPWORDS]
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring that supports adding and removing documents"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id, text):
+        """Index a document, replacing any previous version with the same ID"""
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+    def remove(self, doc_id, text=None):
+        """Drop a document; passing its text avoids scanning every posting list"""
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        terms = set(tokenize(text)) if text is not None else list(self.postings)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs and docs.pop(doc_id, None) is not None and not docs:
+                del self.postings[term]
+
+    def search(self, query, k=10):
+        """Return up to k (doc_id, score) pairs, best first"""
+        if not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        average_length = self.total_length / doc_count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, frequency in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,267 @@
+"""
+Model routing for Phin AI Assistant
+Chooses the models a request is tried on, falls back when Groq rate-limits,
+fails or has retired a model, hedges slow first tokens, and keeps a per-model
+latency and error-rate EWMA to steer traffic towards healthy models
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from tokens import estimate_tokens
+from rate_limiter import Overloaded
+from config import (
+    MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, ROUTER_FAST_MODEL, ROUTER_FALLBACK_MODELS,
+    ROUTER_SIMPLE_MAX_TOKENS, ROUTER_MAX_ATTEMPTS, ROUTER_HEDGE_DELAY, ROUTER_HEDGE_FACTOR,
+    ROUTER_BACKOFF_BASE, ROUTER_BACKOFF_CAP, ROUTER_RATE_LIMIT_COOLDOWN, ROUTER_EWMA_ALPHA,
+    ROUTER_ERROR_PENALTY, ROUTER_UNHEALTHY_ERROR_RATE, ROUTER_ERROR_HALF_LIFE, ROUTER_PRIOR_LATENCY
+)
+
+# Prompts asking for code or analysis go to the large model however short they are
+_COMPLEX_PROMPT = re.compile(
+    r"```|\b(explain|why|analy[sz]e|compare|prove|derive|design|implement|debug|refactor|optimi[sz]e|step by step)\b",
+    re.IGNORECASE
+)
+
+# What a failed request says about its model
+RATE_LIMITED = "rate_limited"
+UNAVAILABLE = "unavailable"
+RETIRED = "retired"
+
+def classify_error(error):
+    """Sort an API error by what it means for the model; None if trying another model won't help"""
+    status = getattr(error, "status_code", None)
+    if status == 429 or isinstance(error, Overloaded):
+        return RATE_LIMITED
+    if status == 404 or (status == 400 and "decommissioned" in str(error)):
+        return RETIRED
+    if status is not None and status >= 500:
+        return UNAVAILABLE
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return UNAVAILABLE
+    return None
+
+def retry_after(error):
+    """Seconds the server (or our own rate limiter) asked us to wait, if it said"""
+    if isinstance(error, Overloaded):
+        return error.retry_after
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def is_simple(prompt, max_tokens=ROUTER_SIMPLE_MAX_TOKENS):
+    """Short prompts that don't ask for code or analysis can go to the fast model"""
+    return estimate_tokens(prompt) <= max_tokens and not _COMPLEX_PROMPT.search(prompt)
+
+class ModelHealth:
+    def __init__(self):
+        self.latency = None  # EWMA of seconds to first token
+        self.error_rate = 0.0  # EWMA of failed or outraced requests (0 to 1), as of updated
+        self.updated = time.monotonic()
+        self.cooldown_until = 0.0  # Skipped until then after a rate limit
+        self.retired = False  # Groq no longer serves it
+        self.requests = 0
+        self.failures = 0
+
+class Router:
+    def __init__(self, fast_model=ROUTER_FAST_MODEL, fallback_models=ROUTER_FALLBACK_MODELS,
+                 max_attempts=ROUTER_MAX_ATTEMPTS, hedge_delay=ROUTER_HEDGE_DELAY, alpha=ROUTER_EWMA_ALPHA):
+        self.fast_model = fast_model
+        self.fallback_models = fallback_models
+        self.max_attempts = max_attempts
+        self.hedge_delay = hedge_delay
+        self.alpha = alpha
+        self.health = {}
+        self.lock = threading.Lock()
+
+    def get_health(self, model):
+        """Get a model's health record (caller holds the lock)"""
+        health = self.health.get(model)
+        if health is None:
+            health = self.health[model] = ModelHealth()
+        return health
+
+    def error_rate(self, health, now):
+        """A model's error rate, decayed for the time since its last request"""
+        return health.error_rate * 0.5 ** ((now - health.updated) / ROUTER_ERROR_HALF_LIFE)
+
+    def update_error_rate(self, health, failed):
+        now = time.monotonic()
+        health.error_rate = self.error_rate(health, now) + self.alpha * (failed - self.error_rate(health, now))
+        health.updated = now
+
+    def score(self, health, now):
+        """Expected cost of trying a model: its latency, inflated by its error rate"""
+        latency = health.latency if health.latency is not None else ROUTER_PRIOR_LATENCY
+        return latency * (1 + ROUTER_ERROR_PENALTY * self.error_rate(health, now))
+
+    def plan(self, selected_model, prompt, auto_route=False, required_tokens=0):
+        """Get the models to try for a request, best first
+
+        With auto_route, simple prompts start on the fast model. Fallbacks whose
+        context window can't hold required_tokens are left out; retired and
+        rate-limited models are skipped while anything else is left to try.
+        """
+        primary = self.fast_model if auto_route and is_simple(prompt) else selected_model
+        fallbacks = []
+        for model in [selected_model] + list(self.fallback_models):
+            if model != primary and model not in fallbacks and \
+                    MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) >= required_tokens:
+                fallbacks.append(model)
+        now = time.monotonic()
+        with self.lock:
+            def usable(model):
+                health = self.get_health(model)
+                return not health.retired and now >= health.cooldown_until
+            fallbacks = sorted(filter(usable, fallbacks), key=lambda model: self.score(self.get_health(model), now))
+            candidates = [primary] + fallbacks
+            unhealthy = self.error_rate(self.get_health(primary), now) > ROUTER_UNHEALTHY_ERROR_RATE
+            if fallbacks and (not usable(primary) or unhealthy):
+                # Still worth a try, but after models that are answering
+                candidates = fallbacks + ([primary] if not self.get_health(primary).retired else [])
+        return candidates[:self.max_attempts]
+
+    def record_success(self, model, latency=None):
+        with self.lock:
+            health = self.get_health(model)
+            health.requests += 1
+            self.update_error_rate(health, 0)
+            if latency is not None:
+                health.latency = latency if health.latency is None else \
+                    health.latency + self.alpha * (latency - health.latency)
+
+    def record_failure(self, model, kind, error):
+        with self.lock:
+            health = self.get_health(model)
+            health.requests += 1
+            health.failures += 1
+            self.update_error_rate(health, 1)
+            if kind == RATE_LIMITED:
+                health.cooldown_until = time.monotonic() + (retry_after(error) or ROUTER_RATE_LIMIT_COOLDOWN)
+            elif kind == RETIRED:
+                health.retired = True
+        print(f"Model {model} failed ({kind or 'error'}): {error}")
+
+    def record_outraced(self, model):
+        """Count a hedge won by a model started later as an error, so a slow model stops being tried first"""
+        with self.lock:
+            self.update_error_rate(self.get_health(model), 1)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before retry number attempt"""
+        return random.uniform(0, min(ROUTER_BACKOFF_CAP, ROUTER_BACKOFF_BASE * 2 ** attempt))
+
+    def hedge_after(self, model):
+        """Seconds to wait for a model's first token before racing another model"""
+        with self.lock:
+            latency = self.get_health(model).latency
+        return max(self.hedge_delay, ROUTER_HEDGE_FACTOR * latency) if latency is not None else self.hedge_delay
+
+    async def run(self, models, attempt, streaming=False, discard=None):
+        """Await attempt(model, admitted) on the first of models that succeeds; returns (model, result)
+
+        attempt calls admitted() once the request is past our own rate limiter
+        and is being sent, so time spent queued here isn't charged to the model.
+        Failures that another model (or a retry) might avoid move on after a
+        jittered backoff; others are raised at once. With streaming, attempt
+        returns at the first token, so its time feeds the latency EWMA and a
+        model slow to produce one is hedged with a request to the next model.
+        The loser is cancelled, or passed to discard if it finished too.
+        """
+        queue = list(models)
+        running = {}  # task -> [model, launch time, admission time or None]
+        launched = 0
+        last_error = None
+        admission = asyncio.Event()
+
+        def launch(model):
+            nonlocal launched
+            launched += 1
+            timing = [model, time.perf_counter(), None]
+
+            def admitted():
+                if timing[2] is None:
+                    timing[2] = time.perf_counter()
+                    admission.set()
+            running[asyncio.ensure_future(attempt(model, admitted))] = timing
+
+        try:
+            while True:
+                if not running:
+                    if not queue or launched >= self.max_attempts:
+                        raise last_error or RuntimeError("No model to send the request to")
+                    if launched:
+                        await asyncio.sleep(self.backoff(launched))
+                    launch(queue.pop(0))
+                waiting = set(running)
+                timeout = None
+                admission_wait = None
+                if streaming and self.hedge_delay and queue and len(running) == 1 and launched < self.max_attempts:
+                    model, _, admitted_at = next(iter(running.values()))
+                    if admitted_at is None:
+                        # The hedge timer starts once the request leaves our own queue
+                        admission.clear()
+                        admission_wait = asyncio.ensure_future(admission.wait())
+                        waiting.add(admission_wait)
+                    else:
+                        timeout = max(0.0, self.hedge_after(model) - (time.perf_counter() - admitted_at))
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if admission_wait is not None:
+                    admission_wait.cancel()
+                    done.discard(admission_wait)
+                    if not done:
+                        continue
+                if not done:
+                    launch(queue.pop(0))
+                    continue
+                for task in done:
+                    model, launched_at, admitted_at = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        started = admitted_at or launched_at
+                        self.record_success(model, time.perf_counter() - started if streaming else None)
+                        for other_model, _, other_admitted_at in running.values():
+                            if other_admitted_at is not None and other_admitted_at < started:
+                                self.record_outraced(other_model)
+                        # Any other finished task lost the race; the finally block releases it
+                        running.update({other: None for other in done if other is not task})
+                        return model, task.result()
+                    kind = classify_error(error)
+                    if not isinstance(error, Overloaded):
+                        # Our own limiter turning a request away says nothing about the model
+                        self.record_failure(model, kind, error)
+                    if kind is None:
+                        raise error
+                    last_error = error
+                    if kind == UNAVAILABLE and not queue:
+                        # Nothing else to try: give the same model another go after the backoff
+                        queue.append(model)
+        finally:
+            await self.release(list(running), discard)
+
+    async def release(self, tasks, discard):
+        """Cancel tasks that lost a race and discard the results of any that finished anyway"""
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if discard is not None:
+            for result in results:
+                if not isinstance(result, BaseException):
+                    await discard(result)
+
+    def stats(self):
+        """Get each model's latency and error-rate EWMAs and whether it's being routed to"""
+        now = time.monotonic()
+        with self.lock:
+            return {
+                model: {
+                    "latency": health.latency, "error_rate": self.error_rate(health, now),
+                    "requests": health.requests, "failures": health.failures,
+                    "state": "retired" if health.retired else "cooling down" if now < health.cooldown_until else "ok"
+                }
+                for model, health in self.health.items()
+            }
+
+router = Router()
@@ -0,0 +1,129 @@
+"""
+Web search for Phin AI Assistant
+Pluggable backends behind a TTL cache and a hard deadline, so a slow search
+never holds up the LLM call
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from config import (
+    SEARCH_RESULTS, SEARCH_DEADLINE, SEARCH_CACHE_TTL,
+    SEARCH_CACHE_MAX_ENTRIES, SEARCH_WORKERS
+)
+
+_WHITESPACE = re.compile(r'\s+')
+_CJK_CHARACTERS = re.compile('[\u4e00-\u9fff]')
+
+def normalize_query(query):
+    """Normalize a query for cache lookups"""
+    return _WHITESPACE.sub(' ', query.strip().lower())
+
+def is_english_result(result):
+    """Skip results whose title or body contains Chinese characters"""
+    return not (_CJK_CHARACTERS.search(result.get('title', ''))
+                or _CJK_CHARACTERS.search(result.get('body', '')))
+
+class SearchBackend:
+    """Interface for search providers"""
+
+    def search(self, query, num_results):
+        """Return a list of {'title', 'body', 'href'} dicts"""
+        raise NotImplementedError
+
+class DuckDuckGoBackend(SearchBackend):
+    """DuckDuckGo text search, reusing one DDGS session per worker thread"""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def get_session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            from duckduckgo_search import DDGS
+            session = self.local.session = DDGS()
+        return session
+
+    def search(self, query, num_results):
+        # Force English results only
+        return list(self.get_session().text(f"{query} lang:en", region='us-en', max_results=num_results))
+
+class SearchService:
+    def __init__(self, backend=None, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                 deadline=SEARCH_DEADLINE, workers=SEARCH_WORKERS):
+        self.backend = backend or DuckDuckGoBackend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="web-search")
+        self.cache = OrderedDict()  # (query, num_results) -> (expires_at, results)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.timeouts = 0
+
+    def set_backend(self, backend):
+        """Swap the search provider (e.g. a local fake in tests) and drop cached results"""
+        with self.lock:
+            self.backend = backend
+            self.cache.clear()
+
+    def submit(self, query, num_results=SEARCH_RESULTS):
+        """Start a search in the background and return a future for its results"""
+        key = (normalize_query(query), num_results)
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(entry[1])
+                return future
+            # Share one request between sessions asking the same thing at once
+            if key in self.in_flight:
+                return self.in_flight[key]
+            future = self.executor.submit(self._run, key, query, num_results)
+            self.in_flight[key] = future
+            return future
+
+    def search(self, query, num_results=SEARCH_RESULTS, deadline=None):
+        """Search and wait at most the deadline, returning no results on timeout"""
+        return self.wait(self.submit(query, num_results), deadline)
+
+    def wait(self, future, deadline=None):
+        """Wait for a submitted search, giving up after the deadline"""
+        try:
+            return future.result(self.deadline if deadline is None else deadline)
+        except TimeoutError:
+            # The search keeps running and still fills the cache for the next turn
+            self.timeouts += 1
+            return []
+
+    async def wait_async(self, future, deadline=None):
+        """Await a submitted search on an event loop without tying up a thread"""
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                self.deadline if deadline is None else deadline
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return []
+
+    def _run(self, key, query, num_results):
+        try:
+            results = [r for r in self.backend.search(query, num_results) if is_english_result(r)][:num_results]
+        except Exception as e:
+            print(f"Search error: {e}")
+            results = None
+        with self.lock:
+            self.in_flight.pop(key, None)
+            if results is not None:
+                self.cache[key] = (time.time() + self.ttl, results)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+        return results or []
+
+# Global search service shared by every session in the process
+search_service = SearchService()
@@ -213,6 +213,20 @@ def get_animation_css():
         font-family: inherit;
     }
 
+    .response-content.typewriter {
+        animation-name: reveal;
+        animation-fill-mode: both;
+    }
+
+    @keyframes reveal {
+        0% {
+            clip-path: inset(0 0 100% 0);
+        }
+        100% {
+            clip-path: inset(0 0 0 0);
+        }
+    }
+
     @keyframes fadeIn {
         0% {
             opacity: 0;
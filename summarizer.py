@@ -0,0 +1,76 @@
+"""
+Rolling conversation summarization for Phin AI Assistant
+Older turns that no longer fit the history window are folded into a running
+summary in the background, so prompt size stays flat as chats grow
+"""
+import groq_client
+from router import router
+from prompt_builder import message_tokens, truncate_to_tokens
+from config import SUMMARY_MODEL, SUMMARY_BATCH_MESSAGES, SUMMARY_INPUT_TOKENS, SUMMARY_MAX_TOKENS
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and Phin, an AI assistant.
+Update the summary with the new messages. Keep names, facts, decisions, open questions and anything the
+user asked Phin to remember. Write compact plain prose, no more than a few short paragraphs."""
+
+def new_summary():
+    """Get an empty summary: no messages covered yet"""
+    return {"covered": 0, "text": ""}
+
+def reset_summary(state):
+    """Forget the summary when the chat is cleared or replaced"""
+    state["conversation_summary"] = new_summary()
+    state["summary_job"] = None
+
+def get_summary(state, message_count):
+    """Fold a finished background summary into the chat state and return the current one"""
+    job = state.get("summary_job")
+    if job is not None and job["future"].done():
+        state["summary_job"] = None
+        try:
+            text = job["future"].result()
+            if text:
+                state["conversation_summary"] = {"covered": job["target"], "text": text.strip()}
+        except Exception as e:
+            print(f"Summarization error: {e}")
+    summary = state.get("conversation_summary") or new_summary()
+    if summary["covered"] > message_count:
+        reset_summary(state)
+        summary = state["conversation_summary"]
+    return summary
+
+def select_batch(messages, start, end):
+    """Pick messages[start:target] that fit the summarizer's input budget"""
+    remaining = SUMMARY_INPUT_TOKENS
+    target = start
+    while target < end:
+        cost = message_tokens(messages[target])
+        if cost > remaining and target > start:
+            break
+        remaining -= cost
+        target += 1
+    return [dict(message) for message in messages[start:target]], target
+
+def schedule_summary(state, messages, window_start):
+    """Start summarizing turns that fell out of the history window, once enough have"""
+    summary = state.get("conversation_summary") or new_summary()
+    if state.get("summary_job") is not None:
+        return
+    if window_start - summary["covered"] < SUMMARY_BATCH_MESSAGES:
+        return
+    batch, target = select_batch(messages, summary["covered"], window_start)
+    future = groq_client.submit(summarize(summary["text"], batch))
+    state["summary_job"] = {"future": future, "target": target}
+
+async def summarize(previous_summary, messages):
+    """Fold messages into the previous summary using the cheap summary model"""
+    transcript = "\n".join(
+        f"{'User' if message['role'] == 'user' else 'Phin'}: "
+        f"{truncate_to_tokens(message['content'], SUMMARY_INPUT_TOKENS // 2)}"
+        for message in messages
+    )
+    content = f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+    text, _ = await groq_client.create_completion(
+        [{"role": "system", "content": SUMMARY_INSTRUCTIONS}, {"role": "user", "content": content}],
+        router.plan(SUMMARY_MODEL, content), 0.2, SUMMARY_MAX_TOKENS
+    )
+    return text
@@ -0,0 +1,15 @@
+"""
+Shared setup for the Phin AI Assistant tests
+"""
+import os
+import sys
+import tempfile
+
+# Make the app modules importable and satisfy config's API key check offline
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('GROQ_API_KEY', 'gsk_test_fake_key')
+
+# Run from a scratch directory so the default chat, memory and cache paths never touch real files
+os.chdir(tempfile.mkdtemp(prefix="phin-tests-"))
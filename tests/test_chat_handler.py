@@ -0,0 +1,36 @@
+"""
+Tests for how a chat turn ends when the rate limiter turns it away
+"""
+import os
+import pytest
+from streamlit.testing.v1 import AppTest
+import groq_client
+from rate_limiter import Overloaded
+from tracing import tracer
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "phin_main.py")
+
+def shed_stream(messages, models, *args, **kwargs):
+    raise Overloaded(models[0] if isinstance(models, list) else models, 12)
+    yield
+
+def shed_completion(messages, models, *args, **kwargs):
+    raise Overloaded(models[0] if isinstance(models, list) else models, 12)
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_shed_turn_is_reported_and_traced_as_overloaded(monkeypatch, streaming):
+    monkeypatch.setattr(groq_client, "stream_chat", shed_stream)
+    monkeypatch.setattr(groq_client, "complete_chat", shed_completion)
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "outcomes", {})
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    at.session_state["streaming_enabled"] = streaming
+    at.session_state["use_web_search"] = False
+    at.chat_input[0].set_value("Hello").run()
+
+    assert not at.exception
+    assert not at.error
+    assert [warning.value for warning in at.warning if "Too many requests" in warning.value]
+    assert at.session_state["last_trace"]["outcome"] == "overloaded"
+    assert [outcome for (_, outcome) in tracer.turn_counts()] == ["overloaded"]
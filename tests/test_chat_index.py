@@ -0,0 +1,44 @@
+"""
+Tests for the chat index's search window and rebuilds
+"""
+import os
+from chat_index import ChatIndex
+from chat_store import ChatStore
+
+def conversation(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+def found_chats(index, query):
+    return {result["chat_id"] for result in index.search(query)}
+
+def test_search_ranks_the_most_recently_written_chats(tmp_path):
+    index = ChatIndex(str(tmp_path / "index.db"), search_candidates=2)
+    for chat in range(5):
+        index.record_save(f"chat{chat}", conversation(f"apple note {chat}"), 0)
+    assert found_chats(index, "apple") == {"chat3", "chat4"}
+
+    # Resuming the oldest chat makes it the most recent
+    index.record_save("chat0", conversation("apple note 0", "and pears"), 1)
+    assert found_chats(index, "apple") == {"chat0", "chat4"}
+    results = index.search("note 0")
+    assert [(result["chat_id"], result["position"]) for result in results] == [("chat0", 0)]
+    assert results[0]["title"] == "apple note 0"
+
+def test_rebuild_orders_chats_by_last_write(tmp_path):
+    store = ChatStore(directory=str(tmp_path), legacy_dirs=[], index=None)
+    for chat in range(5):
+        store.save(f"chat{chat}", conversation(f"apple note {chat}"))
+        os.utime(store.path(f"chat{chat}"), (1000 + chat, 1000 + chat))
+    os.utime(store.path("chat1"), (2000, 2000))
+
+    index = ChatIndex(str(tmp_path / "index.db"), search_candidates=2)
+    index.rebuild(store)
+    assert found_chats(index, "apple") == {"chat1", "chat4"}
+    assert [chat["chat_id"] for chat in index.list_chats()][:2] == ["chat1", "chat4"]
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "history" / "index.db"
+    index = ChatIndex(str(path))
+    assert not path.exists()
+    assert index.count() == 0
+    assert path.exists()
@@ -0,0 +1,54 @@
+"""
+Tests for chat log appends and recovery from interrupted writes
+"""
+from chat_store import ChatStore
+
+def make_store(directory):
+    return ChatStore(directory=str(directory), legacy_dirs=[], index=None)
+
+def messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+def test_append_after_torn_line_keeps_new_records(tmp_path):
+    store = make_store(tmp_path)
+    store.save("chat", messages("one", "two"))
+    # A crash part-way through the next append
+    with open(store.path("chat"), "a", encoding="utf-8") as f:
+        f.write('{"type":"message","role":"user","content":"thr')
+
+    restarted = make_store(tmp_path)
+    loaded, _ = restarted.load("chat")
+    assert [m["content"] for m in loaded] == ["one", "two"]
+    restarted.save("chat", loaded + messages("three"))
+    restarted.save("chat", loaded + messages("three", "four"))
+
+    loaded, _ = make_store(tmp_path).load("chat")
+    assert [m["content"] for m in loaded] == ["one", "two", "three", "four"]
+
+def test_record_missing_only_its_line_break_is_kept(tmp_path):
+    store = make_store(tmp_path)
+    store.save("chat", messages("one"))
+    with open(store.path("chat"), "a", encoding="utf-8") as f:
+        f.write('{"type":"message","role":"user","content":"two"}')
+
+    restarted = make_store(tmp_path)
+    loaded, _ = restarted.load("chat")
+    assert [m["content"] for m in loaded] == ["one", "two"]
+    restarted.save("chat", loaded + messages("three"))
+
+    loaded, _ = make_store(tmp_path).load("chat")
+    assert [m["content"] for m in loaded] == ["one", "two", "three"]
+
+def test_ratings_survive_a_torn_line(tmp_path):
+    store = make_store(tmp_path)
+    store.save("chat", messages("one"))
+    with open(store.path("chat"), "a", encoding="utf-8") as f:
+        f.write('{"type":"rat')
+
+    restarted = make_store(tmp_path)
+    loaded, _ = restarted.load("chat")
+    restarted.save("chat", loaded, {0: "up"})
+
+    loaded, ratings = make_store(tmp_path).load("chat")
+    assert [m["content"] for m in loaded] == ["one"]
+    assert ratings == {0: "up"}
@@ -0,0 +1,32 @@
+"""
+Tests for splitting uploaded files into chunks
+"""
+from file_index import chunk_text, split_paragraphs
+
+def test_chunks_keep_line_breaks_and_indentation():
+    source = "def f(x):\n    if x:\n        return 1\n    return 2\n"
+    assert list(chunk_text([source])) == [source.rstrip()]
+
+def test_paragraphs_join_back_into_the_original_text():
+    text = "First para\nsecond line\n\n\n  Indented para\n\nlast"
+    for size in (1, 3, 7, len(text)):
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        assert "".join(split_paragraphs(pieces)) == text
+
+def test_chunks_are_cut_between_lines_with_whole_line_overlap():
+    lines = [f"row {i},alpha,beta,{i * 7}\n" for i in range(200)]
+    text = "".join(lines)
+    chunks = list(chunk_text([text[i:i + 500] for i in range(0, len(text), 500)], chunk_tokens=60, overlap=15))
+    assert len(chunks) > 5
+    for chunk in chunks:
+        assert chunk + "\n" in text
+        assert chunk.startswith("row ")
+    # The next chunk starts with the last whole line(s) of the one before
+    first_lines = chunks[0].split("\n")
+    assert chunks[1].startswith(first_lines[-1])
+
+def test_long_line_is_split_between_words():
+    line = " ".join(f"word{i}" for i in range(500))
+    chunks = list(chunk_text([line], chunk_tokens=50, overlap=0))
+    assert len(chunks) > 5
+    assert " ".join(chunks).split() == line.split()
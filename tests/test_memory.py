@@ -0,0 +1,86 @@
+"""
+Tests for per-user memory persistence
+"""
+import gc
+import memory
+from memory import ConversationMemory, MemoryStore
+
+def test_two_processes_keep_each_others_facts(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    # Separate stores stand in for separate processes on the same database
+    first = ConversationMemory("alice", MemoryStore(db_path), write_behind=False)
+    second = ConversationMemory("alice", MemoryStore(db_path), write_behind=False)
+    first.add_important_fact("User my name is alice", "personal")
+    second.add_important_fact("User i live in paris", "personal")
+    first.add_user_preference("likes", "tea")
+
+    reloaded = ConversationMemory("alice", MemoryStore(db_path), write_behind=False)
+    facts = [entry["fact"] for entry in reloaded.memory_data["important_facts"]]
+    assert facts == ["User my name is alice", "User i live in paris"]
+    assert reloaded.memory_data["user_preferences"] == {"likes": "tea"}
+    # The writer that lost the race picked up the other's change when it flushed
+    assert [entry["fact"] for entry in first.memory_data["important_facts"]] == facts
+
+def test_write_behind_flush_merges(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    first = ConversationMemory("bob", MemoryStore(db_path), write_behind=True)
+    second = ConversationMemory("bob", MemoryStore(db_path), write_behind=True)
+    first.add_conversation_topic("python packaging")
+    second.add_conversation_topic("sqlite locking")
+    second.flush()
+    first.flush()
+
+    reloaded = ConversationMemory("bob", MemoryStore(db_path), write_behind=False)
+    topics = {entry["topic"] for entry in reloaded.memory_data["conversation_topics"]}
+    assert topics == {"python packaging", "sqlite locking"}
+
+def test_refresh_picks_up_other_writers(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    reader = ConversationMemory("carol", MemoryStore(db_path), write_behind=False)
+    writer = ConversationMemory("carol", MemoryStore(db_path), write_behind=False)
+    writer.add_user_preference("prefers", "short answers")
+    assert reader.get_user_preference("prefers") is None
+    reader.refresh()
+    assert reader.get_user_preference("prefers") == "short answers"
+
+def test_clear_replaces_stored_memory(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    first = ConversationMemory("dave", MemoryStore(db_path), write_behind=False)
+    first.add_important_fact("User i work at home", "personal")
+    first.clear()
+    reloaded = ConversationMemory("dave", MemoryStore(db_path), write_behind=False)
+    assert reloaded.memory_data["important_facts"] == []
+
+def test_evicted_memory_in_use_is_not_duplicated(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_CACHE_SIZE", 1)
+    held = memory.get_conversation_memory("erin")
+    memory.get_conversation_memory("frank")  # Pushes erin out of the cache
+    assert memory.get_conversation_memory("erin") is held
+
+    memory.get_conversation_memory("frank")
+    del held
+    gc.collect()
+    # Once nothing holds it, a fresh copy is loaded from the store
+    assert "erin" not in memory._evicted
+
+def test_analysis_records_topic_when_reply_is_last(tmp_path):
+    memory_ = ConversationMemory("gina", MemoryStore(str(tmp_path / "memory.db")), write_behind=False)
+    messages = [
+        {"role": "user", "content": "How do I tune SQLite for writes. Thanks"},
+        {"role": "assistant", "content": "Use WAL mode."},
+    ]
+    cursor = memory_.analyze_and_store_conversation(messages, 0)
+    assert [entry["topic"] for entry in memory_.memory_data["conversation_topics"]] == ["How do I tune SQLite for writes"]
+
+    # Nothing new since the cursor: no duplicate topic
+    assert memory_.analyze_and_store_conversation(messages, cursor) == 2
+    assert len(memory_.memory_data["conversation_topics"]) == 1
+    assert "How do I tune SQLite" in memory_.get_memory_context(512, "sqlite writes")
+
+def test_user_tokens_only_accept_ids_signed_here():
+    token = memory.make_user_token("abc123")
+    assert memory.user_id_from_token(token) == "abc123"
+    assert memory.user_id_from_token("abc123") is None
+    assert memory.user_id_from_token("victim." + token.rpartition(".")[2]) is None
+    assert memory.user_id_from_token(token[:-1] + ("0" if token[-1] != "0" else "1")) is None
+    assert memory.user_id_from_token(None) is None
@@ -0,0 +1,95 @@
+"""
+Tests for the client-side rate limiter's queue and shared state
+"""
+import asyncio
+import sqlite3
+import time
+from rate_limiter import RateLimiter, SqliteBuckets, Overloaded, RequestTooLarge
+from router import Router
+
+def test_sessions_are_served_round_robin():
+    # One request per 0.1 s, so everything after the first waits its turn
+    limiter = RateLimiter(True, 1, 10 ** 9, {}, "", deadline=5, period=0.1)
+    admitted = []
+
+    async def request(session, name):
+        await limiter.acquire("model", 10, session)
+        admitted.append(name)
+
+    async def burst():
+        heavy = [asyncio.ensure_future(request("heavy", f"heavy{i}")) for i in range(4)]
+        await asyncio.sleep(0.01)
+        await asyncio.gather(request("light", "light"), *heavy)
+
+    asyncio.run(burst())
+    assert admitted == ["heavy0", "heavy1", "light", "heavy2", "heavy3"]
+    assert limiter.stats()["model"] == {"admitted": 5, "queued": 4, "shed": 0, "waiting": 0}
+
+def test_requests_past_their_deadline_are_turned_away():
+    # The third request would start 0.2 s in, past its 0.15 s deadline
+    limiter = RateLimiter(True, 1, 10 ** 9, {}, "", deadline=0.15, period=0.1)
+
+    async def burst():
+        return await asyncio.gather(*(limiter.acquire("model", 10, "session") for _ in range(4)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert [isinstance(result, Overloaded) for result in results] == [False, False, True, True]
+
+def test_request_bigger_than_the_token_limit_moves_to_another_model():
+    limiter = RateLimiter(True, 30, 6000, {"big-model": (30, 30000)}, "", deadline=5)
+    router = Router(fallback_models=["big-model"], hedge_delay=0)
+
+    async def attempt(model, admitted):
+        await limiter.acquire(model, 16000)
+        admitted()
+        return model
+
+    start = time.perf_counter()
+    model, _ = asyncio.run(router.run(["small-model", "big-model"], attempt))
+    assert model == "big-model"
+    assert time.perf_counter() - start < 1.0
+    try:
+        asyncio.run(limiter.acquire("small-model", 16000))
+        assert False, "a request that can never fit was queued"
+    except RequestTooLarge as e:
+        assert "16000" in str(e)
+
+def test_locked_state_file_falls_back_for_that_call_only(tmp_path):
+    path = str(tmp_path / "limits.db")
+    limiter = RateLimiter(True, 100, 10 ** 9, {}, path, deadline=5)
+    asyncio.run(limiter.take("model", {"requests": 1, "tokens": 10}))
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+
+    async def take_while_ticking():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+        ticker = asyncio.ensure_future(tick())
+        wait = await limiter.take("model", {"requests": 1, "tokens": 10})
+        ticker.cancel()
+        return wait, ticks
+
+    wait, ticks = asyncio.run(take_while_ticking())
+    holder.execute("ROLLBACK")
+    released = time.time()
+    # The loop kept running while the file's lock was waited on elsewhere
+    assert wait == 0.0 and ticks >= 10
+    assert limiter.buckets.path == path
+    asyncio.run(limiter.take("model", {"requests": 1, "tokens": 10}))
+    updated = holder.execute("SELECT updated FROM buckets WHERE model = 'model' AND kind = 'requests'").fetchone()[0]
+    assert updated >= released
+
+def test_state_file_is_given_up_after_repeated_errors(tmp_path):
+    (tmp_path / "file").write_text("")
+    buckets = SqliteBuckets(str(tmp_path / "file" / "limits.db"), max_errors=3)
+    limits = {"requests": 10, "tokens": 100}
+    for _ in range(2):
+        buckets.update("model", limits, 60.0, dict)
+    assert buckets.path
+    buckets.update("model", limits, 60.0, dict)
+    assert buckets.path is None
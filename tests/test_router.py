@@ -0,0 +1,101 @@
+"""
+Tests for model fallback and hedging, against the fake Groq server from the benchmarks
+"""
+import asyncio
+import os
+import sys
+import time
+import pytest
+import groq_client
+from rate_limiter import RateLimiter, Overloaded
+from router import Router
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fake_groq import FakeGroqServer
+
+MESSAGES = [{"role": "user", "content": "Test prompt"}]
+
+@pytest.fixture(scope="module")
+def fake_groq():
+    server = FakeGroqServer(
+        latency=0.01, tokens_per_second=5000, response_tokens=5,
+        fail_models={"retired-model": 404, "limited-model": 429}, slow_models={"slow-model": 1.5}
+    )
+    base_url = server.start()
+    yield base_url
+    server.stop()
+
+@pytest.fixture
+def client(fake_groq, monkeypatch):
+    """Point groq_client at the fake server, without the rate limiter"""
+    monkeypatch.setattr(groq_client, "GROQ_BASE_URL", fake_groq)
+    monkeypatch.setattr(groq_client, "_client", None)
+    monkeypatch.setattr(groq_client, "rate_limiter", RateLimiter(enabled=False))
+    yield groq_client
+    groq_client._client = None
+
+def stream_reply(client, router, models):
+    """Stream a reply to the end through router; returns (model, text)"""
+    async def go():
+        model, opened = await router.run(
+            models, lambda model, admitted: client.open_stream(MESSAGES, model, 0.7, 64, admitted=admitted),
+            streaming=True, discard=client.close_stream
+        )
+        text = opened[2].choices[0].delta.content or ""
+        try:
+            async for chunk in opened[1]:
+                text += chunk.choices[0].delta.content or "" if chunk.choices else ""
+        finally:
+            await client.close_stream(opened)
+        return model, text
+    return client.run(go())
+
+@pytest.mark.parametrize("failing_model", ["retired-model", "limited-model"])
+def test_falls_back_when_a_model_fails(client, monkeypatch, failing_model):
+    router = Router(fallback_models=["healthy-model"], hedge_delay=0)
+    monkeypatch.setattr(client, "router", router)
+    text, model = client.complete_chat(MESSAGES, router.plan(failing_model, "Test prompt"), 0.7, 64)
+    assert model == "healthy-model"
+    assert text.startswith("token0")
+    state = router.stats()[failing_model]["state"]
+    assert state == ("retired" if failing_model == "retired-model" else "cooling down")
+    assert router.plan(failing_model, "Test prompt")[0] == "healthy-model"
+
+def test_hedges_a_slow_first_token(client):
+    router = Router(fallback_models=["healthy-model"], hedge_delay=0.2)
+    start = time.perf_counter()
+    model, text = stream_reply(client, router, ["slow-model", "healthy-model"])
+    assert model == "healthy-model"
+    assert text.startswith("token0")
+    assert time.perf_counter() - start < 1.0
+    # The slow model was outraced, so it counts against it
+    assert router.stats()["slow-model"]["error_rate"] > 0
+
+def test_time_queued_by_our_limiter_isnt_charged_to_the_model():
+    router = Router(fallback_models=["other-model"], hedge_delay=0.2)
+    launched = []
+
+    async def attempt(model, admitted):
+        launched.append(model)
+        await asyncio.sleep(0.4)  # Waiting on the rate limiter
+        admitted()
+        await asyncio.sleep(0.05)
+        return model
+
+    model, _ = asyncio.run(router.run(["queued-model", "other-model"], attempt, streaming=True))
+    assert (model, launched) == ("queued-model", ["queued-model"])
+    assert router.stats()["queued-model"]["latency"] < 0.2
+
+def test_overloaded_doesnt_count_against_the_model():
+    router = Router(fallback_models=["other-model"], hedge_delay=0)
+
+    async def attempt(model, admitted):
+        if model == "busy-model":
+            raise Overloaded(model, 30)
+        admitted()
+        return model
+
+    model, _ = asyncio.run(router.run(["busy-model", "other-model"], attempt))
+    assert model == "other-model"
+    assert "busy-model" not in router.stats()
+    assert router.plan("busy-model", "Test prompt")[0] == "busy-model"
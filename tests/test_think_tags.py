@@ -0,0 +1,33 @@
+"""
+Tests for stripping reasoning sections from streamed replies
+"""
+from utils import ThinkTagStripper
+
+def strip(*deltas, keep_reasoning=True):
+    stripper = ThinkTagStripper(keep_reasoning)
+    visible = "".join(stripper.feed(delta) for delta in deltas) + stripper.flush()
+    return visible, stripper.reasoning_text()
+
+def test_bold_marker_inside_think_is_reasoning_text():
+    visible, reasoning = strip("<think>plan: use **thinking** style</think>The answer is 42.")
+    assert visible == "The answer is 42."
+    assert reasoning == "plan: use **thinking** style"
+
+def test_bold_closer_inside_think_doesnt_leak_reasoning():
+    visible, reasoning = strip("<think>a **end thinking** b</think>Visible")
+    assert visible == "Visible"
+    assert reasoning == "a **end thinking** b"
+
+def test_think_tags_inside_bold_section_are_its_text():
+    visible, reasoning = strip("**thinking** try <think> here **end thinking**Answer")
+    assert visible == "Answer"
+    assert reasoning == "try <think> here"
+
+def test_same_kind_nests_across_deltas():
+    visible, _ = strip("<think>a <th", "ink>b</think> c</thi", "nk>Done")
+    assert visible == "Done"
+
+def test_unclosed_bold_marker_is_shown():
+    visible, reasoning = strip("Some **thinking** about it", keep_reasoning=False)
+    assert visible == "Some **thinking** about it"
+    assert reasoning == ""
@@ -0,0 +1,21 @@
+"""
+Tests for chat turn tracing
+"""
+from tracing import Tracer
+
+def test_every_outcome_is_counted_under_the_answering_model():
+    tracer = Tracer(enabled=True, metrics_file="")
+    turn = tracer.start_turn("planned-model")
+    with turn.span("response"):
+        pass
+    breakdown = turn.finish("ok", "fallback-model")
+    assert breakdown["model"] == "fallback-model"
+    tracer.start_turn("planned-model").finish("overloaded")
+    tracer.start_turn("planned-model").finish("error")
+
+    assert tracer.turn_counts() == {
+        ("fallback-model", "ok"): 1, ("planned-model", "overloaded"): 1, ("planned-model", "error"): 1
+    }
+    # Only answered turns go into the latency percentiles
+    assert set(tracer.summary()) == {("fallback-model", "response"), ("fallback-model", "total")}
+    assert 'phin_turns_total{model="planned-model",outcome="overloaded"} 1' in tracer.to_prometheus()
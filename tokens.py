@@ -0,0 +1,16 @@
+"""
+Token estimation for Phin AI Assistant
+A fast local approximation of LLM tokenizers, good enough for prompt budgeting
+"""
+import re
+
+# Words, numbers and individual punctuation marks roughly map to tokens
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    """Estimate how many tokens text will use"""
+    if not text:
+        return 0
+    pieces = _TOKEN_PIECES.findall(text)
+    # Long words split into several sub-word tokens
+    return sum(1 + len(piece) // 8 for piece in pieces)
@@ -0,0 +1,182 @@
+"""
+Latency tracing for Phin AI Assistant
+Times each stage of a chat turn, keeps rolling percentiles per model and
+stage, and can write them to a JSON or Prometheus text metrics file
+"""
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from config import TRACING_ENABLED, TRACE_SAMPLES, METRICS_FILE, METRICS_EXPORT_INTERVAL
+
+QUANTILES = (0.5, 0.95, 0.99)
+_NO_SPAN = contextlib.nullcontext()
+
+class Turn:
+    """The stage timings of one chat turn"""
+
+    def __init__(self, tracer, model):
+        self.tracer = tracer
+        self.model = model
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, seconds) in the order they finished
+        self.outcome = None
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Time the enclosed block as stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, time.perf_counter() - start))
+
+    def timed(self, stage, fn):
+        """Wrap fn so each call is timed as stage (for work handed to other threads)"""
+        def run(*args, **kwargs):
+            with self.span(stage):
+                return fn(*args, **kwargs)
+        return run
+
+    def record(self, stage, seconds):
+        """Record a stage measured elsewhere (e.g. time to first token)"""
+        self.spans.append((stage, seconds))
+
+    def finish(self, outcome="ok", model=None):
+        """Close the turn and fold it into the tracer's counts and percentiles; returns its breakdown
+
+        outcome says how the turn ended ("ok", "empty", "overloaded", "error"),
+        and model is the one that answered if it wasn't the one the turn began with.
+        """
+        self.outcome = outcome
+        if model:
+            self.model = model
+        self.spans.append(("total", time.perf_counter() - self.started))
+        self.tracer.add(self)
+        return self.breakdown()
+
+    def breakdown(self):
+        return {"model": self.model, "outcome": self.outcome, "stages": dict(self.spans)}
+
+class NoopTurn:
+    """Stands in for Turn when tracing is off, so call sites cost almost nothing"""
+
+    def span(self, stage):
+        return _NO_SPAN
+
+    def timed(self, stage, fn):
+        return fn
+
+    def record(self, stage, seconds):
+        pass
+
+    def finish(self, outcome="ok", model=None):
+        return None
+
+_NOOP_TURN = NoopTurn()
+
+class Tracer:
+    def __init__(self, enabled=TRACING_ENABLED, samples=TRACE_SAMPLES,
+                 metrics_file=METRICS_FILE, export_interval=METRICS_EXPORT_INTERVAL):
+        self.enabled = enabled
+        self.samples = samples
+        self.metrics_file = metrics_file
+        self.export_interval = export_interval
+        self.lock = threading.Lock()
+        self.stages = {}  # (model, stage) -> {"count", "sum", "recent"}
+        self.outcomes = {}  # (model, outcome) -> turns
+        self.last_export = 0.0
+
+    def start_turn(self, model):
+        """Begin timing a chat turn for model"""
+        return Turn(self, model) if self.enabled else _NOOP_TURN
+
+    def add(self, turn):
+        """Count a finished turn's outcome; only answered turns' timings go into the percentiles"""
+        with self.lock:
+            key = (turn.model, turn.outcome)
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            for stage, seconds in turn.spans if turn.outcome == "ok" else ():
+                metric = self.stages.get((turn.model, stage))
+                if metric is None:
+                    metric = self.stages[(turn.model, stage)] = {
+                        "count": 0, "sum": 0.0, "recent": deque(maxlen=self.samples)
+                    }
+                metric["count"] += 1
+                metric["sum"] += seconds
+                metric["recent"].append(seconds)
+            export_due = self.metrics_file and time.monotonic() - self.last_export >= self.export_interval
+            if export_due:
+                self.last_export = time.monotonic()
+        if export_due:
+            from executor import background, QueueFull
+            try:
+                background.submit(self.export, key="metrics", name="export_metrics")
+            except QueueFull:
+                pass
+
+    def summary(self, model=None):
+        """Get count, mean and rolling p50/p95/p99 (seconds) per (model, stage)"""
+        with self.lock:
+            snapshot = [
+                (key, metric["count"], metric["sum"], sorted(metric["recent"]))
+                for key, metric in self.stages.items() if model is None or key[0] == model
+            ]
+        summary = {}
+        for key, count, total, recent in snapshot:
+            summary[key] = {"count": count, "mean": total / count, "sum": total}
+            for quantile in QUANTILES:
+                summary[key][f"p{int(quantile * 100)}"] = recent[min(len(recent) - 1, int(len(recent) * quantile))]
+        return summary
+
+    def turn_counts(self, model=None):
+        """Get how many turns ended each way, per (model, outcome)"""
+        with self.lock:
+            return {key: count for key, count in self.outcomes.items() if model is None or key[0] == model}
+
+    def to_json(self):
+        return json.dumps({
+            "generated_at": time.time(),
+            "stages": [{"model": model, "stage": stage, **values} for (model, stage), values in self.summary().items()],
+            "turns": [{"model": model, "outcome": outcome, "count": count}
+                      for (model, outcome), count in self.turn_counts().items()]
+        }, indent=2)
+
+    def to_prometheus(self):
+        """Render the summary in the Prometheus text exposition format"""
+        lines = [
+            "# HELP phin_stage_seconds Latency of each chat turn stage",
+            "# TYPE phin_stage_seconds summary"
+        ]
+        for (model, stage), values in sorted(self.summary().items()):
+            labels = f'model="{model}",stage="{stage}"'
+            for quantile in QUANTILES:
+                lines.append(f'phin_stage_seconds{{{labels},quantile="{quantile}"}} {values[f"p{int(quantile * 100)}"]:.6f}')
+            lines.append(f"phin_stage_seconds_sum{{{labels}}} {values['sum']:.6f}")
+            lines.append(f"phin_stage_seconds_count{{{labels}}} {values['count']}")
+        lines.extend([
+            "# HELP phin_turns_total Chat turns by how they ended",
+            "# TYPE phin_turns_total counter"
+        ])
+        for (model, outcome), count in sorted(self.turn_counts().items()):
+            lines.append(f'phin_turns_total{{model="{model}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Write the metrics file atomically (.prom for Prometheus text, anything else JSON)"""
+        payload = self.to_prometheus() if self.metrics_file.endswith(".prom") else self.to_json()
+        directory = os.path.dirname(self.metrics_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.metrics_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+tracer = Tracer()
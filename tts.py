@@ -0,0 +1,140 @@
+"""
+Text-to-speech for Phin AI Assistant
+One long-lived worker thread owns the pyttsx3 engine and speaks queued
+sentences, so replies can start playing while they are still streaming
+"""
+import queue
+import re
+import threading
+from config import TTS_DRIVER, TTS_QUEUE_SIZE, TTS_RATE, TTS_VOLUME, TTS_PREFERRED_VOICES
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+_MARKDOWN = re.compile(r'[*#`_]')
+
+def clean_for_speech(text):
+    """Strip markdown characters that would otherwise be read aloud"""
+    return _MARKDOWN.sub('', text).strip()
+
+class TTSWorker:
+    def __init__(self, driver=TTS_DRIVER, max_queue=TTS_QUEUE_SIZE):
+        self.driver = driver
+        self.jobs = queue.Queue(max_queue)
+        self.generation = 0  # Bumped by cancel(); queued sentences from older generations are skipped
+        self.lock = threading.Lock()
+        self.thread = None
+        self.engine = None
+        self.speaking = None  # Generation of the sentence being spoken
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="tts-worker", daemon=True)
+                self.thread.start()
+
+    def speak(self, text, interrupt=True):
+        """Queue text to be spoken sentence by sentence, by default replacing whatever is playing"""
+        if interrupt:
+            self.cancel()
+        stream = self.stream()
+        stream.feed(text)
+        stream.flush()
+
+    def stream(self):
+        """Get a SentenceStream that speaks each sentence as soon as it's complete"""
+        self.start()
+        return SentenceStream(self, self.generation)
+
+    def enqueue(self, generation, sentence):
+        try:
+            self.jobs.put_nowait((generation, sentence))
+        except queue.Full:
+            # Speech is far behind the text; drop rather than block the caller
+            print("TTS queue full, skipping a sentence")
+
+    def cancel(self):
+        """Stop the current utterance and discard queued sentences"""
+        with self.lock:
+            self.generation += 1
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                break
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def create_engine(self):
+        """Create the engine once, with the preferred voice and speech settings"""
+        from utils import import_optional
+        pyttsx3 = import_optional("pyttsx3", "Text-to-speech")
+        if pyttsx3 is None:
+            return None
+        engine = pyttsx3.init(self.driver) if self.driver else pyttsx3.init()
+        for voice in engine.getProperty('voices') or []:
+            name = (voice.name or "").lower()
+            if any(preferred in name for preferred in TTS_PREFERRED_VOICES):
+                engine.setProperty('voice', voice.id)
+                break
+        engine.setProperty('rate', TTS_RATE)
+        engine.setProperty('volume', TTS_VOLUME)
+        # Checked at each word so cancel() cuts the current sentence short
+        engine.connect('started-word', self.on_word)
+        return engine
+
+    def on_word(self, name, location, length):
+        if not self.is_current(self.speaking):
+            self.engine.stop()
+
+    def run(self):
+        """Speak queued sentences until the process exits"""
+        try:
+            self.engine = self.create_engine()
+        except Exception as e:
+            print(f"TTS Error: {e}")
+        while True:
+            generation, sentence = self.jobs.get()
+            if self.engine is None or not self.is_current(generation):
+                continue
+            self.speaking = generation
+            try:
+                self.engine.say(sentence)
+                self.engine.runAndWait()
+            except Exception as e:
+                print(f"TTS Error: {e}")
+
+class SentenceStream:
+    """Buffers streamed text and queues each complete sentence for speech"""
+
+    def __init__(self, worker, generation):
+        self.worker = worker
+        self.generation = generation
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        parts = _SENTENCE_END.split(self.buffer)
+        # The last part may be an unfinished sentence
+        self.buffer = parts.pop()
+        for part in parts:
+            self.queue(part)
+
+    def flush(self):
+        self.queue(self.buffer)
+        self.buffer = ""
+
+    def queue(self, sentence):
+        sentence = clean_for_speech(sentence)
+        if sentence and self.worker.is_current(self.generation):
+            self.worker.enqueue(self.generation, sentence)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_worker():
+    """Get the process-wide TTS worker"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = TTSWorker()
+    return _worker
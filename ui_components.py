@@ -2,12 +2,22 @@
 UI Components for Phin AI Assistant
 """
 import streamlit as st
-import os
-import json
-import threading
+import sqlite3
 from datetime import datetime
-from utils import copy_to_clipboard, speech_to_text, text_to_speech
-from config import AVAILABLE_MODELS
+from utils import copy_to_clipboard, speech_to_text, text_to_speech, has_optional
+from summarizer import reset_summary
+from file_index import FileIndex
+from chat_store import chat_store, new_chat_id
+from tts import get_worker as get_tts_worker
+from executor import background, QueueFull
+from tracing import tracer
+from router import router
+from rate_limiter import rate_limiter
+from config import (
+    AVAILABLE_MODELS, ANIMATION_MODES, FILE_UPLOAD_TYPES, CHAT_PAGE_SIZE, CHAT_SEARCH_RESULTS,
+    CHAT_RENDER_WINDOW, CHAT_RENDER_STEP, VOICE_DEPENDENCIES,
+    BACKGROUND_SUBMIT_TIMEOUT, ROUTER_FAST_MODEL
+)
 
 def render_sidebar():
     """Render the sidebar with all settings"""
@@ -21,6 +31,12 @@ def render_sidebar():
             index=list(AVAILABLE_MODELS.keys()).index(st.session_state.selected_model)
         )
         st.session_state.selected_model = [k for k, v in AVAILABLE_MODELS.items() if v == selected_model_name][0]
+        if router.stats().get(st.session_state.selected_model, {}).get("state") == "retired":
+            st.caption(f"⚠️ {selected_model_name} is no longer served; replies come from fallback models")
+        st.session_state.auto_route = st.toggle(
+            "🧭 Auto Route", value=st.session_state.auto_route,
+            help=f"Send short, simple prompts to {AVAILABLE_MODELS[ROUTER_FAST_MODEL]}"
+        )
         
         # Model parameters
         st.session_state.temperature = st.slider("🌡️ Temperature", 0.0, 2.0, st.session_state.temperature, 0.1)
@@ -29,7 +45,34 @@ def render_sidebar():
         # Features
         st.session_state.use_web_search = st.toggle("🔍 Web Search", value=st.session_state.use_web_search)
         st.session_state.streaming_enabled = st.toggle("⚡ Stream Responses", value=st.session_state.streaming_enabled)
+        st.session_state.show_reasoning = st.toggle(
+            "💭 Show Reasoning", value=st.session_state.show_reasoning,
+            help="Keep the model's thinking in a collapsed section under each reply"
+        )
         st.session_state.voice_enabled = st.toggle("🎤 Voice Features", value=st.session_state.voice_enabled)
+        if st.session_state.voice_enabled:
+            missing = [name for name, module in VOICE_DEPENDENCIES if not has_optional(module)]
+            if missing:
+                st.caption(f"Not installed: {', '.join(missing)}; those voice features are off")
+        st.session_state.use_response_cache = st.toggle(
+            "♻️ Response Cache", value=st.session_state.use_response_cache,
+            help="Reuse answers to repeated prompts when temperature is low"
+        )
+        if st.session_state.use_response_cache:
+            from response_cache import response_cache
+            cache_stats = response_cache.stats()
+            st.caption(
+                f"Hits {cache_stats['hits']} · Misses {cache_stats['misses']} · "
+                f"{cache_stats['bytes'] / 1024:.1f} KB cached"
+            )
+        
+        # Animation mode for non-streamed responses
+        selected_animation = st.selectbox(
+            "✨ Animation",
+            options=list(ANIMATION_MODES.values()),
+            index=list(ANIMATION_MODES.keys()).index(st.session_state.animation_mode)
+        )
+        st.session_state.animation_mode = [k for k, v in ANIMATION_MODES.items() if v == selected_animation][0]
         
         # Language selection (force English)
         st.session_state.selected_language = 'en'
@@ -48,12 +91,17 @@ def render_sidebar():
         
         st.divider()
         
+        # Uploaded files
+        st.subheader("📎 Files")
+        render_file_uploader()
+        
+        st.divider()
+        
         # Memory Management
         st.subheader("🧠 Memory")
         if st.button("Clear Memory", use_container_width=True):
-            from memory import conversation_memory
-            conversation_memory.memory_data = conversation_memory.get_default_memory()
-            conversation_memory.save_memory()
+            from memory import get_conversation_memory
+            get_conversation_memory(st.session_state.user_id).clear()
             st.success("Memory cleared!")
         
         st.divider()
@@ -68,6 +116,11 @@ def render_sidebar():
         
         st.divider()
         
+        # Stage timings, when tracing is on
+        if tracer.enabled:
+            render_performance_panel()
+            st.divider()
+        
         # Credits
         st.subheader("📜 Credits")
         st.markdown("""
@@ -95,6 +148,62 @@ def render_sidebar():
         # Version info
         st.caption("Version 1.0.0")
 
+def format_markdown_table(headers, rows):
+    """Format rows as a markdown table"""
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines.extend("| " + " | ".join(str(cell) for cell in row) + " |" for row in rows)
+    return "\n".join(lines)
+
+def render_performance_panel():
+    """Show the last turn's stage timings, rolling percentiles for the selected model, model health, rate limits and background queue stats"""
+    with st.expander("🩺 Performance"):
+        last_trace = st.session_state.get('last_trace')
+        if last_trace:
+            outcome = last_trace.get("outcome")
+            st.markdown("**Last turn**" + (f" ({outcome})" if outcome and outcome != "ok" else ""))
+            st.markdown(format_markdown_table(
+                ["Stage", "ms"],
+                [[stage, f"{seconds * 1000:.0f}"] for stage, seconds in last_trace["stages"].items()]
+            ))
+        
+        summary = tracer.summary(st.session_state.selected_model)
+        if summary:
+            st.markdown(f"**{st.session_state.selected_model}**")
+            st.markdown(format_markdown_table(
+                ["Stage", "n", "p50 ms", "p95 ms", "p99 ms"],
+                [
+                    [stage, values["count"]] + [f"{values[p] * 1000:.0f}" for p in ("p50", "p95", "p99")]
+                    for (_, stage), values in summary.items()
+                ]
+            ))
+        elif not last_trace:
+            st.caption("No turns timed yet")
+        
+        turns = tracer.turn_counts(st.session_state.selected_model)
+        if turns:
+            st.caption("Turns: " + " · ".join(f"{count} {outcome}" for (_, outcome), count in sorted(turns.items())))
+        
+        for model, health in router.stats().items():
+            latency = f"{health['latency'] * 1000:.0f} ms to first token" if health['latency'] is not None else "no latency yet"
+            st.caption(
+                f"{AVAILABLE_MODELS.get(model, model)}: {health['state']} · {latency} · "
+                f"{health['error_rate']:.0%} errors ({health['failures']}/{health['requests']})"
+            )
+        
+        for model, counts in rate_limiter.stats().items():
+            st.caption(
+                f"{AVAILABLE_MODELS.get(model, model)} rate limit: {counts['waiting']} waiting · "
+                f"{counts['admitted']} admitted · {counts['queued']} queued · {counts['shed']} turned away"
+            )
+        
+        stats = background.stats()
+        st.caption(f"Background tasks: {stats['pending']} pending · peak {stats['max_depth']}")
+        for name, task in stats["tasks"].items():
+            st.caption(
+                f"{name}: {task['completed']} done · {task['failed']} failed · "
+                f"wait p95 {task['wait_p95'] * 1000:.0f} ms · run p95 {task['run_p95'] * 1000:.0f} ms"
+            )
+
 def render_chat_controls():
     """Render chat management controls"""
     col1, col2 = st.columns(2)
@@ -107,16 +216,25 @@ def render_chat_controls():
     
     with col2:
         if st.button("🗑️ Clear Chat"):
+            # The saved log is kept; later messages go to a new chat
+            st.session_state.chat_id = new_chat_id()
+            st.session_state.last_saved_count = 0
+            st.session_state.render_window = CHAT_RENDER_WINDOW
             st.session_state.messages = []
             st.session_state.chat_ratings = {}
+            st.session_state.memory_cursor = 0
+            reset_summary(st.session_state)
             st.rerun()
     
     # Load chat
     chat_files = get_chat_files()
     if chat_files:
-        selected_file = st.selectbox("📂 Load Chat", [""] + chat_files)
-        if selected_file and st.button("📖 Load"):
-            load_chat_history(f"chat_history/{selected_file}")
+        labels = {chat["chat_id"]: format_chat_label(chat) for chat in chat_files}
+        selected_chat = st.selectbox(
+            "📂 Load Chat", [""] + list(labels), format_func=lambda chat_id: labels.get(chat_id, "")
+        )
+        if selected_chat and st.button("📖 Load"):
+            load_chat_history(selected_chat)
             st.rerun()
     
     # Export chat
@@ -134,85 +252,158 @@ def render_voice_input():
     """Render voice input section"""
     if st.session_state.voice_enabled:
         col1, col2 = st.columns([3, 1])
+        with col1:
+            if st.button("⏹️ Stop Speaking"):
+                get_tts_worker().cancel()
         with col2:
             if st.button("🎤 Voice Input"):
                 voice_text = speech_to_text()
                 if voice_text:
                     st.session_state.voice_input = voice_text
 
+def render_reasoning(reasoning):
+    """Show a reply's reasoning in a collapsed expander"""
+    with st.expander("💭 Reasoning"):
+        st.markdown(reasoning)
+
+def render_queue_position(placeholder, status):
+    """Show a turn held by the rate limiter's place in line instead of the thinking animation"""
+    ahead = status.position - 1
+    waiting = f"{ahead} request{'s' if ahead != 1 else ''} ahead of yours" if ahead else "yours is next"
+    placeholder.info(f"⏳ Waiting for Groq capacity: {waiting} (about {max(1, round(status.wait))}s)")
+
+@st.fragment
+def render_message_actions(i, content):
+    """Copy, speak and rating buttons for one reply; clicks rerun only this fragment"""
+    rating = st.session_state.chat_ratings.get(i)
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
+    
+    with col1:
+        if st.button("📋", key=f"copy_{i}"):
+            copy_to_clipboard(content)
+    
+    with col2:
+        if st.session_state.voice_enabled and st.button("🔊", key=f"speak_{i}"):
+            text_to_speech(content)
+    
+    # Ratings are set in callbacks, so the fragment's own rerun already shows them
+    with col3:
+        st.button("Good", key=f"like_{i}", type="primary" if rating == "like" else "secondary",
+                  on_click=rate_message, args=(i, "like"))
+    
+    with col4:
+        st.button("Poor", key=f"dislike_{i}", type="primary" if rating == "dislike" else "secondary",
+                  on_click=rate_message, args=(i, "dislike"))
+
+def rate_message(i, rating):
+    """Record a rating for message i and save it"""
+    if st.session_state.chat_ratings.get(i) == rating:
+        return
+    st.session_state.chat_ratings[i] = rating
+    save_chat_history()
+
 def render_chat_messages():
-    """Render chat message history"""
-    for i, message in enumerate(st.session_state.messages):
+    """Render the most recent messages, with a control to reveal earlier ones"""
+    messages = st.session_state.messages
+    start = max(0, len(messages) - st.session_state.render_window)
+    if start > 0:
+        if st.button(f"⬆️ Load earlier messages ({start} hidden)", key="load_earlier_messages"):
+            st.session_state.render_window += CHAT_RENDER_STEP
+            st.rerun()
+    
+    for i in range(start, len(messages)):
+        message = messages[i]
         with st.chat_message(message["role"]):
             # Always display in English - no translation
             st.markdown(f'<div class="response-content">{message["content"]}</div>', unsafe_allow_html=True)
             
             # Add copy button and rating for assistant messages
             if message["role"] == "assistant":
-                col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
-                
-                with col1:
-                    if st.button("📋", key=f"copy_{i}"):
-                        copy_to_clipboard(message["content"])
-                
-                with col2:
-                    if st.session_state.voice_enabled and st.button("🔊", key=f"speak_{i}"):
-                        threading.Thread(target=text_to_speech, args=(message["content"],)).start()
-                
-                with col3:
-                    if st.button("Good", key=f"like_{i}"):
-                        st.session_state.chat_ratings[i] = "like"
-                        st.rerun()
-                
-                with col4:
-                    if st.button("Poor", key=f"dislike_{i}"):
-                        st.session_state.chat_ratings[i] = "dislike"
-                        st.rerun()
+                if message.get("reasoning") and st.session_state.show_reasoning:
+                    render_reasoning(message["reasoning"])
+                render_message_actions(i, message["content"])
 
 # Chat history management functions
 def save_chat_history():
-    """Save current chat history to file"""
+    """Queue a save of the current chat's new messages and ratings to its log
+
+    Saves run on the background executor, one at a time per chat, so a
+    snapshot can never land on top of a newer one.
+    """
     if not st.session_state.messages:
         return None
     
-    os.makedirs("chat-history", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_{timestamp}.json"
-    filepath = f"chat-history/{filename}"
-    
+    chat_id = st.session_state.chat_id
+    # The task gets copies since it has no access to session state
+    messages = list(st.session_state.messages)
+    ratings = dict(st.session_state.chat_ratings)
     try:
-        with open(filepath, 'w') as f:
-            json.dump({
-                'messages': st.session_state.messages,
-                'ratings': st.session_state.chat_ratings,
-                'timestamp': timestamp
-            }, f, indent=2)
-        return filename
-    except Exception as e:
+        background.submit(chat_store.save, chat_id, messages, ratings, key=("chat", chat_id), name="save_chat")
+    except QueueFull as e:
         st.error(f"Save failed: {str(e)}")
         return None
+    st.session_state.last_saved_count = len(messages)
+    return chat_id
+
+def render_file_uploader():
+    """Index newly uploaded files and drop the ones removed from the uploader"""
+    uploaded_files = st.file_uploader(
+        "Attach files", type=FILE_UPLOAD_TYPES, accept_multiple_files=True,
+        key=f"file_uploader_{st.session_state.uploader_generation}"
+    )
+    file_index = st.session_state.file_index
+    current = {uploaded.name: uploaded for uploaded in uploaded_files or []}
+    for filename in list(file_index.files):
+        if filename not in current:
+            file_index.remove_file(filename)
+    for filename, uploaded in current.items():
+        # Files are indexed once; reruns only compare the name and size
+        if file_index.has_file(filename, uploaded.size):
+            continue
+        try:
+            chunks = file_index.add_file(filename, uploaded, uploaded.size)
+            if not chunks:
+                st.warning(f"No text found in {filename}")
+        except Exception as e:
+            file_index.remove_file(filename)
+            st.error(f"Could not read {filename}: {str(e)}")
+    if len(file_index):
+        chunk_count = sum(len(chunk_ids) for _, chunk_ids in file_index.files.values())
+        st.caption(f"{len(file_index)} file(s), {chunk_count} chunks indexed")
 
-def load_chat_history(filepath):
-    """Load chat history from file"""
+def load_chat_history(chat_id):
+    """Load a saved chat and continue it under the same ID"""
     try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        st.session_state.messages = data.get('messages', [])
-        st.session_state.chat_ratings = data.get('ratings', {})
+        # Let a save still queued for this chat land first
+        background.wait(("chat", chat_id), BACKGROUND_SUBMIT_TIMEOUT)
+        messages, ratings = chat_store.load(chat_id)
+        st.session_state.chat_id = chat_id
+        st.session_state.messages = messages
+        st.session_state.chat_ratings = ratings
+        st.session_state.last_saved_count = len(messages)
+        st.session_state.render_window = CHAT_RENDER_WINDOW
+        # Loaded messages were analyzed when they were first sent
+        st.session_state.memory_cursor = len(st.session_state.messages)
+        reset_summary(st.session_state)
         st.success("Chat loaded successfully!")
     except Exception as e:
         st.error(f"Load failed: {str(e)}")
 
-def get_chat_files():
-    """Get list of saved chat files"""
-    if not os.path.exists("chat-history"):
-        return []
+def get_chat_files(page=0):
+    """Get one page of saved chats' metadata, most recently updated first"""
     try:
-        files = [f for f in os.listdir("chat-history") if f.endswith('.json')]
-        return sorted(files, reverse=True)
-    except:
+        return chat_store.list_chats(page * CHAT_PAGE_SIZE, CHAT_PAGE_SIZE)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error listing chats: {e}")
         return []
 
+def format_chat_label(chat):
+    """Label a chat by its title, or by its creation time for untitled chats"""
+    if chat.get("title"):
+        return chat["title"]
+    chat_id = chat["chat_id"]
+    return f"{chat_id[:8]} {chat_id[9:11]}:{chat_id[11:13]}"
+
 def export_chat_as_text():
     """Export chat as plain text"""
     if not st.session_state.messages:
@@ -227,22 +418,55 @@ def export_chat_as_text():
     
     return text_content
 
+def render_chat_search_results(query):
+    """List the saved chats whose messages best match query, with a snippet from each"""
+    try:
+        hits = chat_store.search(query, CHAT_SEARCH_RESULTS * 3)
+    except sqlite3.Error as e:
+        st.error(f"Search failed: {str(e)}")
+        return
+    shown = set()
+    for hit in hits:
+        if hit["chat_id"] in shown:
+            continue
+        shown.add(hit["chat_id"])
+        if st.button(f"💬 {format_chat_label(hit)}", key=f"search_{hit['chat_id']}"):
+            load_chat_history(hit["chat_id"])
+        st.caption(hit["snippet"])
+        if len(shown) == CHAT_SEARCH_RESULTS:
+            break
+    if not shown:
+        st.write("No matching chats")
+
 def render_chat_history_sidebar():
     """Render chat history in sidebar"""
-    chat_files = get_chat_files()
+    query = st.text_input("🔎 Search chats", key="chat_search_query")
+    if query.strip():
+        render_chat_search_results(query)
+        return
+    
+    page = st.session_state.chat_history_page
+    chat_files = get_chat_files(page)
     
     if chat_files:
         st.write("Recent Chats:")
-        for chat_file in chat_files[:10]:  # Show last 10 chats
-            # Extract timestamp from filename for display
-            try:
-                timestamp = chat_file.replace('chat_', '').replace('.json', '')
-                display_name = f"💬 {timestamp[:8]} {timestamp[9:11]}:{timestamp[11:13]}"
-            except:
-                display_name = f"💬 {chat_file}"
-            
-            if st.button(display_name, key=f"load_{chat_file}"):
-                load_chat_history(f"chat-history/{chat_file}")
+        for chat in chat_files:
+            if st.button(f"💬 {format_chat_label(chat)}", key=f"load_{chat['chat_id']}"):
+                load_chat_history(chat["chat_id"])
+        
+        # Only one page is listed at a time, however many chats are saved
+        col1, col2 = st.columns(2)
+        with col1:
+            if page > 0 and st.button("◀ Newer", key="chat_page_newer", use_container_width=True):
+                st.session_state.chat_history_page -= 1
+                st.rerun()
+        with col2:
+            if len(chat_files) == CHAT_PAGE_SIZE and st.button("Older ▶", key="chat_page_older", use_container_width=True):
+                st.session_state.chat_history_page += 1
+                st.rerun()
+    elif page > 0:
+        st.session_state.chat_history_page = 0
+        st.rerun()
     else:
         st.write("No saved chats yet")
 
@@ -255,9 +479,7 @@ def auto_save_chat():
         
         current_count = len(st.session_state.messages)
         if current_count > st.session_state.last_saved_count:
-            # Use threading to prevent blocking and loops
-            threading.Thread(target=save_chat_history, daemon=True).start()
-            st.session_state.last_saved_count = current_count
+            save_chat_history()
 
 def create_new_chat():
     """Create a new chat by clearing current messages and resetting state"""
@@ -266,12 +488,16 @@ def create_new_chat():
         save_chat_history()
     
     # Clear current chat
+    st.session_state.chat_id = new_chat_id()
+    st.session_state.render_window = CHAT_RENDER_WINDOW
     st.session_state.messages = []
     st.session_state.chat_ratings = {}
     st.session_state.last_saved_count = 0
+    st.session_state.memory_cursor = 0
+    reset_summary(st.session_state)
     
-    # Clear any uploaded file content
-    if 'uploaded_files_content' in st.session_state:
-        st.session_state.uploaded_files_content = {}
+    # Clear any uploaded files (a new uploader key empties the widget too)
+    st.session_state.file_index = FileIndex()
+    st.session_state.uploader_generation += 1
     
     st.success("New chat created!")
@@ -2,16 +2,51 @@
 Utility functions for Phin AI Assistant
 """
 import streamlit as st
-import speech_recognition as sr
-import pyttsx3
-import pyperclip
+import importlib
+import importlib.util
 import threading
 import time
-from duckduckgo_search import DDGS
-from deep_translator import GoogleTranslator
+import re
+from rate_limiter import Overloaded
+from config import (
+    STREAM_UPDATE_INTERVAL, STREAM_UPDATE_TOKENS, STREAM_MIN_GROWTH,
+    MAX_ANIMATION_UPDATES, ANIMATION_FRAME_DELAY,
+    TYPEWRITER_CHARS_PER_SECOND, TYPEWRITER_MAX_DURATION
+)
+
+# Reasoning sections: <think>...</think> and **thinking** ... **end thinking**
+_REASONING_TAG = re.compile(r'<(/)?think>|\*\*(end )?thinking\*\*', re.IGNORECASE)
+_REASONING_TAGS = ("<think>", "</think>", "**thinking**", "**end thinking**")
+_TAG_PREFIXES = frozenset(tag[:length] for tag in _REASONING_TAGS for length in range(1, len(tag)))
+_MAX_TAG_LENGTH = max(len(tag) for tag in _REASONING_TAGS)
+_BLANK_LINES = re.compile(r'\n\s*\n\s*\n')
+
+# Optional dependencies, imported on first use (None when unavailable)
+_optional_modules = {}
+
+def has_optional(module_name):
+    """Check whether an optional dependency is installed, without importing it"""
+    if module_name in _optional_modules:
+        return _optional_modules[module_name] is not None
+    return importlib.util.find_spec(module_name) is not None
+
+def import_optional(module_name, feature):
+    """Import an optional dependency on first use, or return None if it can't be loaded"""
+    if module_name not in _optional_modules:
+        try:
+            _optional_modules[module_name] = importlib.import_module(module_name)
+        except Exception as e:
+            # ImportError, or e.g. OSError when a system audio library is missing
+            print(f"{feature} unavailable: could not import {module_name} ({e})")
+            _optional_modules[module_name] = None
+    return _optional_modules[module_name]
 
 def copy_to_clipboard(text):
     """Copy text to clipboard"""
+    pyperclip = import_optional("pyperclip", "Clipboard copy")
+    if pyperclip is None:
+        st.warning("Clipboard copy isn't available (pyperclip is not installed)")
+        return
     try:
         pyperclip.copy(text)
         st.success("Copied to clipboard!")
@@ -20,6 +55,10 @@ def copy_to_clipboard(text):
 
 def speech_to_text():
     """Convert speech to text using microphone"""
+    sr = import_optional("speech_recognition", "Voice input")
+    if sr is None:
+        st.warning("Voice input isn't available (SpeechRecognition is not installed)")
+        return None
     try:
         r = sr.Recognizer()
         with sr.Microphone() as source:
@@ -37,74 +76,28 @@ def speech_to_text():
         return None
 
 def text_to_speech(text):
-    """Convert text to speech"""
-    try:
-        engine = pyttsx3.init()
-        
-        # Get available voices and set to a more natural one if available
-        voices = engine.getProperty('voices')
-        if voices:
-            # Try to find a female voice or more natural sounding voice
-            for voice in voices:
-                if 'female' in voice.name.lower() or 'samantha' in voice.name.lower() or 'alex' in voice.name.lower():
-                    engine.setProperty('voice', voice.id)
-                    break
-        
-        # Set natural speech parameters
-        engine.setProperty('rate', 180)  # Slightly faster, more natural
-        engine.setProperty('volume', 0.9)
-        
-        # Clean text for better speech but keep full response
-        clean_text = text.replace('*', '').replace('#', '').replace('`', '')
-        clean_text = clean_text.replace('**', '').replace('_', '')  # Remove more markdown
-        
-        # Split into sentences and read all of them
-        sentences = clean_text.split('. ')
-        for sentence in sentences:
-            if sentence.strip():
-                engine.say(sentence.strip())
-        
-        engine.runAndWait()
-    except Exception as e:
-        st.error(f"TTS Error: {str(e)}")
+    """Speak text on the shared TTS worker, interrupting anything already playing"""
+    from tts import get_worker
+    get_worker().speak(text)
 
 def web_search(query, num_results=3):
     """Perform web search using DuckDuckGo with English results only"""
-    try:
-        with DDGS() as ddgs:
-            # Force English results only
-            results = list(ddgs.text(f"{query} lang:en", region='us-en', max_results=num_results))
-            # Filter out non-English results
-            english_results = []
-            for result in results:
-                title = result.get('title', '')
-                body = result.get('body', '')
-                # Skip if title or body contains Chinese characters
-                if not any('\u4e00' <= char <= '\u9fff' for char in title + body):
-                    english_results.append(result)
-            return english_results[:num_results]
-    except Exception as e:
-        st.error(f"Search error: {str(e)}")
-        return []
+    from search import search_service
+    return search_service.search(query, num_results)
+
+def collapse_blank_lines(text):
+    """Squeeze runs of blank lines to one and trim the ends"""
+    return _BLANK_LINES.sub('\n\n', text).strip()
+
+def split_reasoning(response, keep_reasoning=True):
+    """Split a complete response into its answer and its reasoning sections"""
+    stripper = ThinkTagStripper(keep_reasoning)
+    answer = stripper.feed(response) + stripper.flush()
+    return collapse_blank_lines(answer), stripper.reasoning_text()
 
 def clean_response(response):
     """Clean and format AI response"""
-    # Remove any thinking sections (more thorough cleaning)
-    while "<think>" in response and "</think>" in response:
-        start = response.find("<think>")
-        end = response.find("</think>") + len("</think>")
-        response = response[:start] + response[end:]
-    
-    # Remove any remaining thinking patterns
-    import re
-    response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
-    response = re.sub(r'\*\*thinking\*\*.*?\*\*end thinking\*\*', '', response, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Clean up extra whitespace
-    response = re.sub(r'\n\s*\n\s*\n', '\n\n', response)
-    response = response.strip()
-    
-    return response
+    return split_reasoning(response, keep_reasoning=False)[0]
 
 def get_supported_languages():
     """Get supported languages for translation"""
@@ -124,49 +117,232 @@ def translate_text(text, target_lang):
     """Translate text to target language"""
     if target_lang == 'en':
         return text
+    deep_translator = import_optional("deep_translator", "Translation")
+    if deep_translator is None:
+        return text
     try:
-        translator = GoogleTranslator(source='en', target=target_lang)
+        translator = deep_translator.GoogleTranslator(source='en', target=target_lang)
         return translator.translate(text)
     except Exception as e:
         st.error(f"Translation error: {str(e)}")
         return text
 
-def stream_response(client, messages, model, temperature, max_tokens, thinking_placeholder):
-    """Stream AI response with letter-by-letter typewriter effect"""
-    try:
-        response = client.chat.completions.create(
-            messages=messages,
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=True
+def split_animation_frames(text, max_frames=MAX_ANIMATION_UPDATES):
+    """Split text into at most max_frames cumulative prefixes on word/line boundaries"""
+    boundaries = [match.end() for match in re.finditer(r'\S+\s*', text)]
+    if not boundaries:
+        return [text]
+    step = max(1, -(-len(boundaries) // max_frames))
+    frames = [text[:boundaries[i]] for i in range(step - 1, len(boundaries), step)]
+    if frames[-1] != text:
+        frames.append(text)
+    return frames[-max_frames:]
+
+def animate_response(placeholder, text, mode="chunk"):
+    """Display a finished response with a bounded-cost animation"""
+    if mode == "chunk":
+        for frame in split_animation_frames(text)[:-1]:
+            placeholder.markdown(f'<div class="response-content">{frame}</div>', unsafe_allow_html=True)
+            time.sleep(ANIMATION_FRAME_DELAY)
+    elif mode == "css":
+        # Send the text once and let the browser run the typewriter reveal
+        duration = min(len(text) / TYPEWRITER_CHARS_PER_SECOND, TYPEWRITER_MAX_DURATION)
+        steps = max(1, text.count('\n') + len(text) // 80)
+        placeholder.markdown(
+            f'<div class="response-content complete typewriter" '
+            f'style="animation-duration: {duration:.2f}s; animation-timing-function: steps({steps}, end);">{text}</div>',
+            unsafe_allow_html=True
         )
+        return
+    placeholder.markdown(f'<div class="response-content complete">{text}</div>', unsafe_allow_html=True)
+
+class ThinkTagStripper:
+    """Incrementally strip reasoning sections from streamed text in one pass
+
+    Handles <think>...</think> and **thinking** ... **end thinking** sections,
+    nested ones included, and optionally keeps their text as the reasoning.
+    Inside a section only its own kind of tag counts; the other kind is text.
+    A <think> section still open when the stream ends is reasoning cut short;
+    an unclosed **thinking** marker was most likely bold text, so it's shown.
+    """
+
+    def __init__(self, keep_reasoning=False):
+        self.keep_reasoning = keep_reasoning
+        self.open_kinds = []  # Kind of each open section's tag ("think" or "bold"), outermost first
+        self.pending = ""  # A possible partial tag, held until the next delta
+        self.opener = None  # Tag that opened the outermost open section
+        self.section = []  # Text of the outermost open section, when it may be needed
+        self.reasoning = []  # Text of each closed section (when keep_reasoning)
+
+    def feed(self, chunk):
+        """Feed a stream delta and return the visible text it produces"""
+        text = self.pending + chunk
+        visible = []
+        pos = 0
+        for match in _REASONING_TAG.finditer(text):
+            self._emit(text[pos:match.start()], visible)
+            pos = match.end()
+            kind = "think" if match.group(0).startswith("<") else "bold"
+            if self.open_kinds and kind != self.open_kinds[0]:
+                # The other kind of marker inside a section is just part of its text
+                self._emit(match.group(0), visible)
+                continue
+            if match.group(1) or match.group(2):
+                if not self.open_kinds:
+                    # A closing tag with nothing open is dropped
+                    continue
+                self.open_kinds.pop()
+                if not self.open_kinds:
+                    self._close_section()
+            else:
+                self.open_kinds.append(kind)
+                if len(self.open_kinds) == 1:
+                    self.opener = match.group(0)
+        # Hold back a partial tag at the end until the next delta arrives
+        keep = self._partial_tag_length(text, pos)
+        self._emit(text[pos:len(text) - keep], visible)
+        self.pending = text[len(text) - keep:] if keep else ""
+        return "".join(visible)
+
+    def flush(self):
+        """Return any held-back text once the stream has ended"""
+        remaining = self.pending
+        self.pending = ""
+        if not self.open_kinds:
+            return remaining
+        self.open_kinds = []
+        if self.opener.startswith("*"):
+            text = self.opener + "".join(self.section) + remaining
+            self.section = []
+            self.opener = None
+            return text
+        self.section.append(remaining)
+        self._close_section()
+        return ""
+
+    def reasoning_text(self):
+        """Get the kept reasoning, one paragraph per section"""
+        return collapse_blank_lines("\n\n".join(part.strip() for part in self.reasoning if part.strip()))
+
+    def _emit(self, text, visible):
+        if not self.open_kinds:
+            visible.append(text)
+        elif self.keep_reasoning or self.opener.startswith("*"):
+            self.section.append(text)
+
+    def _close_section(self):
+        if self.keep_reasoning:
+            self.reasoning.append("".join(self.section))
+        self.section = []
+        self.opener = None
+
+    @staticmethod
+    def _partial_tag_length(text, pos):
+        """Length of the longest end of text that could be the start of a tag"""
+        tail = text[max(pos, len(text) - _MAX_TAG_LENGTH + 1):]
+        if "<" not in tail and "*" not in tail:
+            # Every tag starts with one of these
+            return 0
+        for length in range(min(_MAX_TAG_LENGTH - 1, len(text) - pos), 0, -1):
+            if text[-length:].lower() in _TAG_PREFIXES:
+                return length
+        return 0
+
+def stream_response(chunks, thinking_placeholder, speech=None, keep_reasoning=False, turn=None):
+    """Stream AI response, repainting the placeholder as deltas arrive
+
+    Returns (answer, reasoning); reasoning is only collected with keep_reasoning.
+    If speech (a tts.SentenceStream) is given, each sentence is spoken as soon as it's complete.
+    If turn (a tracing.Turn) is given, queueing, first-token and generation times are recorded on it.
+    Raises rate_limiter.Overloaded if the rate limiter turned the request away.
+    """
+    try:
+        request_start = time.perf_counter()
         
-        full_response = ""
+        stripper = ThinkTagStripper(keep_reasoning)
+        visible_text = ""
         placeholder = st.empty()
-        first_chunk = True
-        
-        # Collect full response first
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                if first_chunk:
-                    thinking_placeholder.empty()
-                    first_chunk = False
-                
-                full_response += chunk.choices[0].delta.content
+        first_token_time = None
+        first_visible = True
+        token_count = 0
+        usage_tokens = None
+        queue_time = None
+        response_model = None
+        last_update = request_start
+        tokens_since_update = 0
+        painted_length = 0
         
-        # Now animate letter by letter
-        clean_final = clean_response(full_response)
-        displayed_text = ""
+        for chunk in chunks:
+            if response_model is None:
+                response_model = getattr(chunk, 'model', None)
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+            if usage is not None:
+                usage_tokens = usage.completion_tokens
+                queue_time = getattr(usage, 'queue_time', None)
+            if not chunk.choices or chunk.choices[0].delta.content is None:
+                continue
+            
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            token_count += 1
+            tokens_since_update += 1
+            visible_delta = stripper.feed(chunk.choices[0].delta.content)
+            visible_text += visible_delta
+            if speech is not None and visible_delta:
+                speech.feed(visible_delta)
+            
+            # Coalesce repaints on a frame budget instead of once per token
+            now = time.perf_counter()
+            if not visible_text.strip():
+                continue
+            if first_visible:
+                # Keep the thinking animation until reasoning is over and real text shows
+                thinking_placeholder.empty()
+                first_visible = False
+            elif now - last_update < STREAM_UPDATE_INTERVAL and tokens_since_update < STREAM_UPDATE_TOKENS:
+                continue
+            elif len(visible_text) < painted_length * (1 + STREAM_MIN_GROWTH):
+                # Each repaint resends the whole text, so grow geometrically to keep bytes linear
+                continue
+            placeholder.markdown(f'<div class="response-content">{visible_text.lstrip()}</div>', unsafe_allow_html=True)
+            last_update = now
+            tokens_since_update = 0
+            painted_length = len(visible_text)
         
-        for i, char in enumerate(clean_final):
-            displayed_text += char
-            placeholder.markdown(f'<div class="response-content">{displayed_text}</div>', unsafe_allow_html=True)
-            time.sleep(0.01)
+        remaining = stripper.flush()
+        visible_text += remaining
+        if speech is not None:
+            speech.feed(remaining)
+            speech.flush()
+        thinking_placeholder.empty()
+        end_time = time.perf_counter()
         
         # Final display
+        clean_final = collapse_blank_lines(visible_text)
         placeholder.markdown(f'<div class="response-content complete">{clean_final}</div>', unsafe_allow_html=True)
-        return clean_final
+        
+        # Record stream timings so the gain is visible per response
+        if first_token_time is not None:
+            generated_tokens = usage_tokens or token_count
+            generation_time = end_time - first_token_time
+            stats = {
+                'time_to_first_token': first_token_time - request_start,
+                'tokens': generated_tokens,
+                'tokens_per_second': generated_tokens / generation_time if generation_time > 0 else 0.0,
+                'total_time': end_time - request_start,
+                'model': response_model
+            }
+            st.session_state.last_response_stats = stats
+            if turn is not None:
+                if queue_time is not None:
+                    turn.record("groq_queue", queue_time)
+                turn.record("first_token", stats['time_to_first_token'])
+                turn.record("generation", generation_time)
+            st.caption(f"⚡ {stats['time_to_first_token']:.2f}s to first token · {stats['tokens_per_second']:.1f} tokens/s")
+        return clean_final, stripper.reasoning_text()
+    except Overloaded:
+        # Turned away by the rate limiter: the caller reports it the same way for streamed and whole replies
+        raise
     except Exception as e:
         st.error(f"Streaming error: {str(e)}")
-        return None
+        return None, ""